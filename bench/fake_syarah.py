@@ -0,0 +1,250 @@
+"""
+Local stand-in for syarah.com, for load tests (bench/loadtest.py) - never point the crawler at production to measure it.
+
+    python -m bench.fake_syarah --port 8765 --posts 10000 --latency-ms 80 --error-rate 0.01 --rate-429 0.005
+
+Serves:
+- /filters?...&n=N     infinite-scroll listing with the real markup (UnbxdTitleArea h1 total, UnbxdCards container,
+                       modern-card_post-<id> cards); N (or --posts) cards, --page-size more per scroll near the bottom
+- /api/syarah_v1/<lang>/post/view-online?id=..&include=..
+                       synthetic view-online JSON (bench.synth shapes); inspection when "inspection" is included,
+                       merged with details when both are; ETag + 304 on If-None-Match
+Faults per API call: --error-rate (503), --rate-401, --rate-429 (with Retry-After), plus latency and jitter.
+Card ids are --first-id + i, so reruns see the same posts.
+"""
+from __future__ import annotations
+
+import argparse
+import hashlib
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, Optional, Tuple
+from urllib.parse import parse_qs, urlsplit
+
+from bench.synth import make_post
+
+LISTING_HTML = """<!doctype html>
+<html><head><meta charset="utf-8"><title>Used cars</title>
+<style>
+  .UnbxdCards-module__allCarsResult {{ display: grid; grid-template-columns: repeat(3, 1fr); gap: 12px; }}
+  div[id^="modern-card_post-"] {{ height: 320px; border: 1px solid #ddd; }}
+</style></head>
+<body>
+<div class="UnbxdTitleArea-module__h1Area"><h1>سيارات مستعملة <span>{total}</span> <span>سيارة</span></h1></div>
+<div class="UnbxdCards-module__allCarsResult"></div>
+<script>
+(() => {{
+  const TOTAL = {total}, PAGE = {page_size}, DELAY = {page_latency_ms}, FIRST = {first_id};
+  const box = document.querySelector(".UnbxdCards-module__allCarsResult");
+  let shown = 0, loading = false;
+  function more() {{
+    if (loading || shown >= TOTAL) return;
+    loading = true;
+    setTimeout(() => {{
+      const frag = document.createDocumentFragment();
+      const end = Math.min(TOTAL, shown + PAGE);
+      for (let i = shown; i < end; i++) {{
+        const id = FIRST + i;
+        const card = document.createElement("div");
+        card.id = "modern-card_post-" + id;
+        card.innerHTML = '<a href="/cardetail/used-' + id + '"><h2>Toyota Camry #' + id + '</h2></a>';
+        frag.appendChild(card);
+      }}
+      box.appendChild(frag);
+      shown = end;
+      loading = false;
+      if (document.body.scrollHeight <= window.innerHeight) more();
+    }}, DELAY);
+  }}
+  window.addEventListener("scroll", () => {{
+    if (window.innerHeight + window.scrollY >= document.body.scrollHeight - 1500) more();
+  }});
+  more();
+}})();
+</script>
+</body></html>
+"""
+
+
+class FakeSyarah:
+    """Config + counters shared by the handler threads."""
+
+    def __init__(
+        self,
+        posts: int = 1000,
+        first_id: int = 100000,
+        page_size: int = 24,
+        page_latency_ms: float = 150.0,
+        latency_ms: float = 80.0,
+        jitter_ms: float = 40.0,
+        error_rate: float = 0.0,
+        rate_401: float = 0.0,
+        rate_429: float = 0.0,
+        retry_after: float = 1.0,
+        seed: int = 0,
+    ) -> None:
+        self.posts = posts
+        self.first_id = first_id
+        self.page_size = page_size
+        self.page_latency_ms = page_latency_ms
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate
+        self.rate_401 = rate_401
+        self.rate_429 = rate_429
+        self.retry_after = retry_after
+        self.seed = seed
+
+        self._lock = threading.Lock()
+        self._rnd = random.Random(seed)
+        self.counts: Dict[str, int] = {}
+
+    def count(self, key: str) -> None:
+        with self._lock:
+            self.counts[key] = self.counts.get(key, 0) + 1
+
+    def roll(self) -> float:
+        with self._lock:
+            return self._rnd.random()
+
+    def delay(self) -> None:
+        ms = self.latency_ms + (self.roll() * self.jitter_ms if self.jitter_ms > 0 else 0.0)
+        if ms > 0:
+            time.sleep(ms / 1000.0)
+
+    def fault(self) -> Optional[int]:
+        """Injected status for this API call, or None."""
+        x = self.roll()
+        for status, rate in ((401, self.rate_401), (429, self.rate_429), (503, self.error_rate)):
+            if x < rate:
+                return status
+            x -= rate
+        return None
+
+    def view_online(self, post_id: int, includes: set) -> Tuple[int, Dict[str, Any]]:
+        if not (self.first_id <= post_id < self.first_id + self.posts):
+            return 404, {"message": "post not found"}
+        ins, det = make_post(post_id, self.seed)
+        data: Dict[str, Any] = {}
+        if "inspection" in includes:
+            data.update(ins["data"])
+        if includes - {"inspection"}:
+            data.update({k: v for k, v in det["data"].items() if k in includes or k == "details"})
+        return 200, {"data": data}
+
+
+def _handler(fake: FakeSyarah):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, *args: Any) -> None:
+            pass
+
+        def _send(self, status: int, body: bytes, ctype: str, headers: Optional[Dict[str, str]] = None) -> None:
+            self.send_response(status)
+            self.send_header("content-type", ctype)
+            self.send_header("content-length", str(len(body)))
+            for k, v in (headers or {}).items():
+                self.send_header(k, v)
+            self.end_headers()
+            if body:
+                self.wfile.write(body)
+
+        def _json(self, status: int, obj: Any, headers: Optional[Dict[str, str]] = None) -> None:
+            self._send(status, json.dumps(obj).encode(), "application/json; charset=utf-8", headers)
+
+        def do_GET(self) -> None:
+            parts = urlsplit(self.path)
+            q = parse_qs(parts.query)
+            if parts.path.startswith("/filters"):
+                fake.count("listing")
+                total = int((q.get("n") or [fake.posts])[0])
+                html = LISTING_HTML.format(
+                    total=min(total, fake.posts), page_size=fake.page_size,
+                    page_latency_ms=int(fake.page_latency_ms), first_id=fake.first_id,
+                )
+                self._send(200, html.encode(), "text/html; charset=utf-8")
+                return
+
+            if parts.path.endswith("/post/view-online"):
+                fake.delay()
+                status = fake.fault()
+                if status is not None:
+                    fake.count(f"api_{status}")
+                    headers = {"retry-after": f"{fake.retry_after:g}"} if status == 429 else None
+                    self._json(status, {"message": "injected"}, headers)
+                    return
+
+                try:
+                    post_id = int((q.get("id") or ["0"])[0])
+                except ValueError:
+                    post_id = 0
+                includes = set(",".join(q.get("include") or []).split(","))
+                status, obj = fake.view_online(post_id, includes)
+                body = json.dumps(obj).encode()
+                etag = '"' + hashlib.md5(body).hexdigest() + '"'
+                if status == 200 and self.headers.get("if-none-match") == etag:
+                    fake.count("api_304")
+                    self._send(304, b"", "application/json", {"etag": etag})
+                    return
+                fake.count(f"api_{status}")
+                self._send(status, body, "application/json; charset=utf-8", {"etag": etag})
+                return
+
+            if "/cardetail/" in parts.path:
+                fake.count("cardetail")
+                self._send(200, b"<!doctype html><html><body>car</body></html>", "text/html; charset=utf-8")
+                return
+
+            self._json(404, {"message": "not found"})
+
+    return Handler
+
+
+def serve(fake: FakeSyarah, host: str = "127.0.0.1", port: int = 0) -> ThreadingHTTPServer:
+    """Start the server in a daemon thread; the bound port is srv.server_address[1]."""
+    srv = ThreadingHTTPServer((host, port), _handler(fake))
+    srv.daemon_threads = True
+    threading.Thread(target=srv.serve_forever, name="fake-syarah", daemon=True).start()
+    return srv
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description="Local stand-in Syarah server for load tests")
+    ap.add_argument("--host", default="127.0.0.1")
+    ap.add_argument("--port", type=int, default=8765)
+    ap.add_argument("--posts", type=int, default=50000, help="cards in the listing (max; ?n= on /filters lowers it)")
+    ap.add_argument("--first-id", type=int, default=100000)
+    ap.add_argument("--page-size", type=int, default=24, help="cards added per infinite-scroll load")
+    ap.add_argument("--page-latency-ms", type=float, default=150.0, help="delay before each scroll load")
+    ap.add_argument("--latency-ms", type=float, default=80.0, help="API latency")
+    ap.add_argument("--jitter-ms", type=float, default=40.0, help="extra random API latency (uniform)")
+    ap.add_argument("--error-rate", type=float, default=0.0, help="share of API calls answered 503")
+    ap.add_argument("--rate-401", type=float, default=0.0, help="share of API calls answered 401")
+    ap.add_argument("--rate-429", type=float, default=0.0, help="share of API calls answered 429")
+    ap.add_argument("--retry-after", type=float, default=1.0, help="Retry-After seconds on injected 429s")
+    ap.add_argument("--seed", type=int, default=0)
+    args = ap.parse_args()
+
+    fake = FakeSyarah(
+        posts=args.posts, first_id=args.first_id, page_size=args.page_size, page_latency_ms=args.page_latency_ms,
+        latency_ms=args.latency_ms, jitter_ms=args.jitter_ms, error_rate=args.error_rate, rate_401=args.rate_401,
+        rate_429=args.rate_429, retry_after=args.retry_after, seed=args.seed,
+    )
+    srv = serve(fake, args.host, args.port)
+    print(f"fake syarah on http://{args.host}:{srv.server_address[1]} (posts={args.posts})", flush=True)
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        srv.shutdown()
+        print(json.dumps(fake.counts, sort_keys=True), flush=True)
+
+
+if __name__ == "__main__":
+    main()
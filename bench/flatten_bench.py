@@ -0,0 +1,67 @@
+"""
+Per-post flatten cost: the old hand-written flatten_post vs the compiled extraction spec.
+
+    python -m bench.flatten_bench [--n 20000]
+
+Also checks that the default field set produces exactly what the old code produced.
+"""
+from __future__ import annotations
+
+import argparse
+import time
+from typing import Any, Callable, List, Sequence
+
+from bench.synth import make_post
+from bench.legacy_flatten import flatten_post as legacy_flatten_post
+from src.extract import compile_fields, flatten_post, select_fields
+
+
+def _per_post_us(fns: Sequence[Callable[[], Any]], n: int, rounds: int) -> List[float]:
+    """Best-of-rounds per-post time of each fn; the rounds alternate between the fns, so drift in machine
+    load hits all of them alike instead of skewing the ratio."""
+    for fn in fns:
+        for _ in range(min(200, n)):  # warm up
+            fn()
+    best = [float("inf")] * len(fns)
+    for _ in range(rounds):
+        for i, fn in enumerate(fns):
+            t0 = time.perf_counter()
+            for _ in range(n):
+                fn()
+            best[i] = min(best[i], time.perf_counter() - t0)
+    return [b / n * 1e6 for b in best]
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description=__doc__)
+    ap.add_argument("--n", type=int, default=20000, help="posts per timing round")
+    ap.add_argument("--rounds", type=int, default=7, help="timing rounds (best one counts)")
+    args = ap.parse_args()
+
+    ins, det = make_post()
+    default_spec = compile_fields(select_fields())
+    all_spec = compile_fields(select_fields(enable=["all"]))
+
+    old = legacy_flatten_post(ins, det)
+    new = flatten_post(ins, det, default_spec)
+    if old != new:
+        diff = sorted(k for k in set(old) | set(new) if old.get(k) != new.get(k))
+        raise SystemExit(f"default spec differs from the old flatten_post: {diff}")
+
+    before, after, everything = _per_post_us(
+        [
+            lambda: legacy_flatten_post(ins, det),
+            lambda: flatten_post(ins, det, default_spec),
+            lambda: flatten_post(ins, det, all_spec),
+        ],
+        args.n,
+        args.rounds,
+    )
+
+    print(f"default fields ({len(default_spec)}): before {before:.1f} us/post  after {after:.1f} us/post  "
+          f"({before / after:.2f}x)")
+    print(f"all fields ({len(all_spec)}): {everything:.1f} us/post")
+
+
+if __name__ == "__main__":
+    main()
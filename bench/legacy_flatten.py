@@ -0,0 +1,300 @@
+"""
+Frozen copy of the hand-written flatten_post (before src/extract.py), kept only as the
+"before" side of bench/flatten_bench.py and as a parity reference for the default fields.
+Do not import from the crawler.
+"""
+from __future__ import annotations
+
+from typing import Any, Dict, List, Optional
+
+
+def _dig(obj: Any, path: str) -> Any:
+    """Navigate nested dict/list by dot-separated path."""
+    if obj is None:
+        return None
+    keys = path.split(".")
+    for key in keys:
+        if isinstance(obj, dict):
+            obj = obj.get(key)
+        elif isinstance(obj, list) and key.isdigit():
+            idx = int(key)
+            obj = obj[idx] if 0 <= idx < len(obj) else None
+        else:
+            return None
+        if obj is None:
+            return None
+    return obj
+
+
+def _first_str(*vals: Any) -> Optional[str]:
+    for v in vals:
+        if isinstance(v, str) and v.strip():
+            return v.strip()
+    return None
+
+
+def _first_num(*vals: Any) -> Optional[float]:
+    for v in vals:
+        if isinstance(v, (int, float)):
+            return v
+        if isinstance(v, str):
+            vv = "".join(ch for ch in v if ch.isdigit() or ch == ".")
+            if vv:
+                try:
+                    return float(vv) if "." in vv else int(vv)
+                except Exception:
+                    pass
+    return None
+
+
+def _slug_en(s: Optional[str]) -> str:
+    s = (s or "").strip().lower()
+    out = []
+    prev_us = False
+    for ch in s:
+        if ch.isalnum():
+            out.append(ch)
+            prev_us = False
+        else:
+            if not prev_us:
+                out.append("_")
+                prev_us = True
+    key = "".join(out).strip("_")
+    return key or "unknown"
+
+
+def flatten_inspection_kv(categories: Any) -> Dict[str, Dict[str, Any]]:
+    """
+    Input: car_report list (categories)
+    Output:
+      { "engine": { "الصوفة الامامية": "جيد", ... }, ... }
+    """
+    if not isinstance(categories, list):
+        return {}
+
+    out: Dict[str, Dict[str, Any]] = {}
+    used = set()
+
+    for cat in categories:
+        if not isinstance(cat, dict):
+            continue
+
+        key = _slug_en(cat.get("category_name_en"))
+        base = key
+        i = 2
+        while key in used:
+            key = f"{base}_{i}"
+            i += 1
+        used.add(key)
+
+        subs = cat.get("sub") or []
+        if not isinstance(subs, list):
+            subs = []
+
+        kv: Dict[str, Any] = {}
+        for s in subs:
+            if not isinstance(s, dict):
+                continue
+            name = (s.get("name") or "").strip()
+            if not name:
+                continue
+            kv[name] = s.get("rate")  # store rate text only
+        out[key] = kv
+
+    return out
+
+
+def flatten_post(inspection_json: dict, details_json: dict) -> dict:
+    """
+    Flatten the Syarah API responses into a searchable structure.
+    """
+    ins_data = _dig(inspection_json, "data.inspection") or {}
+    det_data = _dig(details_json, "data") or {}
+
+    flat: Dict[str, Any] = {}
+
+    # ========== BASIC IDENTITY ==========
+    flat["post_id"] = _first_num(
+        _dig(det_data, "details.id"),
+        # _dig(details_json, "id"),
+        # _dig(inspection_json, "id"),
+    )
+
+    flat["title"] = _first_str(
+        _dig(det_data, "details.title"),
+        _dig(det_data, "meta.title"),
+    )
+
+    # ========== VEHICLE SPECS ==========
+    details_card = _dig(det_data, "details.details_card") or {}
+
+    flat["brand"] = _first_str(_dig(details_card, "make.name"), _dig(details_card, "make.altName"))
+    flat["model"] = _first_str(_dig(details_card, "model.name"), _dig(details_card, "model.altName"))
+    flat["trim"] = _first_str(_dig(details_card, "extension.name"), _dig(details_card, "extension.altName"))
+
+    flat["year"] = _first_num(_dig(details_card, "years.id"), _dig(details_card, "years.name"))
+    flat["mileage_km"] = _first_num(_dig(details_card, "milage.id"), _dig(details_card, "milage.name"))
+
+    # ========== LOCATION & ORIGIN ==========
+    flat["city"] = _first_str(_dig(det_data, "g4Data.post_city"))
+    flat["origin"] = _first_str(_dig(details_card, "car_origin.name"))
+
+    # ========== MECHANICAL ==========
+    flat["fuel_type"] = _first_str(_dig(details_card, "fuel_types.name"), _dig(det_data, "fuel.fuel_type"))
+    flat["transmission"] = _first_str(_dig(details_card, "transmission_type.name"))
+    flat["engine_size"] = _first_str(_dig(details_card, "engine_size.name"))
+
+    flat["cylinders"] = _first_num(_dig(details_card, "cylinders.id"), _dig(details_card, "cylinders.name"))
+    flat["horse_power"] = _first_num(_dig(details_card, "horse_power.id"), _dig(details_card, "horse_power.name"))
+    flat["drivetrain"] = _first_str(_dig(details_card, "drivetrain_type.name"))
+    flat["engine_type"] = _first_str(_dig(details_card, "engine_type.name"))
+
+    flat["fuel_tank_liters"] = _first_num(_dig(details_card, "fuel_tank.id"), _dig(details_card, "fuel_tank.name"))
+    flat["fuel_economy_kml"] = _first_num(_dig(det_data, "fuel.fuel_economy"))
+
+    # ========== PHYSICAL ==========
+    # flat["exterior_color"] = _first_str(_dig(details_card, "exterior_color.name"))
+    # flat["exterior_color_code"] = _first_str(_dig(details_card, "exterior_color.code"))
+    # flat["interior_color"] = _first_str(_dig(details_card, "interior_color.name"))
+    # flat["interior_color_code"] = _first_str(_dig(details_card, "interior_color.code"))
+
+    # flat["doors"] = _first_num(_dig(details_card, "doors.id"), _dig(details_card, "doors.name"))
+    flat["seats"] = _first_num(_dig(details_card, "seats.id"), _dig(details_card, "seats.name"))
+    # flat["number_of_keys"] = _first_num(_dig(details_card, "number_of_keys.id"), _dig(details_card, "number_of_keys.name"))
+
+    # ========== CONDITION ==========
+    # flat["condition"] = _first_str(_dig(details_card, "is_new.name"), _dig(details_card, "is_new.altName"))
+    # flat["is_preowned"] = _dig(det_data, "details.is_preowned")
+    # flat["is_test"] = _dig(det_data, "details.is_test")
+
+    # ========== PRICING ==========
+    price_data = _dig(det_data, "price") or {}
+    flat["price_cash"] = _first_num(_dig(price_data, "vat_price.text"), _dig(det_data, "analytics.price"))
+    flat["price_monthly"] = _first_num(_dig(price_data, "finance_price.text"))
+    # flat["currency"] = _first_str(_dig(price_data, "currency"))
+
+    # flat["first_payment"] = _first_num(_dig(price_data, "finance_price.first_payment"))
+    # flat["last_payment"] = _first_num(_dig(price_data, "finance_price.last_payment"))
+    # flat["installment_period"] = _first_num(_dig(price_data, "finance_price.installment_period"))
+
+    # ========== INSPECTION (FLAT + KV) ==========
+    # flat["inspection_date"] = _first_str(_dig(ins_data, "report_date"))
+    flat["chassis_number"] = _first_str(_dig(ins_data, "chassis_number"))
+    flat["plate_number"] = _first_str(_dig(ins_data, "plate_number"))
+
+    car_report = _dig(ins_data, "car_report") or []
+    # flat["inspection_categories_count"] = len(car_report) if isinstance(car_report, list) else 0
+
+    total_points = 0
+    if isinstance(car_report, list):
+        for category in car_report:
+            if isinstance(category, dict):
+                sub = category.get("sub", [])
+                total_points += len(sub) if isinstance(sub, list) else 0
+    # flat["inspection_points_total"] = total_points
+
+    # ✅ the format you asked for
+    # flat["inspection_kv"] = flatten_inspection_kv(car_report)
+
+    # ========== BODY DAMAGE ==========
+    external_body = _dig(ins_data, "external_body") or {}
+    body_sub = _dig(external_body, "sub") or []
+    # flat["body_issues_count"] = _first_num(_dig(external_body, "category_countertext")) or 0
+
+    flat["body_is_clear"] = False
+    if isinstance(body_sub, list) and body_sub:
+        first_item = body_sub[0]
+        if isinstance(first_item, dict):
+            flat["body_is_clear"] = first_item.get("body_is_clear") == 1
+
+    body_report = _dig(ins_data, "body_report") or []
+    body_damages: List[str] = []
+    if isinstance(body_report, list):
+        for item in body_report:
+            if isinstance(item, dict) and item.get("image_info"):
+                img_info = item["image_info"]
+                if isinstance(img_info, dict):
+                    note = img_info.get("note", "")
+                    if isinstance(note, str) and note.strip():
+                        body_damages.append(note.strip())
+    # flat["body_damage_notes"] = body_damages
+
+    # ========== IMAGES ==========
+    gallery = _dig(det_data, "gallery.images") or []
+    images: List[Dict[str, Any]] = []
+    featured_url: Optional[str] = None
+    if isinstance(gallery, list):
+        for img in gallery:
+            if not isinstance(img, dict):
+                continue
+            url = img.get("img_url")
+            if isinstance(url, str) and url:
+                images.append(url)
+                if img.get("is_featured") == 1 and not featured_url:
+                    featured_url = url
+
+    seen = set()
+    uniq_urls: List[str] = []
+    for u in images:
+        if u in seen:
+            continue
+        seen.add(u)
+        uniq_urls.append(u)
+    flat["images"] = uniq_urls[:30]     # list[str]
+    # flat["images_count"] = len(uniq_urls)
+
+    flat["featured_image"] = featured_url or (uniq_urls[0] if uniq_urls else None)
+
+    # flat["has_360_spin"] = bool(_dig(det_data, "gallery.has_spin") or False)
+    # flat["has_video"] = bool(_dig(det_data, "gallery.has_video") or False)
+
+    # ========== FEATURES ==========
+    options = _dig(det_data, "options.options") or []
+    all_features: List[str] = []
+    features_by_category: Dict[str, List[str]] = {}
+
+    if isinstance(options, list):
+        for category in options:
+            if isinstance(category, dict):
+                cat_name = category.get("category")
+                cat_data = category.get("data", [])
+                if isinstance(cat_data, list):
+                    feature_names = [f.get("name") for f in cat_data if isinstance(f, dict) and f.get("name")]
+                else:
+                    feature_names = []
+                all_features.extend(feature_names)
+                if cat_name:
+                    features_by_category[str(cat_name)] = feature_names
+
+    # flat["features"] = all_features
+    # flat["features_count"] = len(all_features)
+    # flat["features_by_category"] = features_by_category
+
+    # ========== LISTING INFO ==========
+    flat["share_link"] = _first_str(_dig(det_data, "details.share_link"))
+    # flat["product_url"] = _first_str(_dig(det_data, "details.product_url"))
+
+    # flat["is_sold"] = _dig(det_data, "details.is_sold")
+    # flat["is_deleted"] = _dig(det_data, "details.is_deleted")
+    # flat["owned_by_us"] = _dig(det_data, "details.owned_by_us")
+
+    # flat["list_date"] = _first_str(_dig(det_data, "g4Data.list_date"))
+    # flat["lot_age_days"] = _first_num(_dig(det_data, "g4Data.lot_age"))
+
+    # ========== CAMPAIGN/OFFERS ==========
+    campaigns = _dig(det_data, "details.campaigns") or {}
+    # flat["has_cash_campaign"] = bool(_dig(campaigns, "cash"))
+    # flat["has_finance_campaign"] = bool(_dig(campaigns, "finance"))
+    cash_campaign = _dig(campaigns, "cash") or {}
+    # flat["campaign_text"] = _first_str(_dig(cash_campaign, "text"))
+
+    # ========== TAGS ==========
+    tags = _dig(det_data, "details.tags") or []
+    if isinstance(tags, list):
+        flat["tags"] = [t.get("tag_name") for t in tags if isinstance(t, dict) and t.get("tag_name")]
+    else:
+        flat["tags"] = []
+
+    return flat
+
+
@@ -0,0 +1,273 @@
+"""
+End-to-end load test: the real scrape_once (browser, scroll loop, pipeline, fetch engine, bulk writer)
+against the local stand-in server (bench/fake_syarah.py) and a local mongod. Nothing touches syarah.com.
+
+    python -m bench.loadtest                                    # N = 1k, 10k, 50k listings
+    python -m bench.loadtest --posts 1000 --latency-ms 50 --rate-429 0.01 --error-rate 0.01 --out load.json
+
+Each N runs in its own process (clean peak RSS) on a freshly dropped collection in --mongo-db.
+Reports posts/sec, p50/p99 per stage and the crawler's peak RSS (the browser's own memory is not included):
+  submit   discovery -> pipeline hand-off (time blocked by backpressure)
+  dedupe   one load_existing $in batch
+  http     one API GET (incl. retries/backoff)
+  fetch    one post (both calls + flatten)
+  write    one bulk_write batch
+  e2e      card handed to the pipeline -> doc written
+The .env is still loaded for everything not overridden here, but Mongo, TARGET_URL, the API base, the response
+cache / archive (off), the absence sweep (off) and the retry pass (off) always are.
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import functools
+import inspect
+import json
+import math
+import os
+import resource
+import socket
+import subprocess
+import sys
+import time
+from typing import Any, Dict, List
+
+STAGES = ("submit", "dedupe", "http", "fetch", "write", "e2e")
+
+# the child's result line (its log records are JSON too, and may be flushed after the result)
+RESULT_PREFIX = "LOADTEST_RESULT "
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def percentile(values: List[float], p: float) -> float:
+    """Nearest-rank percentile (0 for no samples)."""
+    if not values:
+        return 0.0
+    xs = sorted(values)
+    k = max(0, min(len(xs) - 1, math.ceil(p / 100.0 * len(xs)) - 1))
+    return xs[k]
+
+
+class StageTimer:
+    """Wraps pipeline functions in place to collect per-call latencies (seconds) per stage."""
+
+    def __init__(self) -> None:
+        self.samples: Dict[str, List[float]] = {s: [] for s in STAGES}
+        self.submitted_at: Dict[int, float] = {}
+
+    def wrap(self, owner: Any, name: str, stage: str) -> None:
+        fn = getattr(owner, name)
+        samples = self.samples[stage]
+
+        if inspect.iscoroutinefunction(fn):
+            @functools.wraps(fn)
+            async def timed_async(*a: Any, **k: Any) -> Any:
+                t0 = time.perf_counter()
+                try:
+                    return await fn(*a, **k)
+                finally:
+                    samples.append(time.perf_counter() - t0)
+            setattr(owner, name, timed_async)
+        else:
+            @functools.wraps(fn)
+            def timed(*a: Any, **k: Any) -> Any:
+                t0 = time.perf_counter()
+                try:
+                    return fn(*a, **k)
+                finally:
+                    samples.append(time.perf_counter() - t0)
+            setattr(owner, name, timed)
+
+    def install(self) -> None:
+        from src import pipeline
+        from src.fetcher import FetchEngine
+        from src.mongo import PostWriter
+
+        self.wrap(pipeline.CrawlPipeline, "submit", "submit")
+        self.wrap(pipeline, "load_existing", "dedupe")
+        self.wrap(FetchEngine, "_get", "http")
+        self.wrap(FetchEngine, "fetch", "fetch")
+        self.wrap(PostWriter, "write_batch", "write")
+
+        # end to end: submit(card) -> mark_written([ids])
+        submit, mark_written = pipeline.CrawlPipeline.submit, pipeline.CrawlPipeline.mark_written
+        stamps, e2e = self.submitted_at, self.samples["e2e"]
+
+        async def submit_stamped(pipe: Any, card: Dict[str, Any]) -> None:
+            stamps.setdefault(int(card["id"]), time.perf_counter())
+            await submit(pipe, card)
+
+        def mark_written_timed(pipe: Any, ids: List[int]) -> None:
+            now = time.perf_counter()
+            for pid in ids:
+                t0 = stamps.pop(int(pid), None)
+                if t0 is not None:
+                    e2e.append(now - t0)
+            mark_written(pipe, ids)
+
+        pipeline.CrawlPipeline.submit = submit_stamped
+        pipeline.CrawlPipeline.mark_written = mark_written_timed
+
+    def summary(self) -> Dict[str, Dict[str, float]]:
+        return {
+            stage: {
+                "n": len(xs),
+                "p50_ms": round(percentile(xs, 50) * 1000, 2),
+                "p99_ms": round(percentile(xs, 99) * 1000, 2),
+            }
+            for stage, xs in self.samples.items()
+        }
+
+
+def run_one(n: int, origin: str, args: argparse.Namespace) -> Dict[str, Any]:
+    """One scrape_once over an N-card listing (call in a fresh process: settings + peak RSS are per process)."""
+    coll = f"loadtest_{n}"
+    os.environ.update({
+        "TARGET_URL": f"{origin}/filters?condition_id=1&n={n}",
+        "SYARAH_API_BASE": origin,
+        "MONGO_URL": args.mongo_url,
+        "MONGO_DB": args.mongo_db,
+        "MONGO_COLLECTION": coll,
+        "HEADLESS": "false" if args.headed else "true",
+        "PARTITIONS": "",
+        "JOB_QUEUE": "off",
+        "TAB_MODE": args.tab_mode,
+        "SCROLL_PAUSE_SEC": str(args.scroll_pause_sec),
+        # whatever the local .env says: no response cache / archive, no absence sweep, no retry pass
+        "HTTP_CACHE_DIR": "",
+        "ARCHIVE_DIR": "",
+        "ABSENT_AFTER_RUNS": "0",
+        "RETRY_PASS": "false",
+        "LOG_FORMAT": "text",
+    })
+
+    import nodriver as uc
+    from pymongo import MongoClient
+
+    from src.config import get_settings
+    from src.main import scrape_once
+    from src.mongo import get_collection
+
+    db = MongoClient(args.mongo_url)[args.mongo_db]
+    for name in (coll, f"{coll}_crawl_state", f"{coll}_jobs"):
+        db.drop_collection(name)
+
+    timer = StageTimer()
+    timer.install()
+    settings = get_settings()
+
+    async def go() -> float:
+        browser = await uc.start(headless=settings.headless)
+        col = get_collection(settings.mongo_url, settings.mongo_db, settings.mongo_collection)
+        try:
+            t0 = time.perf_counter()
+            await scrape_once(browser, settings, col)
+            return time.perf_counter() - t0
+        finally:
+            col.database.client.close()
+            browser.stop()
+
+    elapsed = asyncio.run(go())
+    written = db[coll].count_documents({})
+    return {
+        "listings": n,
+        "written": written,
+        "elapsed_sec": round(elapsed, 2),
+        "posts_per_sec": round(written / elapsed, 1) if elapsed > 0 else 0.0,
+        "peak_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0, 1),
+        "stages": timer.summary(),
+    }
+
+
+def _print_result(r: Dict[str, Any]) -> None:
+    print(
+        f"\nN={r['listings']}: {r['written']} written in {r['elapsed_sec']}s -> {r['posts_per_sec']} posts/sec, "
+        f"peak RSS {r['peak_rss_mb']} MB"
+    )
+    print(f"  {'stage':8} {'n':>8} {'p50 ms':>10} {'p99 ms':>10}")
+    for stage in STAGES:
+        s = r["stages"].get(stage) or {}
+        print(f"  {stage:8} {s.get('n', 0):>8} {s.get('p50_ms', 0.0):>10.2f} {s.get('p99_ms', 0.0):>10.2f}")
+
+
+def _server_cmd(args: argparse.Namespace, port: int) -> List[str]:
+    return [
+        sys.executable, "-m", "bench.fake_syarah", "--port", str(port), "--posts", str(max(args.posts)),
+        "--latency-ms", str(args.latency_ms), "--jitter-ms", str(args.jitter_ms),
+        "--page-latency-ms", str(args.page_latency_ms), "--error-rate", str(args.error_rate),
+        "--rate-401", str(args.rate_401), "--rate-429", str(args.rate_429), "--retry-after", str(args.retry_after),
+    ]
+
+
+def _wait_for(origin: str, timeout: float = 15.0) -> None:
+    import requests
+
+    end = time.time() + timeout
+    while True:
+        try:
+            requests.get(f"{origin}/filters?n=1", timeout=2)
+            return
+        except Exception:
+            if time.time() > end:
+                raise
+            time.sleep(0.2)
+
+
+def main() -> int:
+    ap = argparse.ArgumentParser(description="End-to-end crawler load test against a local stand-in server")
+    ap.add_argument("--posts", type=int, nargs="+", default=[1000, 10000, 50000], help="listing sizes N")
+    ap.add_argument("--mongo-url", default="mongodb://127.0.0.1:27017")
+    ap.add_argument("--mongo-db", default="syarah_loadtest")
+    ap.add_argument("--latency-ms", type=float, default=80.0)
+    ap.add_argument("--jitter-ms", type=float, default=40.0)
+    ap.add_argument("--page-latency-ms", type=float, default=150.0)
+    ap.add_argument("--error-rate", type=float, default=0.0)
+    ap.add_argument("--rate-401", type=float, default=0.0)
+    ap.add_argument("--rate-429", type=float, default=0.0)
+    ap.add_argument("--retry-after", type=float, default=1.0)
+    ap.add_argument("--scroll-pause-sec", type=float, default=0.3)
+    ap.add_argument("--tab-mode", default="off", help="TAB_MODE for the run (off | pool | per_post)")
+    ap.add_argument("--headed", action="store_true", help="show the browser")
+    ap.add_argument("--out", default="", help="also write the results as JSON here")
+    ap.add_argument("--origin", default="", help=argparse.SUPPRESS)  # child mode: server already running
+    args = ap.parse_args()
+
+    if args.origin:
+        print(RESULT_PREFIX + json.dumps(run_one(args.posts[0], args.origin, args)), flush=True)
+        return 0
+
+    port = _free_port()
+    origin = f"http://127.0.0.1:{port}"
+    server = subprocess.Popen(_server_cmd(args, port), stdout=subprocess.DEVNULL)
+    results: List[Dict[str, Any]] = []
+    try:
+        _wait_for(origin)
+        for n in args.posts:
+            cmd = [sys.executable, "-m", "bench.loadtest", *sys.argv[1:], "--origin", origin, "--posts", str(n)]
+            # the crawler logs go to stdout as usual; the result is the line with RESULT_PREFIX
+            proc = subprocess.run(cmd, stdout=subprocess.PIPE, text=True)
+            lines = [x[len(RESULT_PREFIX):] for x in proc.stdout.splitlines() if x.startswith(RESULT_PREFIX)]
+            if proc.returncode != 0 or not lines:
+                print(proc.stdout[-4000:])
+                print(f"N={n}: run failed (exit {proc.returncode})")
+                return 1
+            r = json.loads(lines[-1])
+            results.append(r)
+            _print_result(r)
+    finally:
+        server.terminate()
+        server.wait(timeout=10)
+
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as fh:
+            json.dump({"args": {k: v for k, v in vars(args).items() if k != "origin"}, "runs": results}, fh, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
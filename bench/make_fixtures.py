@@ -0,0 +1,41 @@
+"""
+(Re)generate the benchmark fixtures in bench/fixtures/ from bench.synth (synthetic, not recorded responses).
+
+    python -m bench.make_fixtures
+
+Fixtures are committed; only rerun this when the API shape changes (and then re-save the baseline).
+"""
+from __future__ import annotations
+
+import json
+import os
+
+from bench.synth import make_card_tree, make_minimal_details, make_post
+
+FIXTURES_DIR = os.path.join(os.path.dirname(__file__), "fixtures")
+
+
+def main() -> None:
+    os.makedirs(FIXTURES_DIR, exist_ok=True)
+
+    typical_ins, typical_det = make_post()
+    _, large_det = make_post(post_id=777777, images=120, option_categories=25)
+    many_ins, _ = make_post(post_id=888888, report_categories=40, points_per_category=30, body_notes=40)
+
+    fixtures = {
+        "details_small.json": make_minimal_details(),
+        "details_large.json": large_det,
+        "details_typical.json": typical_det,
+        "inspection_typical.json": typical_ins,
+        "inspection_many_categories.json": many_ins,
+        "remote_cards_1000.json": make_card_tree(1000),
+    }
+    for name, obj in fixtures.items():
+        path = os.path.join(FIXTURES_DIR, name)
+        with open(path, "w", encoding="utf-8") as fh:
+            json.dump(obj, fh, ensure_ascii=False, separators=(",", ":"))
+        print(f"{path}: {os.path.getsize(path) / 1024:.1f} KiB")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,164 @@
+"""
+Offline microbenchmarks for the hot pure-Python paths (no browser, no network, no Mongo).
+
+    python -m bench.run                  # compare with bench/baseline.json, exit 1 on a regression
+    python -m bench.run --save           # record a new baseline (commit it with the perf change)
+    python -m bench.run -k flatten       # only cases whose name contains "flatten"
+
+Per case: ops/sec (best of several timeit rounds) and peak bytes allocated during one call
+(tracemalloc). A case regresses when it is slower or allocates more than the baseline by more
+than --threshold.
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import platform
+import sys
+import timeit
+import tracemalloc
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, List, Tuple
+
+from bench.make_fixtures import FIXTURES_DIR
+from src.extract import compile_fields, flatten_inspection_kv, flatten_post, select_fields
+from src.mongo import _is_bad_doc
+from src.syarah import _parse_card_pairs, unwrap_remote
+
+BASELINE = os.path.join(os.path.dirname(__file__), "baseline.json")
+
+
+def _load(name: str) -> Any:
+    with open(os.path.join(FIXTURES_DIR, name), encoding="utf-8") as fh:
+        return json.load(fh)
+
+
+def _state_docs() -> List[dict]:
+    """What load_existing() returns: a mix of good, failed, incomplete and stale docs."""
+    good = {
+        "id": 1, "fetchedAt": datetime.now(timezone.utc).isoformat(), "details_status": 200,
+        "inspection_status": 200, "post_id": 1, "title": "t", "brand": "b", "model": "m", "year": 2020,
+    }
+    return [
+        good,
+        {**good, "inspection_status": 404},
+        {**good, "details_status": 0},
+        {**good, "title": "  "},
+        {**good, "fetchedAt": "2020-01-01T00:00:00+00:00"},
+        {"id": 2, "api": {"details": {}}},
+    ]
+
+
+def cases() -> List[Tuple[str, Callable[[], Any]]]:
+    small = _load("details_small.json")
+    typical_det = _load("details_typical.json")
+    typical_ins = _load("inspection_typical.json")
+    large_det = _load("details_large.json")
+    many_ins = _load("inspection_many_categories.json")
+    cards = _load("remote_cards_1000.json")
+    report = many_ins["data"]["inspection"]["car_report"]
+    docs = _state_docs()
+
+    # explicit specs, so FLAT_FIELDS_* in the environment can't change what is measured
+    default_spec = compile_fields(select_fields())
+    all_spec = compile_fields(select_fields(enable=["all"]))
+
+    def bad_docs() -> int:
+        return sum(_is_bad_doc(d, 168.0) for d in docs)
+
+    return [
+        ("flatten_post/small", lambda: flatten_post({}, small, default_spec)),
+        ("flatten_post/typical", lambda: flatten_post(typical_ins, typical_det, default_spec)),
+        ("flatten_post/large", lambda: flatten_post(many_ins, large_det, default_spec)),
+        ("flatten_post/large_all_fields", lambda: flatten_post(many_ins, large_det, all_spec)),
+        ("flatten_inspection_kv/40x30", lambda: flatten_inspection_kv(report)),
+        ("unwrap_remote/cards_1000", lambda: unwrap_remote(cards)),
+        ("cards/unwrap+parse_1000", lambda: _parse_card_pairs(unwrap_remote(cards))),
+        ("is_bad_doc/6_docs", bad_docs),
+    ]
+
+
+def measure(fn: Callable[[], Any], repeat: int) -> Dict[str, float]:
+    timer = timeit.Timer(fn)
+    number, _ = timer.autorange()
+    best = min(timer.repeat(repeat=repeat, number=number)) / number
+
+    fn()  # warm caches before tracing
+    tracemalloc.start()
+    try:
+        before = tracemalloc.get_traced_memory()[0]
+        tracemalloc.reset_peak()
+        fn()
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+    return {"ops_per_sec": 1.0 / best, "peak_bytes": float(max(0, peak - before))}
+
+
+def main() -> int:
+    ap = argparse.ArgumentParser(description="Syarah crawler microbenchmarks")
+    ap.add_argument("--save", action="store_true", help="write the results as the new baseline")
+    ap.add_argument("--baseline", default=BASELINE)
+    ap.add_argument("--threshold", type=float, default=0.25, help="allowed slowdown / extra allocation (0.25 = 25%%)")
+    ap.add_argument("--repeat", type=int, default=5, help="timeit rounds per case (best one counts)")
+    ap.add_argument("-k", dest="filter", default="", help="only cases whose name contains this")
+    args = ap.parse_args()
+
+    baseline: Dict[str, Dict[str, float]] = {}
+    if not args.save and os.path.exists(args.baseline):
+        with open(args.baseline, encoding="utf-8") as fh:
+            baseline = json.load(fh).get("cases", {})
+
+    results: Dict[str, Dict[str, float]] = {}
+    regressions: List[str] = []
+
+    print(f"{'case':34} {'ops/sec':>12} {'vs base':>8} {'peak KiB':>9} {'vs base':>8}")
+    for name, fn in cases():
+        if args.filter and args.filter not in name:
+            continue
+        r = results[name] = measure(fn, args.repeat)
+        base = baseline.get(name)
+
+        speed = mem = ""
+        if base:
+            ratio = r["ops_per_sec"] / base["ops_per_sec"]
+            speed = f"{ratio:.2f}x"
+            if ratio < 1.0 - args.threshold:
+                regressions.append(f"{name}: {ratio:.2f}x the baseline ops/sec")
+            if base["peak_bytes"] > 0:
+                mratio = r["peak_bytes"] / base["peak_bytes"]
+                mem = f"{mratio:.2f}x"
+                if mratio > 1.0 + args.threshold:
+                    regressions.append(f"{name}: {mratio:.2f}x the baseline peak allocation")
+
+        print(f"{name:34} {r['ops_per_sec']:12,.0f} {speed:>8} {r['peak_bytes'] / 1024:9.1f} {mem:>8}")
+
+    if args.save:
+        doc = {
+            "python": platform.python_version(),
+            "machine": platform.machine(),
+            "savedAt": datetime.now(timezone.utc).isoformat(),
+            "cases": results,
+        }
+        with open(args.baseline, "w", encoding="utf-8") as fh:
+            json.dump(doc, fh, indent=2, sort_keys=True)
+            fh.write("\n")
+        print(f"baseline saved: {args.baseline}")
+        return 0
+
+    if not baseline:
+        print("no baseline yet: run with --save")
+        return 0
+    if regressions:
+        print("REGRESSIONS:")
+        for line in regressions:
+            print(f"  {line}")
+        return 1
+    print(f"ok (threshold {args.threshold:.0%})")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
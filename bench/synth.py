@@ -0,0 +1,167 @@
+"""
+Synthetic view-online responses shaped like the real API (same keys flatten_post reads),
+sized like a typical fully inspected listing by default. Deterministic for a given seed.
+bench/make_fixtures.py writes them (and a nodriver RemoteObject tree) to bench/fixtures/.
+"""
+from __future__ import annotations
+
+import random
+from typing import Any, Dict, List, Tuple
+
+
+def _named(i: int, name: str) -> Dict[str, Any]:
+    return {"id": i, "name": name, "altName": name.upper()}
+
+
+def make_post(
+    post_id: int = 123456,
+    seed: int = 0,
+    images: int = 40,
+    option_categories: int = 10,
+    report_categories: int = 12,
+    points_per_category: int = 20,
+    body_notes: int = 10,
+) -> Tuple[Dict[str, Any], Dict[str, Any]]:
+    """(inspection_json, details_json) for one post."""
+    rnd = random.Random(seed + post_id)
+
+    card = {
+        "make": _named(1, "Toyota"),
+        "model": _named(2, "Camry"),
+        "extension": _named(3, "GLE"),
+        "years": _named(2021, "2021"),
+        "milage": {"id": 85000 + rnd.randint(0, 9999), "name": "85,000 km"},
+        "car_origin": _named(4, "Saudi"),
+        "fuel_types": _named(5, "Petrol"),
+        "transmission_type": _named(6, "Automatic"),
+        "engine_size": _named(7, "2.5L"),
+        "cylinders": _named(4, "4"),
+        "horse_power": _named(203, "203 hp"),
+        "drivetrain_type": _named(8, "FWD"),
+        "engine_type": _named(9, "Inline"),
+        "fuel_tank": _named(60, "60 L"),
+        "exterior_color": {"name": "White", "code": "#ffffff"},
+        "interior_color": {"name": "Beige", "code": "#f5f5dc"},
+        "doors": _named(4, "4"),
+        "seats": _named(5, "5"),
+        "number_of_keys": _named(2, "2"),
+        "is_new": _named(0, "Used"),
+    }
+
+    details = {
+        "data": {
+            "details": {
+                "id": post_id,
+                "title": f"Toyota Camry GLE 2021 #{post_id}",
+                "details_card": card,
+                "share_link": f"https://syarah.com/cardetail/used-{post_id}",
+                "product_url": f"/ar/cardetail/used-{post_id}",
+                "is_preowned": 1,
+                "is_test": 0,
+                "is_sold": 0,
+                "is_deleted": 0,
+                "owned_by_us": 1,
+                "campaigns": {"cash": {"text": "Save 5,000 SAR"}, "finance": None},
+                "tags": [{"tag_name": f"tag-{i}"} for i in range(6)],
+            },
+            "meta": {"title": f"Toyota Camry {post_id}", "description": "x" * 400},
+            "g4Data": {"post_city": "Riyadh", "list_date": "2026-01-01", "lot_age": 12},
+            "fuel": {"fuel_type": "Petrol", "fuel_economy": "14.5"},
+            "price": {
+                "currency": "SAR",
+                "vat_price": {"text": "89,500 SAR"},
+                "finance_price": {
+                    "text": "1,450 SAR/month",
+                    "first_payment": 5000,
+                    "last_payment": 20000,
+                    "installment_period": 60,
+                },
+            },
+            "analytics": {"price": 89500},
+            "gallery": {
+                "has_spin": 1,
+                "has_video": 0,
+                "images": [
+                    {
+                        "img_url": f"https://cdn.syarah.com/{post_id}/{i % max(1, images - 4)}.jpg",
+                        "is_featured": int(i == 3),
+                    }
+                    for i in range(images)
+                ],
+            },
+            "options": {
+                "options": [
+                    {
+                        "category": f"cat-{c}",
+                        "data": [{"name": f"feature {c}-{f}", "icon": "x.svg"} for f in range(15)],
+                    }
+                    for c in range(option_categories)
+                ]
+            },
+            "faqs": [{"q": "q" * 80, "a": "a" * 300} for _ in range(8)],
+        }
+    }
+
+    inspection = {
+        "data": {
+            "inspection": {
+                "report_date": "2026-01-01",
+                "chassis_number": f"JT{post_id:015d}",
+                "plate_number": "ABC 1234",
+                "car_report": [
+                    {
+                        "category_name_en": f"Category {c}",
+                        "sub": [{"name": f"point {c}-{s}", "rate": rnd.choice(["جيد", "ممتاز", "ضعيف"])} for s in range(points_per_category)],
+                    }
+                    for c in range(report_categories)
+                ],
+                "external_body": {"category_countertext": "2 issues", "sub": [{"body_is_clear": 0}]},
+                "body_report": [
+                    {"image_info": {"note": f"scratch {i}", "url": "x.jpg"}} for i in range(body_notes)
+                ],
+            }
+        }
+    }
+    return inspection, details
+
+
+def make_minimal_details(post_id: int = 654321) -> Dict[str, Any]:
+    """A small details answer: only the basic card, no gallery/options/faqs."""
+    return {
+        "data": {
+            "details": {
+                "id": post_id,
+                "title": f"Hyundai Accent 2019 #{post_id}",
+                "details_card": {
+                    "make": _named(1, "Hyundai"),
+                    "model": _named(2, "Accent"),
+                    "years": _named(2019, "2019"),
+                    "milage": {"id": 120000, "name": "120,000 km"},
+                },
+                "share_link": f"https://syarah.com/cardetail/used-{post_id}",
+                "tags": [],
+            },
+            "price": {"vat_price": {"text": "35,000 SAR"}},
+        }
+    }
+
+
+def _remote(v: Any) -> Dict[str, Any]:
+    """Plain value -> nodriver deep-serialized RemoteObject value."""
+    if v is None:
+        return {"type": "null"}
+    if isinstance(v, bool):
+        return {"type": "boolean", "value": v}
+    if isinstance(v, (int, float)):
+        return {"type": "number", "value": v}
+    if isinstance(v, str):
+        return {"type": "string", "value": v}
+    if isinstance(v, list):
+        return {"type": "array", "value": [_remote(x) for x in v]}
+    return {"type": "object", "value": {k: _remote(x) for k, x in v.items()}}
+
+
+def make_card_tree(n: int = 1000, start: int = 100000) -> Dict[str, Any]:
+    """What page.evaluate(js_get_visible_cards()) returns for n cards: [[id, href], ...] as a RemoteObject tree."""
+    pairs: List[List[Any]] = [[start + i, f"/ar/cardetail/used-{start + i}"] for i in range(n)]
+    return _remote(pairs)
@@ -0,0 +1,169 @@
+from __future__ import annotations
+
+import json
+import os
+import sqlite3
+import struct
+import threading
+import zlib
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from .logging_utils import log
+
+# every record: 4-byte big-endian length + zlib(json)
+_FRAME = struct.Struct(">I")
+SEGMENT_PREFIX = "seg-"
+SEGMENT_SUFFIX = ".zz"
+
+
+def _raw(res: Dict[str, Any]) -> Dict[str, Any]:
+    """What we keep of one response: enough for build_post_payload."""
+    if res.get("merged"):
+        # inspection came inside the details answer (merged fetch profile): don't store it twice
+        return {"status": int(res.get("status") or 0), "merged": True}
+    return {
+        "status": int(res.get("status") or 0),
+        "json": res.get("json"),
+        "text": res.get("text"),
+    }
+
+
+class RawArchive:
+    """
+    Append-only archive of the raw view-online responses (inspection + details) per fetch.
+
+    <dir>/seg-000001.zz, seg-000002.zz, ...   framed zlib records, rolled at segment_max_mb
+    <dir>/index.sqlite3                       post id -> (segment, offset, length) of its latest record
+                                              (idx) and of its latest record with an inspection (idx_inspection)
+
+    One writer process per directory, and one instance per directory in that process: make_archive() hands
+    every engine (full crawl, delta crawl, sweep, retry pass) the same one, since offsets are only
+    consistent under its lock. close() closes it when the last user is done.
+    Readers (src.replay) only need the index + segment files.
+    """
+
+    def __init__(self, archive_dir: str, segment_max_mb: float = 256.0) -> None:
+        os.makedirs(archive_dir, exist_ok=True)
+        self.dir = archive_dir
+        self.segment_max_bytes = int(max(1.0, segment_max_mb) * 1024 * 1024)
+        self._lock = threading.Lock()
+        self._idx = open_index(archive_dir)
+
+        segs = list_segments(archive_dir)
+        self._seg_no = segs[-1][0] if segs else 1
+        self._fh = open(segment_path(archive_dir, self._seg_no), "ab")
+        self.appended = 0
+        self._users = 1
+
+    def append(
+        self, post_id: int, r1: Optional[Dict[str, Any]], r2: Dict[str, Any], fetched_at: Optional[str] = None
+    ) -> None:
+        """r1=None: details-only refresh (replay takes the inspection from the id's last record that has one)."""
+        rec = {
+            "id": int(post_id),
+            "fetchedAt": fetched_at or datetime.now(timezone.utc).isoformat(),
+            "inspection": _raw(r1) if r1 is not None else None,
+            "details": _raw(r2),
+        }
+        blob = zlib.compress(json.dumps(rec, ensure_ascii=False, separators=(",", ":")).encode("utf-8"), 6)
+
+        with self._lock:
+            if self._fh.tell() + len(blob) > self.segment_max_bytes and self._fh.tell() > 0:
+                self._fh.close()
+                self._seg_no += 1
+                self._fh = open(segment_path(self.dir, self._seg_no), "ab")
+
+            offset = self._fh.tell()
+            self._fh.write(_FRAME.pack(len(blob)))
+            self._fh.write(blob)
+            self._fh.flush()
+
+            # index only after the bytes are in the file
+            row = (int(post_id), self._seg_no, offset, len(blob), rec["fetchedAt"])
+            self._idx.execute("INSERT OR REPLACE INTO idx VALUES (?, ?, ?, ?, ?)", row)
+            if r1 is not None:
+                self._idx.execute("INSERT OR REPLACE INTO idx_inspection VALUES (?, ?, ?, ?, ?)", row)
+            self.appended += 1
+
+    def close(self) -> None:
+        with _open_lock:
+            self._users -= 1
+            if self._users > 0:
+                return
+            if _open.get(os.path.abspath(self.dir)) is self:
+                del _open[os.path.abspath(self.dir)]
+        with self._lock:
+            try:
+                self._fh.close()
+                self._idx.close()
+            except Exception as e:
+                log(f"[archive] close warning: {e}")
+
+
+# archive dir (absolute) -> the process's open archive for it
+_open: Dict[str, RawArchive] = {}
+_open_lock = threading.Lock()
+
+
+# -----------------------------
+# layout helpers (shared with src.replay)
+# -----------------------------
+def segment_path(archive_dir: str, seg_no: int) -> str:
+    return os.path.join(archive_dir, f"{SEGMENT_PREFIX}{seg_no:06d}{SEGMENT_SUFFIX}")
+
+
+def list_segments(archive_dir: str) -> List[Tuple[int, str]]:
+    out = []
+    for name in os.listdir(archive_dir):
+        if name.startswith(SEGMENT_PREFIX) and name.endswith(SEGMENT_SUFFIX):
+            try:
+                out.append((int(name[len(SEGMENT_PREFIX):-len(SEGMENT_SUFFIX)]), os.path.join(archive_dir, name)))
+            except ValueError:
+                continue
+    return sorted(out)
+
+
+def open_index(archive_dir: str) -> sqlite3.Connection:
+    db = sqlite3.connect(os.path.join(archive_dir, "index.sqlite3"), check_same_thread=False, isolation_level=None)
+    db.execute("PRAGMA journal_mode=WAL")
+    db.execute("PRAGMA synchronous=NORMAL")
+    for table in ("idx", "idx_inspection"):
+        db.execute(
+            f"CREATE TABLE IF NOT EXISTS {table} ("
+            " post_id INTEGER PRIMARY KEY, segment INTEGER, offset INTEGER, length INTEGER, fetched_at TEXT)"
+        )
+    return db
+
+
+def read_records(path: str, entries: List[Tuple[int, int]]) -> Iterator[Dict[str, Any]]:
+    """Records at (offset, length) positions of one segment, in file order."""
+    with open(path, "rb") as fh:
+        for offset, length in sorted(entries):
+            yield _read_at(fh, offset, length)
+
+
+def read_record(path: str, offset: int, length: int) -> Dict[str, Any]:
+    with open(path, "rb") as fh:
+        return _read_at(fh, offset, length)
+
+
+def _read_at(fh: Any, offset: int, length: int) -> Dict[str, Any]:
+    fh.seek(offset + _FRAME.size)
+    return json.loads(zlib.decompress(fh.read(length)).decode("utf-8"))
+
+
+def make_archive(settings: Any) -> Optional[RawArchive]:
+    """ARCHIVE_DIR unset = no archive."""
+    archive_dir = getattr(settings, "archive_dir", "") or ""
+    if not archive_dir:
+        return None
+    key = os.path.abspath(archive_dir)
+    with _open_lock:
+        arc = _open.get(key)
+        if arc is not None:
+            arc._users += 1
+            return arc
+        arc = _open[key] = RawArchive(archive_dir, getattr(settings, "archive_segment_mb", 256.0))
+    log(f"[archive] raw responses appended to {archive_dir}")
+    return arc
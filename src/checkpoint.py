@@ -0,0 +1,96 @@
+from __future__ import annotations
+
+import uuid
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, Optional, Set
+
+from pymongo.collection import Collection
+
+from .logging_utils import log
+
+
+def get_state_collection(col: Collection) -> Collection:
+    """Crawl frontier lives next to the posts: <collection>_crawl_state, one doc per listing URL."""
+    return col.database[f"{col.name}_crawl_state"]
+
+
+def new_run_id() -> str:
+    return datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%S") + "-" + uuid.uuid4().hex[:8]
+
+
+@dataclass
+class Checkpoint:
+    key: str                      # listing URL this frontier belongs to
+    run_id: str
+    done_ids: Set[int] = field(default_factory=set)  # ids fully handled (skipped or written)
+    scroll_y: int = 0
+    total: Optional[int] = None
+    counters: Dict[str, int] = field(default_factory=dict)
+    started_at: Optional[datetime] = None
+
+    def to_doc(self) -> dict:
+        return {
+            "_id": self.key,
+            "runId": self.run_id,
+            "doneIds": sorted(self.done_ids),
+            "scrollY": int(self.scroll_y or 0),
+            "total": self.total,
+            "counters": dict(self.counters),
+            "startedAt": self.started_at,
+            "updatedAt": datetime.now(timezone.utc),
+            "done": False,
+        }
+
+    @classmethod
+    def from_doc(cls, doc: dict) -> "Checkpoint":
+        return cls(
+            key=str(doc.get("_id")),
+            run_id=str(doc.get("runId") or new_run_id()),
+            done_ids={int(x) for x in (doc.get("doneIds") or [])},
+            scroll_y=int(doc.get("scrollY") or 0),
+            total=doc.get("total"),
+            counters={k: int(v) for k, v in (doc.get("counters") or {}).items()},
+            started_at=doc.get("startedAt"),
+        )
+
+
+def load_checkpoint(state_col: Collection, key: str, max_age_hours: float) -> Optional[Checkpoint]:
+    """
+    Unfinished frontier for `key` younger than max_age_hours, or None (start from the top).
+    """
+    try:
+        doc = state_col.find_one({"_id": key, "done": False})
+    except Exception as e:
+        log(f"[checkpoint] load warning: {e}")
+        return None
+    if not doc:
+        return None
+
+    updated = doc.get("updatedAt")
+    if isinstance(updated, datetime):
+        if updated.tzinfo is None:
+            updated = updated.replace(tzinfo=timezone.utc)
+        if datetime.now(timezone.utc) - updated > timedelta(hours=max_age_hours):
+            log(f"[checkpoint] ignoring stale checkpoint for {key} (updatedAt={updated.isoformat()})")
+            return None
+
+    return Checkpoint.from_doc(doc)
+
+
+def save_checkpoint(state_col: Collection, cp: Checkpoint) -> None:
+    try:
+        state_col.replace_one({"_id": cp.key}, cp.to_doc(), upsert=True)
+    except Exception as e:
+        log(f"[checkpoint] save warning: {e}")
+
+
+def finish_checkpoint(state_col: Collection, key: str, run_id: str) -> None:
+    """Run completed: the next run starts from the top again."""
+    try:
+        state_col.update_one(
+            {"_id": key, "runId": run_id},
+            {"$set": {"done": True, "finishedAt": datetime.now(timezone.utc)}, "$unset": {"doneIds": ""}},
+        )
+    except Exception as e:
+        log(f"[checkpoint] finish warning: {e}")
@@ -3,7 +3,7 @@ from __future__ import annotations
 import json
 import os
 from dataclasses import dataclass
-from typing import Optional
+from typing import List, Optional
 
 from dotenv import load_dotenv
 
@@ -28,6 +28,13 @@ def _get_int(name: str, default: int) -> int:
         return default
 
 
+def _get_list(name: str, sep: str = ";") -> List[str]:
+    v = _get(name)
+    if not v:
+        return []
+    return [x.strip() for x in v.split(sep) if x.strip()]
+
+
 def _get_float(name: str, default: float) -> float:
     v = _get(name)
     if not v:
@@ -43,14 +50,107 @@ class Settings:
     target_url: str
     headless: bool
 
+    # optional filter partitions of target_url (query fragments), crawled in parallel tabs
+    partitions: List[str]
+    partition_concurrency: int
+
     mongo_url: str
     mongo_db: str
     mongo_collection: str
 
     check_interval_hours: int
+    retry_after_error_min: float
+
+    # delta crawl every DELTA_INTERVAL_MIN (0 = off): newest-first listing, stop after K known ids in a row (K >= 1)
+    delta_interval_min: float
+    delta_sort: str
+    delta_stop_after_known: int
+
+    # listing absence: verify posts missing from the last N complete full crawls (0 = off)
+    absent_after_runs: int
+    absence_sweep_max: int
     scroll_pause_sec: float
 
+    # opt-in DOM pruning of harvested cards: off | images | hollow
+    prune_dom: str
+    prune_keep_screens: float
+
+    # optional product-page tabs "for realism": off | pool | per_post
+    tab_mode: str
+    tab_pool_size: int
+
+    # how many posts are fetched from the API at once
+    fetch_concurrency: int
+    # full | trimmed | merged (see fetcher.FETCH_PROFILES)
+    fetch_profile: str
+
+    # retries of 0/429/5xx GETs (jittered exponential backoff, Retry-After honoured)
+    http_max_retries: int
+    http_backoff_base_sec: float
+    http_backoff_max_sec: float
+    # answers slower than this shrink the adaptive per-host limit
+    http_slow_sec: float
+    # ids still failing go to <collection>_jobs; retry them in-process at the end of each run
+    retry_pass: bool
+
+    # on-disk response cache ("" = off); within the TTL a response is reused without a request
+    http_cache_dir: str
+    http_cache_ttl_inspection_hours: float
+    http_cache_ttl_details_hours: float
+
+    # raw response archive for offline re-flattening (src.replay); "" = off
+    archive_dir: str
+    archive_segment_mb: float
+
+    # off = fetch in this process; enqueue = discovery only, src.worker processes fetch
+    job_queue: str
+    job_lease_sec: float
+    job_max_attempts: int
+    worker_poll_sec: float
+
+    # bounded queues between discovery -> dedupe -> fetch (backpressure)
+    pipeline_queue_size: int
+
+    # buffered bulk writes to Mongo
+    write_batch_size: int
+    write_flush_sec: float
+    # last N price changes kept per post (priceHistory); 0 = no history
+    price_history_max: int
+
+    # crawl frontier checkpoint (0 = off)
+    checkpoint_every_sec: float
+    checkpoint_max_age_hours: float
+
+    # stored docs older than this (by fetchedAt) are refetched; 0 = never by age
+    fresh_max_age_hours: float
+    # refetches of known posts skip the inspection call unless it failed or is older than this; 0 = always fetch
+    inspection_refresh_hours: float
+
+    # flat fields on top of / removed from the default set (names from extract.FIELDS, "all")
+    flat_fields_enable: List[str]
+    flat_fields_disable: List[str]
+
+    # logging: json | text, level, per-tag rate of sampled DEBUG lines, "[summary]" interval (0 = off)
+    log_format: str
+    log_level: str
+    log_sample_per_sec: int
+    log_summary_sec: float
+
+    # Prometheus-text /metrics endpoint (0 = off)
+    metrics_port: int
+    metrics_host: str
+
+    # per-post spans as a Chrome trace file ("" = off); sampling profiler trigger (file or SIGUSR1)
+    trace_file: str
+    trace_sample: float
+    profile_trigger_file: str
+    profile_dir: str
+    profile_minutes: float
+    profile_interval_ms: float
+
     api_lang: str
+    # site origin for the API calls (a local stand-in server for load tests, see bench/loadtest.py)
+    api_base: str
 
     # API headers
     authorization: Optional[str]
@@ -68,14 +168,80 @@ def get_settings() -> Settings:
         target_url=_get("TARGET_URL", "https://syarah.com/filters?condition_id=1"),
         headless=(_get("HEADLESS", "false").lower() == "true"),
 
+        partitions=_get_list("PARTITIONS"),
+        partition_concurrency=max(1, _get_int("PARTITION_CONCURRENCY", 2)),
+
         mongo_url=_get("MONGO_URL", "") or "",
         mongo_db=_get("MONGO_DB", "ElectronDB") or "ElectronDB",
         mongo_collection=_get("MONGO_COLLECTION", "syarahUsed") or "syarahUsed",
 
         check_interval_hours=_get_int("CHECK_INTERVAL_HOURS", 48),
+        retry_after_error_min=_get_float("RETRY_AFTER_ERROR_MIN", 5.0),
+
+        delta_interval_min=max(0.0, _get_float("DELTA_INTERVAL_MIN", 0.0)),
+        delta_sort=_get("DELTA_SORT", "sort=newest") or "",
+        delta_stop_after_known=max(1, _get_int("DELTA_STOP_AFTER_KNOWN", 50)),
+
+        absent_after_runs=max(0, _get_int("ABSENT_AFTER_RUNS", 3)),
+        absence_sweep_max=max(0, _get_int("ABSENCE_SWEEP_MAX", 5000)),
         scroll_pause_sec=_get_float("SCROLL_PAUSE_SEC", 1.5),
 
+        prune_dom=(_get("PRUNE_DOM", "off") or "off").lower(),
+        prune_keep_screens=_get_float("PRUNE_KEEP_SCREENS", 3.0),
+
+        tab_mode=(_get("TAB_MODE", "pool") or "pool").lower(),
+        tab_pool_size=max(1, _get_int("TAB_POOL_SIZE", 2)),
+
+        fetch_concurrency=max(1, _get_int("FETCH_CONCURRENCY", 8)),
+        fetch_profile=(_get("FETCH_PROFILE", "merged") or "merged").lower(),
+        http_max_retries=max(0, _get_int("HTTP_MAX_RETRIES", 3)),
+        http_backoff_base_sec=max(0.0, _get_float("HTTP_BACKOFF_BASE_SEC", 1.0)),
+        http_backoff_max_sec=max(0.0, _get_float("HTTP_BACKOFF_MAX_SEC", 60.0)),
+        http_slow_sec=_get_float("HTTP_SLOW_SEC", 8.0),
+        retry_pass=(_get("RETRY_PASS", "true").lower() == "true"),
+
+        http_cache_dir=_get("HTTP_CACHE_DIR", "") or "",
+        http_cache_ttl_inspection_hours=max(0.0, _get_float("HTTP_CACHE_TTL_INSPECTION_HOURS", 24.0)),
+        http_cache_ttl_details_hours=max(0.0, _get_float("HTTP_CACHE_TTL_DETAILS_HOURS", 0.0)),
+
+        archive_dir=_get("ARCHIVE_DIR", "") or "",
+        archive_segment_mb=max(1.0, _get_float("ARCHIVE_SEGMENT_MB", 256.0)),
+        job_queue=(_get("JOB_QUEUE", "off") or "off").lower(),
+        job_lease_sec=_get_float("JOB_LEASE_SEC", 300.0),
+        job_max_attempts=max(1, _get_int("JOB_MAX_ATTEMPTS", 5)),
+        worker_poll_sec=_get_float("WORKER_POLL_SEC", 2.0),
+        pipeline_queue_size=max(1, _get_int("PIPELINE_QUEUE_SIZE", 256)),
+
+        write_batch_size=max(1, _get_int("WRITE_BATCH_SIZE", 100)),
+        write_flush_sec=_get_float("WRITE_FLUSH_SEC", 5.0),
+        price_history_max=max(0, _get_int("PRICE_HISTORY_MAX", 50)),
+
+        checkpoint_every_sec=max(0.0, _get_float("CHECKPOINT_EVERY_SEC", 60.0)),
+        checkpoint_max_age_hours=_get_float("CHECKPOINT_MAX_AGE_HOURS", 72.0),
+
+        fresh_max_age_hours=max(0.0, _get_float("FRESH_MAX_AGE_HOURS", 168.0)),
+        inspection_refresh_hours=max(0.0, _get_float("INSPECTION_REFRESH_HOURS", 720.0)),
+
+        flat_fields_enable=_get_list("FLAT_FIELDS_ENABLE", ","),
+        flat_fields_disable=_get_list("FLAT_FIELDS_DISABLE", ","),
+
+        log_format=(_get("LOG_FORMAT", "json") or "json").lower(),
+        log_level=(_get("LOG_LEVEL", "info") or "info").lower(),
+        log_sample_per_sec=max(0, _get_int("LOG_SAMPLE_PER_SEC", 5)),
+        log_summary_sec=max(0.0, _get_float("LOG_SUMMARY_SEC", 60.0)),
+
+        metrics_port=max(0, _get_int("METRICS_PORT", 0)),
+        metrics_host=_get("METRICS_HOST", "127.0.0.1") or "127.0.0.1",
+
+        trace_file=_get("TRACE_FILE", "") or "",
+        trace_sample=min(1.0, max(0.0, _get_float("TRACE_SAMPLE", 1.0))),
+        profile_trigger_file=_get("PROFILE_TRIGGER_FILE", "profile.trigger") or "",
+        profile_dir=_get("PROFILE_DIR", "profiles") or "profiles",
+        profile_minutes=max(0.1, _get_float("PROFILE_MINUTES", 5.0)),
+        profile_interval_ms=max(1.0, _get_float("PROFILE_INTERVAL_MS", 10.0)),
+
         api_lang=_get("SYARAH_API_LANG", "ar") or "ar",
+        api_base=(_get("SYARAH_API_BASE", "https://syarah.com") or "https://syarah.com").rstrip("/"),
 
         authorization=_get("SYARAH_AUTHORIZATION"),
         token=_get("SYARAH_TOKEN"),
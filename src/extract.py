@@ -0,0 +1,540 @@
+from __future__ import annotations
+
+import functools
+import hashlib
+import json
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from .logging_utils import log
+
+
+# -----------------------------
+# Value helpers
+# -----------------------------
+def _dig(obj: Any, path: str) -> Any:
+    """Navigate nested dict/list by dot-separated path."""
+    if obj is None:
+        return None
+    keys = path.split(".")
+    for key in keys:
+        if isinstance(obj, dict):
+            obj = obj.get(key)
+        elif isinstance(obj, list) and key.isdigit():
+            idx = int(key)
+            obj = obj[idx] if 0 <= idx < len(obj) else None
+        else:
+            return None
+        if obj is None:
+            return None
+    return obj
+
+
+def _first_str(*vals: Any) -> Optional[str]:
+    for v in vals:
+        if isinstance(v, str) and v.strip():
+            return v.strip()
+    return None
+
+
+def _first_num(*vals: Any) -> Optional[float]:
+    for v in vals:
+        if isinstance(v, (int, float)):
+            return v
+        if isinstance(v, str):
+            vv = "".join(ch for ch in v if ch.isdigit() or ch == ".")
+            if vv:
+                try:
+                    return float(vv) if "." in vv else int(vv)
+                except Exception:
+                    pass
+    return None
+
+
+def _slug_en(s: Optional[str]) -> str:
+    s = (s or "").strip().lower()
+    out = []
+    prev_us = False
+    for ch in s:
+        if ch.isalnum():
+            out.append(ch)
+            prev_us = False
+        else:
+            if not prev_us:
+                out.append("_")
+                prev_us = True
+    key = "".join(out).strip("_")
+    return key or "unknown"
+
+
+def flatten_inspection_kv(categories: Any) -> Dict[str, Dict[str, Any]]:
+    """
+    Input: car_report list (categories)
+    Output:
+      { "engine": { "الصوفة الامامية": "جيد", ... }, ... }
+    """
+    if not isinstance(categories, list):
+        return {}
+
+    out: Dict[str, Dict[str, Any]] = {}
+    used = set()
+
+    for cat in categories:
+        if not isinstance(cat, dict):
+            continue
+
+        key = _slug_en(cat.get("category_name_en"))
+        base = key
+        i = 2
+        while key in used:
+            key = f"{base}_{i}"
+            i += 1
+        used.add(key)
+
+        subs = cat.get("sub") or []
+        if not isinstance(subs, list):
+            subs = []
+
+        kv: Dict[str, Any] = {}
+        for s in subs:
+            if not isinstance(s, dict):
+                continue
+            name = (s.get("name") or "").strip()
+            if not name:
+                continue
+            kv[name] = s.get("rate")  # store rate text only
+        out[key] = kv
+
+    return out
+
+
+# -----------------------------
+# Coercers: candidate values (one per path, in order) -> field value
+# -----------------------------
+def c_str(vals: Sequence[Any], ctx: Dict[str, Any]) -> Optional[str]:
+    return _first_str(*vals)
+
+
+def c_num(vals: Sequence[Any], ctx: Dict[str, Any]) -> Optional[float]:
+    return _first_num(*vals)
+
+
+def c_raw(vals: Sequence[Any], ctx: Dict[str, Any]) -> Any:
+    for v in vals:
+        if v is not None:
+            return v
+    return None
+
+
+def c_bool(vals: Sequence[Any], ctx: Dict[str, Any]) -> bool:
+    return any(bool(v) for v in vals)
+
+
+def c_len(vals: Sequence[Any], ctx: Dict[str, Any]) -> int:
+    v = vals[0]
+    return len(v) if isinstance(v, list) else 0
+
+
+def c_count_or_zero(vals: Sequence[Any], ctx: Dict[str, Any]) -> Any:
+    return _first_num(*vals) or 0
+
+
+def _memo(ctx: Dict[str, Any], key: str, value: Any, fn: Callable[[Any], Any]) -> Any:
+    """
+    fn(value) once per flatten_post call: ctx is that call's own dict, so fields deriving from the same
+    value (gallery, options) share the work without any state outside the call.
+    """
+    hit = ctx.get(key)
+    if hit is not None and hit[0] is value:
+        return hit[1]
+    out = fn(value)
+    ctx[key] = (value, out)
+    return out
+
+
+def _uniq_images(gallery: Any) -> Tuple[List[str], Optional[str]]:
+    urls: List[str] = []
+    featured: Optional[str] = None
+    seen = set()
+    if isinstance(gallery, list):
+        for img in gallery:
+            if not isinstance(img, dict):
+                continue
+            url = img.get("img_url")
+            if isinstance(url, str) and url:
+                if img.get("is_featured") == 1 and not featured:
+                    featured = url
+                if url not in seen:
+                    seen.add(url)
+                    urls.append(url)
+    return urls, featured
+
+
+def c_images(vals: Sequence[Any], ctx: Dict[str, Any]) -> List[str]:
+    return list(_memo(ctx, "gallery", vals[0], _uniq_images)[0][:30])
+
+
+def c_images_count(vals: Sequence[Any], ctx: Dict[str, Any]) -> int:
+    return len(_memo(ctx, "gallery", vals[0], _uniq_images)[0])
+
+
+def c_featured_image(vals: Sequence[Any], ctx: Dict[str, Any]) -> Optional[str]:
+    urls, featured = _memo(ctx, "gallery", vals[0], _uniq_images)
+    return featured or (urls[0] if urls else None)
+
+
+def c_body_is_clear(vals: Sequence[Any], ctx: Dict[str, Any]) -> bool:
+    sub = vals[0]
+    if isinstance(sub, list) and sub and isinstance(sub[0], dict):
+        return sub[0].get("body_is_clear") == 1
+    return False
+
+
+def c_body_damage_notes(vals: Sequence[Any], ctx: Dict[str, Any]) -> List[str]:
+    out: List[str] = []
+    report = vals[0]
+    if isinstance(report, list):
+        for item in report:
+            if isinstance(item, dict) and isinstance(item.get("image_info"), dict):
+                note = item["image_info"].get("note", "")
+                if isinstance(note, str) and note.strip():
+                    out.append(note.strip())
+    return out
+
+
+def c_points_total(vals: Sequence[Any], ctx: Dict[str, Any]) -> int:
+    total = 0
+    report = vals[0]
+    if isinstance(report, list):
+        for category in report:
+            if isinstance(category, dict):
+                sub = category.get("sub", [])
+                total += len(sub) if isinstance(sub, list) else 0
+    return total
+
+
+def c_inspection_kv(vals: Sequence[Any], ctx: Dict[str, Any]) -> Dict[str, Dict[str, Any]]:
+    return flatten_inspection_kv(vals[0])
+
+
+def _features(options: Any) -> Tuple[List[str], Dict[str, List[str]]]:
+    all_features: List[str] = []
+    by_category: Dict[str, List[str]] = {}
+    if isinstance(options, list):
+        for category in options:
+            if not isinstance(category, dict):
+                continue
+            cat_data = category.get("data", [])
+            names = (
+                [f.get("name") for f in cat_data if isinstance(f, dict) and f.get("name")]
+                if isinstance(cat_data, list) else []
+            )
+            all_features.extend(names)
+            if category.get("category"):
+                by_category[str(category["category"])] = names
+    return all_features, by_category
+
+
+def c_features(vals: Sequence[Any], ctx: Dict[str, Any]) -> List[str]:
+    return _memo(ctx, "features", vals[0], _features)[0]
+
+
+def c_features_count(vals: Sequence[Any], ctx: Dict[str, Any]) -> int:
+    return len(_memo(ctx, "features", vals[0], _features)[0])
+
+
+def c_features_by_category(vals: Sequence[Any], ctx: Dict[str, Any]) -> Dict[str, List[str]]:
+    return _memo(ctx, "features", vals[0], _features)[1]
+
+
+def c_tags(vals: Sequence[Any], ctx: Dict[str, Any]) -> List[str]:
+    tags = vals[0]
+    if isinstance(tags, list):
+        return [t.get("tag_name") for t in tags if isinstance(t, dict) and t.get("tag_name")]
+    return []
+
+
+# -----------------------------
+# The spec
+# -----------------------------
+# coercer(candidate values, per-call memo) -> field value
+Coercer = Callable[[Sequence[Any], Dict[str, Any]], Any]
+
+
+@dataclass(frozen=True)
+class FieldSpec:
+    name: str
+    coerce: Coercer
+    paths: Tuple[str, ...]        # "det:..." details data, "card:..." its details.details_card, "ins:..." inspection
+    enabled: bool = True          # default; FLAT_FIELDS_ENABLE / FLAT_FIELDS_DISABLE override
+
+
+def F(name: str, coerce: Coercer, *paths: str, enabled: bool = True) -> FieldSpec:
+    return FieldSpec(name, coerce, tuple(paths), enabled)
+
+
+CARD = "card:"
+
+# output order = table order
+FIELDS: Tuple[FieldSpec, ...] = (
+    # ========== BASIC IDENTITY ==========
+    F("post_id", c_num, "det:details.id"),
+    F("title", c_str, "det:details.title", "det:meta.title"),
+
+    # ========== VEHICLE SPECS ==========
+    F("brand", c_str, CARD + "make.name", CARD + "make.altName"),
+    F("model", c_str, CARD + "model.name", CARD + "model.altName"),
+    F("trim", c_str, CARD + "extension.name", CARD + "extension.altName"),
+    F("year", c_num, CARD + "years.id", CARD + "years.name"),
+    F("mileage_km", c_num, CARD + "milage.id", CARD + "milage.name"),
+
+    # ========== LOCATION & ORIGIN ==========
+    F("city", c_str, "det:g4Data.post_city"),
+    F("origin", c_str, CARD + "car_origin.name"),
+
+    # ========== MECHANICAL ==========
+    F("fuel_type", c_str, CARD + "fuel_types.name", "det:fuel.fuel_type"),
+    F("transmission", c_str, CARD + "transmission_type.name"),
+    F("engine_size", c_str, CARD + "engine_size.name"),
+    F("cylinders", c_num, CARD + "cylinders.id", CARD + "cylinders.name"),
+    F("horse_power", c_num, CARD + "horse_power.id", CARD + "horse_power.name"),
+    F("drivetrain", c_str, CARD + "drivetrain_type.name"),
+    F("engine_type", c_str, CARD + "engine_type.name"),
+    F("fuel_tank_liters", c_num, CARD + "fuel_tank.id", CARD + "fuel_tank.name"),
+    F("fuel_economy_kml", c_num, "det:fuel.fuel_economy"),
+
+    # ========== PHYSICAL ==========
+    F("exterior_color", c_str, CARD + "exterior_color.name", enabled=False),
+    F("exterior_color_code", c_str, CARD + "exterior_color.code", enabled=False),
+    F("interior_color", c_str, CARD + "interior_color.name", enabled=False),
+    F("interior_color_code", c_str, CARD + "interior_color.code", enabled=False),
+    F("doors", c_num, CARD + "doors.id", CARD + "doors.name", enabled=False),
+    F("seats", c_num, CARD + "seats.id", CARD + "seats.name"),
+    F("number_of_keys", c_num, CARD + "number_of_keys.id", CARD + "number_of_keys.name", enabled=False),
+
+    # ========== CONDITION ==========
+    F("condition", c_str, CARD + "is_new.name", CARD + "is_new.altName", enabled=False),
+    F("is_preowned", c_raw, "det:details.is_preowned", enabled=False),
+    F("is_test", c_raw, "det:details.is_test", enabled=False),
+
+    # ========== PRICING ==========
+    F("price_cash", c_num, "det:price.vat_price.text", "det:analytics.price"),
+    F("price_monthly", c_num, "det:price.finance_price.text"),
+    F("currency", c_str, "det:price.currency", enabled=False),
+    F("first_payment", c_num, "det:price.finance_price.first_payment", enabled=False),
+    F("last_payment", c_num, "det:price.finance_price.last_payment", enabled=False),
+    F("installment_period", c_num, "det:price.finance_price.installment_period", enabled=False),
+
+    # ========== INSPECTION (FLAT + KV) ==========
+    F("inspection_date", c_str, "ins:report_date", enabled=False),
+    F("chassis_number", c_str, "ins:chassis_number"),
+    F("plate_number", c_str, "ins:plate_number"),
+    F("inspection_categories_count", c_len, "ins:car_report", enabled=False),
+    F("inspection_points_total", c_points_total, "ins:car_report", enabled=False),
+    F("inspection_kv", c_inspection_kv, "ins:car_report", enabled=False),
+
+    # ========== BODY DAMAGE ==========
+    F("body_issues_count", c_count_or_zero, "ins:external_body.category_countertext", enabled=False),
+    F("body_is_clear", c_body_is_clear, "ins:external_body.sub"),
+    F("body_damage_notes", c_body_damage_notes, "ins:body_report", enabled=False),
+
+    # ========== IMAGES ==========
+    F("images", c_images, "det:gallery.images"),
+    F("images_count", c_images_count, "det:gallery.images", enabled=False),
+    F("featured_image", c_featured_image, "det:gallery.images"),
+    F("has_360_spin", c_bool, "det:gallery.has_spin", enabled=False),
+    F("has_video", c_bool, "det:gallery.has_video", enabled=False),
+
+    # ========== FEATURES ==========
+    F("features", c_features, "det:options.options", enabled=False),
+    F("features_count", c_features_count, "det:options.options", enabled=False),
+    F("features_by_category", c_features_by_category, "det:options.options", enabled=False),
+
+    # ========== LISTING INFO ==========
+    F("share_link", c_str, "det:details.share_link"),
+    F("product_url", c_str, "det:details.product_url", enabled=False),
+    F("is_sold", c_raw, "det:details.is_sold", enabled=False),
+    F("is_deleted", c_raw, "det:details.is_deleted", enabled=False),
+    F("owned_by_us", c_raw, "det:details.owned_by_us", enabled=False),
+    F("list_date", c_str, "det:g4Data.list_date", enabled=False),
+    F("lot_age_days", c_num, "det:g4Data.lot_age", enabled=False),
+
+    # ========== CAMPAIGN/OFFERS ==========
+    F("has_cash_campaign", c_bool, "det:details.campaigns.cash", enabled=False),
+    F("has_finance_campaign", c_bool, "det:details.campaigns.finance", enabled=False),
+    F("campaign_text", c_str, "det:details.campaigns.cash.text", enabled=False),
+
+    # ========== TAGS ==========
+    F("tags", c_tags, "det:details.tags"),
+)
+
+FIELD_NAMES = tuple(f.name for f in FIELDS)
+
+# flat fields a doc needs to count as complete: the freshness policy reads them (mongo.REQUIRED_FIELDS
+# is this tuple), so they can't be switched off
+ALWAYS_ON = ("post_id", "title", "brand", "model", "year")
+
+
+# -----------------------------
+# Compiled form
+# -----------------------------
+# one path step: (dict key, list index or None)
+Step = Tuple[str, Optional[int]]
+# one accessor: (root index in ROOTS, steps)
+Accessor = Tuple[int, Tuple[Step, ...]]
+Compiled = Tuple[Tuple[str, Coercer, Tuple[Accessor, ...]], ...]
+
+
+ROOTS = ("ins", "det", "card")
+
+
+def _compile_path(path: str) -> Accessor:
+    root, _, rest = path.partition(":")
+    if root not in ROOTS:
+        raise ValueError(f"bad extraction path {path!r} (must start with one of {ROOTS})")
+    steps = tuple((k, int(k) if k.isdigit() else None) for k in rest.split(".") if k)
+    return ROOTS.index(root), steps
+
+
+def compile_fields(names: Iterable[str]) -> Compiled:
+    """Pre-split every path of the selected fields once (table order is kept)."""
+    wanted = set(names)
+    return tuple(
+        (f.name, f.coerce, tuple(_compile_path(p) for p in f.paths))
+        for f in FIELDS
+        if f.name in wanted
+    )
+
+
+def select_fields(enable: Iterable[str] = (), disable: Iterable[str] = ()) -> List[str]:
+    """
+    Default set + enable - disable. "all" in enable turns on every field.
+    Unknown names are reported and ignored.
+    """
+    enable = [x.strip() for x in enable if x.strip()]
+    disable = [x.strip() for x in disable if x.strip()]
+    for name in enable + disable:
+        if name != "all" and name not in FIELD_NAMES:
+            log(f"[extract] unknown field {name!r} ignored (known: {', '.join(FIELD_NAMES)})")
+
+    on = {f.name for f in FIELDS if f.enabled or "all" in enable or f.name in enable}
+    for name in disable:
+        if name in ALWAYS_ON:
+            log(f"[extract] field {name!r} is required and stays enabled")
+            continue
+        on.discard(name)
+    return [n for n in FIELD_NAMES if n in on]
+
+
+_active: Optional[Compiled] = None
+
+
+def set_active_fields(names: Iterable[str]) -> None:
+    global _active
+    _active = compile_fields(names)
+
+
+def active_fields() -> Compiled:
+    """Compiled spec used by flatten_post (FLAT_FIELDS_ENABLE / FLAT_FIELDS_DISABLE, read once)."""
+    global _active
+    if _active is None:
+        from .config import get_settings
+
+        s = get_settings()
+        set_active_fields(select_fields(s.flat_fields_enable, s.flat_fields_disable))
+    assert _active is not None
+    return _active
+
+
+# (details-only spec, the active spec it was derived from)
+_active_details: Optional[Tuple[Compiled, Compiled]] = None
+
+
+def details_only(spec: Compiled) -> Compiled:
+    """The fields of spec that don't read the inspection (for details-only refreshes)."""
+    ins = ROOTS.index("ins")
+    return tuple(f for f in spec if all(root != ins for root, _ in f[2]))
+
+
+def active_details_fields() -> Compiled:
+    global _active_details
+    spec = active_fields()
+    if _active_details is None or _active_details[1] is not spec:
+        _active_details = (details_only(spec), spec)
+    return _active_details[0]
+
+
+def required_includes(spec: Compiled) -> List[str]:
+    """
+    view-online `include` values the compiled fields read: the first key under the details data
+    is the include that returns it (details_card lives in "details"). "details" is always asked for.
+    """
+    need = {"details"}
+    for _, _, accessors in spec:
+        for root, steps in accessors:
+            if ROOTS[root] == "det" and steps:
+                need.add(steps[0][0])
+            elif ROOTS[root] == "card":
+                need.add("details")
+    return sorted(need)
+
+
+def _walk(obj: Any, steps: Tuple[Step, ...]) -> Any:
+    for key, idx in steps:
+        if isinstance(obj, dict):
+            obj = obj.get(key)
+        elif idx is not None and isinstance(obj, list):
+            obj = obj[idx] if idx < len(obj) else None
+        else:
+            return None
+        if obj is None:
+            return None
+    return obj
+
+
+def flatten_post(inspection_json: dict, details_json: dict, spec: Optional[Compiled] = None) -> dict:
+    """
+    Flatten the Syarah API responses into a searchable structure
+    (only the enabled fields of FIELDS are evaluated).
+    """
+    det = _dig(details_json, "data") or {}
+    roots = (
+        _dig(inspection_json, "data.inspection") or {},
+        det,
+        _dig(det, "details.details_card") or {},
+    )
+    flat: Dict[str, Any] = {}
+    ctx: Dict[str, Any] = {}  # per-call memo for coercers sharing a derived value
+    for name, coerce, accessors in (spec if spec is not None else active_fields()):
+        flat[name] = coerce([_walk(roots[r], steps) for r, steps in accessors], ctx)
+    return flat
+
+
+# -----------------------------
+# Content fingerprint
+# -----------------------------
+# bookkeeping keys that change on every fetch / are derived from the content
+HASH_SKIP = frozenset({"id", "fetchedAt", "inspectionFetchedAt", "lastSeenAt", "contentHash", "detailsHash", "priceHistory"})
+
+
+def content_hash(doc: Dict[str, Any], names: Optional[Iterable[str]] = None) -> str:
+    """
+    Stable fingerprint of a payload's content (key order independent, timestamps ignored).
+    names: only hash these keys (the details part of a full payload).
+    """
+    keep = set(names) if names is not None else None
+    body = {k: v for k, v in doc.items() if k not in HASH_SKIP and (keep is None or k in keep)}
+    raw = json.dumps(body, sort_keys=True, separators=(",", ":"), ensure_ascii=False, default=str)
+    return hashlib.blake2b(raw.encode("utf-8"), digest_size=16).hexdigest()
+
+
+@functools.lru_cache(maxsize=4)
+def spec_fingerprint(spec: Compiled) -> str:
+    """Short id of a compiled spec's field set (payloads built with another spec are different docs)."""
+    return hashlib.blake2b(",".join(name for name, _, _ in spec).encode("utf-8"), digest_size=8).hexdigest()
+
+
+@functools.lru_cache(maxsize=4)
+def details_hash_names(spec: Compiled) -> frozenset:
+    """Payload keys a details-only refresh carries (its detailsHash covers exactly these)."""
+    return frozenset(name for name, _, _ in details_only(spec)) | {"details_status"}
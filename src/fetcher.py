@@ -0,0 +1,292 @@
+from __future__ import annotations
+
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from typing import Any, AsyncIterator, Dict, Iterable, List, Optional
+
+import requests
+
+from .archive import RawArchive, make_archive
+from .extract import active_fields, required_includes, spec_fingerprint
+from .httpcache import ResponseCache, endpoint_of, ensure_parsed, make_cache
+from .logging_utils import DEBUG, log
+from .metrics import HTTP_LIMIT, HTTP_RETRIES, HTTP_SECONDS
+from .ratelimit import RateController, backoff_delay, is_retryable_status, parse_retry_after
+from .tracing import now_us, record, span, tracing
+from .syarah import (
+    _req_get_json_or_text,
+    api_referer,
+    API_INCLUDES_FULL,
+    build_api_urls,
+    build_merged_api_url,
+    build_post_payload,
+)
+
+# full = the web app's include list, 2 calls | trimmed = only what the extraction spec reads, 2 calls
+# merged = trimmed + inspection in ONE call (falls back to 2 calls per post / for the run, see FetchEngine)
+FETCH_PROFILES = ("full", "trimmed", "merged")
+
+# merged calls without inspection data before we decide the API doesn't merge (until one succeeds)
+MERGE_PROBE = 20
+
+
+# rate controllers of the engines alive in this process (a delta crawl / sweep can run next to the full
+# crawl): the per-host limit gauge is their sum, i.e. what the host may see in flight from us
+_live_rates: Dict[int, RateController] = {}
+
+
+def _host_limits() -> Dict[tuple, float]:
+    out: Dict[tuple, float] = {}
+    for rate in list(_live_rates.values()):
+        for h, v in rate.limits().items():
+            out[(h,)] = out.get((h,), 0) + v
+    return out
+
+
+HTTP_LIMIT.set_function(_host_limits)
+
+
+def _has_inspection(res: Dict[str, Any]) -> bool:
+    data = (res.get("json") or {}).get("data") if isinstance(res.get("json"), dict) else None
+    return isinstance(data, dict) and bool(data.get("inspection"))
+
+
+class FetchEngine:
+    """
+    Async wrapper around the requests session.
+
+    - every GET runs in our own thread pool, so the nodriver event loop never blocks
+    - inspection + details for one post are fetched in parallel, or as one merged call (profile=merged);
+      a merged answer without inspection data gets a separate inspection call, and if merging never
+      works (MERGE_PROBE misses before the first hit) the engine switches to two calls for good
+    - at most `concurrency` posts are in flight at once
+    - GETs per host are further limited by an adaptive (AIMD) limit that backs off on 429/5xx/slow answers
+    - 0/429/5xx are retried with jittered exponential backoff (Retry-After wins when the server sends it);
+      if still failing after max_retries the caller gets the last response and decides (retry queue)
+    - with a ResponseCache, unchanged responses (fresh / 304 / same body hash) reuse the payload
+      flattened last time instead of parsing + flattening again
+    - with a RawArchive, the raw responses of every fetch that changed something are appended
+      to it (src.replay re-flattens from there without the network)
+    """
+
+    def __init__(
+        self,
+        sess: requests.Session,
+        lang: str,
+        concurrency: int = 8,
+        max_retries: int = 3,
+        backoff_base_sec: float = 1.0,
+        backoff_max_sec: float = 60.0,
+        slow_sec: float = 8.0,
+        cache: Optional[ResponseCache] = None,
+        archive: Optional[RawArchive] = None,
+        profile: str = "full",
+        includes: Optional[List[str]] = None,
+    ) -> None:
+        self.sess = sess
+        self.lang = lang
+        self.concurrency = max(1, int(concurrency))
+        self.max_retries = max(0, int(max_retries))
+        self.backoff_base_sec = backoff_base_sec
+        self.backoff_max_sec = backoff_max_sec
+        self._sem = asyncio.Semaphore(self.concurrency)
+        # 2 GETs per post in flight
+        self._pool = ThreadPoolExecutor(max_workers=self.concurrency * 2, thread_name_prefix="syarah-fetch")
+        self.rate = RateController(self.concurrency * 2, slow_sec=slow_sec)
+        _live_rates[id(self)] = self.rate
+
+        self.cache = cache
+        self.archive = archive
+
+        self.profile = profile if profile in FETCH_PROFILES else "full"
+        self.includes = list(includes or API_INCLUDES_FULL) if self.profile != "full" else list(API_INCLUDES_FULL)
+        self._merge_confirmed = False
+        self.merge_misses = 0   # merged answers that needed a separate inspection call
+
+        self.retries = 0    # extra attempts made
+        self.gave_up = 0    # GETs still failing after max_retries
+        self.reused = 0     # payloads taken from the cache (nothing parsed or flattened)
+        self.details_only = 0   # refreshes without the inspection call
+
+    async def _get(self, url: str, referer: str, post_id: Optional[int] = None) -> Dict[str, Any]:
+        loop = asyncio.get_running_loop()
+        host = self.rate.for_url(url)
+        endpoint = "merged" if "include=inspection," in url else endpoint_of(url)
+        attempt = 0
+        while True:
+            async with host.slot():
+                t0, t0_us = time.monotonic(), now_us()
+                if self.cache is not None:
+                    res = await loop.run_in_executor(self._pool, self.cache.get, self.sess, url, referer)
+                else:
+                    res = await loop.run_in_executor(self._pool, _req_get_json_or_text, self.sess, url, referer)
+                latency = time.monotonic() - t0
+
+            if post_id is not None and tracing():
+                get_us = latency * 1e6
+                record(post_id, f"{endpoint} GET", t0_us, get_us, status=res.get("status"), attempt=attempt,
+                       cache=res.get("cache"))
+                parse_us = (res.get("parseSec") or 0.0) * 1e6
+                if parse_us:
+                    record(post_id, "JSON parse", t0_us + get_us - parse_us, parse_us)
+
+            if res.get("cache") == "fresh":
+                return res  # never left the machine
+
+            st = res.get("status")
+            retry_after = parse_retry_after(res.get("retryAfter"))
+            host.record(st, latency, retry_after)
+            HTTP_SECONDS.observe(latency, endpoint=endpoint, status=str(st or 0))
+
+            if not is_retryable_status(st):
+                return res
+            if attempt >= self.max_retries or (retry_after or 0) > self.backoff_max_sec:
+                # server wants us gone for longer than we wait inline -> leave it to the retry queue
+                self.gave_up += 1
+                return res
+
+            delay = max(retry_after or 0.0, backoff_delay(attempt, self.backoff_base_sec, self.backoff_max_sec))
+            attempt += 1
+            self.retries += 1
+            HTTP_RETRIES.inc(endpoint=endpoint)
+            log(f"[rate] retry {attempt}/{self.max_retries} in {delay:.1f}s status={st} url={url}", DEBUG)
+            with span(post_id, "backoff", status=st):
+                await asyncio.sleep(delay)
+
+    async def fetch(self, post_id: int, with_inspection: bool = True) -> Dict[str, Any]:
+        """
+        Same payload shape as syarah.fetch_post_payloads_requests.
+        with_inspection=False: details call only (lazy inspection, see mongo.needs_inspection).
+        """
+        u1, u2 = build_api_urls(self.lang, post_id, self.includes)
+        referer = api_referer(self.lang, post_id)
+
+        r1: Optional[Dict[str, Any]]
+        async with self._sem:
+            if not with_inspection:
+                r1, r2 = None, await self._get(u2, referer, post_id)
+                self.details_only += 1
+            elif self.profile == "merged":
+                r1, r2 = await self._get_merged(post_id, u1, referer)
+            else:
+                r1, r2 = await asyncio.gather(self._get(u1, referer, post_id), self._get(u2, referer, post_id))
+
+        if self.cache is None:
+            with span(post_id, "flatten_post"):
+                payload = build_post_payload(post_id, r1, r2)
+        else:
+            payload = await self._build_cached(post_id, r1, r2)
+
+        # ✅ keep the raw answers (not when both came back unchanged: the archive already has them)
+        if (
+            self.archive is not None
+            and not ((r1 is None or r1.get("unchanged")) and r2.get("unchanged"))
+            and not (r1 is not None and is_retryable_status(r1.get("status")))
+            and not is_retryable_status(r2.get("status"))
+        ):
+            loop = asyncio.get_running_loop()
+            try:
+                await loop.run_in_executor(
+                    self._pool, self.archive.append, post_id, r1, r2, payload.get("fetchedAt")
+                )
+            except Exception as e:
+                log(f"[archive] append failed id={post_id}: {e}")
+        return payload
+
+    async def fetch_details_status(self, post_id: int) -> Dict[str, Any]:
+        """Parsed details-only response (include=details) for the listing-absence sweep; nothing is flattened."""
+        _, url = build_api_urls(self.lang, post_id, ["details"])
+        async with self._sem:
+            res = await self._get(url, api_referer(self.lang, post_id), post_id)
+        return ensure_parsed(res)
+
+    async def _get_merged(self, post_id: int, u1: str, referer: str) -> tuple:
+        """(inspection response, details response) from one call when the API merges them."""
+        r2 = await self._get(build_merged_api_url(self.lang, post_id, self.includes), referer, post_id)
+        with span(post_id, "JSON parse"):  # cached bodies are parsed here, fresh ones in the GET
+            r2 = ensure_parsed(r2)
+
+        if _has_inspection(r2):
+            self._merge_confirmed = True
+            return {**r2, "merged": True}, r2
+        if r2.get("status") != 200:
+            # failed details call: nothing to fall back for, the inspection status mirrors it
+            return {**r2, "merged": True}, r2
+
+        # no inspection in the merged answer (not supported, or this post has no report): ask separately
+        self.merge_misses += 1
+        if not self._merge_confirmed and self.merge_misses >= MERGE_PROBE and self.profile == "merged":
+            self.profile = "trimmed"
+            log(f"[fetch] {MERGE_PROBE} merged answers without inspection data; using 2 calls per post from now on")
+        return await self._get(u1, referer, post_id), r2
+
+    async def _build_cached(
+        self, post_id: int, r1: Optional[Dict[str, Any]], r2: Dict[str, Any]
+    ) -> Dict[str, Any]:
+        assert self.cache is not None
+        loop = asyncio.get_running_loop()
+        # details-only payloads are a different doc than full ones built from the same details body,
+        # and so is a payload built with another field set (FLAT_FIELDS_ENABLE / FLAT_FIELDS_DISABLE)
+        h1, h2 = (r1.get("hash") if r1 is not None else "details-only"), r2.get("hash")
+        if h2:
+            h2 = f"{h2}:{spec_fingerprint(active_fields())}"
+
+        # ✅ both bodies unchanged -> same flat doc as last time, only the timestamps move
+        if (r1 is None or r1.get("unchanged")) and r2.get("unchanged"):
+            payload = await loop.run_in_executor(self._pool, self.cache.get_flat, post_id, h1, h2)
+            if payload is not None:
+                self.reused += 1
+                payload["fetchedAt"] = datetime.now(timezone.utc).isoformat()
+                if "inspectionFetchedAt" in payload:
+                    payload["inspectionFetchedAt"] = payload["fetchedAt"]
+                return payload
+
+        with span(post_id, "JSON parse"):
+            r1 = ensure_parsed(r1) if r1 is not None else None
+            r2 = ensure_parsed(r2)
+        with span(post_id, "flatten_post"):
+            payload = build_post_payload(post_id, r1, r2)
+        await loop.run_in_executor(self._pool, self.cache.put_flat, post_id, h1, h2, payload)
+        return payload
+
+    async def fetch_many(self, post_ids: Iterable[int]) -> AsyncIterator[Dict[str, Any]]:
+        """
+        Fetch all ids concurrently (bounded by the semaphore), yield payloads as they complete.
+        """
+        tasks = [asyncio.ensure_future(self.fetch(int(pid))) for pid in post_ids]
+        try:
+            for fut in asyncio.as_completed(tasks):
+                yield await fut
+        finally:
+            for t in tasks:
+                if not t.done():
+                    t.cancel()
+
+    def close(self, wait: bool = False) -> None:
+        _live_rates.pop(id(self), None)
+        self._pool.shutdown(wait=wait, cancel_futures=True)
+        if self.cache is not None:
+            log(f"[cache] {self.cache.stats} payloads_reused={self.reused}")
+            self.cache.close()
+        if self.archive is not None:
+            log(f"[archive] appended={self.archive.appended}")
+            self.archive.close()
+
+
+def make_engine(sess: requests.Session, settings: Any, concurrency: Optional[int] = None) -> FetchEngine:
+    n = concurrency if concurrency is not None else getattr(settings, "fetch_concurrency", 8)
+    return FetchEngine(
+        sess,
+        settings.api_lang,
+        n,
+        max_retries=getattr(settings, "http_max_retries", 3),
+        backoff_base_sec=getattr(settings, "http_backoff_base_sec", 1.0),
+        backoff_max_sec=getattr(settings, "http_backoff_max_sec", 60.0),
+        slow_sec=getattr(settings, "http_slow_sec", 8.0),
+        cache=make_cache(settings),
+        archive=make_archive(settings),
+        profile=getattr(settings, "fetch_profile", "full"),
+        includes=required_includes(active_fields()),
+    )
@@ -0,0 +1,228 @@
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, Optional
+from urllib.parse import parse_qs, urlsplit
+
+import requests
+
+from .logging_utils import log
+from .syarah import _error_dict, _response_dict
+
+# answers worth keeping (404 on the inspection endpoint = "no inspection", stable too)
+CACHEABLE_STATUSES = {200, 404}
+
+
+def endpoint_of(url: str) -> str:
+    """'inspection' or 'details' (the two view-online URLs from build_api_urls)."""
+    inc = parse_qs(urlsplit(url).query).get("include") or [""]
+    return "inspection" if inc[0] == "inspection" else "details"
+
+
+def ensure_parsed(res: Dict[str, Any]) -> Dict[str, Any]:
+    """Cached responses carry the raw body; parse it only when someone actually needs the JSON."""
+    body = res.pop("body", None)
+    if body is not None and res.get("json") is None:
+        try:
+            res["json"] = json.loads(body)
+            res["text"] = None
+        except Exception:
+            res["text"] = body
+    return res
+
+
+class ResponseCache:
+    """
+    On-disk (sqlite) cache of the view-online responses, keyed by URL.
+
+    - within the endpoint's TTL a response is served without touching the network
+    - after that it is revalidated: If-None-Match / If-Modified-Since when the API gave us
+      ETag / Last-Modified (304 = unchanged), otherwise the body hash decides
+    - responses marked unchanged=True are not even parsed; together with the flat table
+      (post id -> payload built from a given pair of body hashes) the flattening is skipped too
+    Thread safe (the fetch engine calls it from its thread pool). make_cache() shares one instance per
+    directory within the process; close() closes it when the last user is done.
+    """
+
+    def __init__(self, cache_dir: str, ttl_hours: Dict[str, float]) -> None:
+        os.makedirs(cache_dir, exist_ok=True)
+        self.path = os.path.join(cache_dir, "responses.sqlite3")
+        self.ttl_sec = {k: max(0.0, float(v)) * 3600 for k, v in ttl_hours.items()}
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            " url TEXT PRIMARY KEY, checked_at REAL, status INTEGER, content_type TEXT,"
+            " etag TEXT, last_modified TEXT, hash TEXT, body TEXT)"
+        )
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS flat (post_id INTEGER PRIMARY KEY, h1 TEXT, h2 TEXT, doc TEXT)"
+        )
+        # fresh = served within TTL, not_modified = 304, same_hash = 200 with identical body
+        self.stats = {"fresh": 0, "not_modified": 0, "same_hash": 0, "changed": 0, "miss": 0}
+        self._users = 1
+
+    def _count(self, key: str) -> None:
+        with self._lock:
+            self.stats[key] += 1
+
+    # -------------------------
+    # responses
+    # -------------------------
+    def _lookup(self, url: str) -> Optional[tuple]:
+        with self._lock:
+            return self._db.execute(
+                "SELECT checked_at, status, content_type, etag, last_modified, hash, body"
+                " FROM responses WHERE url = ?",
+                (url,),
+            ).fetchone()
+
+    def _touch(self, url: str, etag: Optional[str], last_modified: Optional[str]) -> None:
+        with self._lock:
+            self._db.execute(
+                "UPDATE responses SET checked_at = ?, etag = COALESCE(?, etag),"
+                " last_modified = COALESCE(?, last_modified) WHERE url = ?",
+                (time.time(), etag, last_modified, url),
+            )
+
+    def _store(self, url: str, r: requests.Response, h: str) -> None:
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (
+                    url, time.time(), int(r.status_code), r.headers.get("content-type", ""),
+                    r.headers.get("etag"), r.headers.get("last-modified"), h, r.text or "",
+                ),
+            )
+
+    @staticmethod
+    def _cached(url: str, row: tuple, how: str) -> Dict[str, Any]:
+        _, status, ct, _, _, h, body = row
+        return {
+            "ok": 200 <= int(status) < 300,
+            "status": int(status),
+            "url": url,
+            "contentType": ct,
+            "json": None,
+            "text": None,
+            "textLen": len(body or ""),
+            "body": body,
+            "hash": h,
+            "cache": how,
+            "unchanged": True,
+        }
+
+    def get(self, sess: requests.Session, url: str, referer: str) -> Dict[str, Any]:
+        """Drop-in for syarah._req_get_json_or_text (plus hash/cache/unchanged keys)."""
+        row = self._lookup(url)
+        if row is not None and time.time() - row[0] < self.ttl_sec.get(endpoint_of(url), 0.0):
+            self._count("fresh")
+            return self._cached(url, row, "fresh")
+
+        headers = {"referer": referer}
+        if row is not None:
+            if row[3]:
+                headers["if-none-match"] = row[3]
+            if row[4]:
+                headers["if-modified-since"] = row[4]
+
+        try:
+            r = sess.get(url, headers=headers, timeout=30)
+        except Exception as e:
+            return _error_dict(url, e)
+
+        if r.status_code == 304 and row is not None:
+            self._touch(url, r.headers.get("etag"), r.headers.get("last-modified"))
+            self._count("not_modified")
+            return self._cached(url, row, "not_modified")
+
+        if r.status_code not in CACHEABLE_STATUSES:
+            return _response_dict(r, url)
+
+        h = hashlib.sha1(r.content or b"").hexdigest()
+        if row is not None and row[5] == h and row[1] == r.status_code:
+            self._touch(url, r.headers.get("etag"), r.headers.get("last-modified"))
+            self._count("same_hash")
+            return self._cached(url, row, "same_hash")
+
+        self._store(url, r, h)
+        self._count("changed" if row is not None else "miss")
+        res = _response_dict(r, url)
+        res.update({"hash": h, "cache": "changed" if row is not None else "miss", "unchanged": False})
+        return res
+
+    # -------------------------
+    # flattened payloads
+    # -------------------------
+    def get_flat(self, post_id: int, h1: Optional[str], h2: Optional[str]) -> Optional[Dict[str, Any]]:
+        """Payload built earlier from exactly these two bodies (fetchedAt is up to the caller)."""
+        if not h1 or not h2:
+            return None
+        with self._lock:
+            row = self._db.execute(
+                "SELECT doc FROM flat WHERE post_id = ? AND h1 = ? AND h2 = ?", (int(post_id), h1, h2)
+            ).fetchone()
+        if row is None:
+            return None
+        try:
+            return json.loads(row[0])
+        except Exception:
+            return None
+
+    def put_flat(self, post_id: int, h1: Optional[str], h2: Optional[str], payload: Dict[str, Any]) -> None:
+        if not h1 or not h2:
+            return
+        try:
+            doc = json.dumps(payload, ensure_ascii=False, default=str)
+        except Exception as e:
+            log(f"[cache] cannot serialize payload id={post_id}: {e}")
+            return
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO flat VALUES (?, ?, ?, ?)", (int(post_id), h1, h2, doc)
+            )
+
+    def close(self) -> None:
+        with _open_lock:
+            self._users -= 1
+            if self._users > 0:
+                return
+            if _open.get(os.path.abspath(self.path)) is self:
+                del _open[os.path.abspath(self.path)]
+        with self._lock:
+            try:
+                self._db.close()
+            except Exception:
+                pass
+
+
+# db path (absolute) -> the process's open cache for it
+_open: Dict[str, ResponseCache] = {}
+_open_lock = threading.Lock()
+
+
+def make_cache(settings: Any) -> Optional[ResponseCache]:
+    """HTTP_CACHE_DIR unset = no cache."""
+    cache_dir = getattr(settings, "http_cache_dir", "") or ""
+    if not cache_dir:
+        return None
+    ttl = {
+        "inspection": getattr(settings, "http_cache_ttl_inspection_hours", 24.0),
+        "details": getattr(settings, "http_cache_ttl_details_hours", 0.0),
+    }
+    with _open_lock:
+        cache = _open.get(os.path.abspath(os.path.join(cache_dir, "responses.sqlite3")))
+        if cache is not None:
+            cache._users += 1
+            return cache
+        cache = ResponseCache(cache_dir, ttl)
+        _open[os.path.abspath(cache.path)] = cache
+    log(f"[cache] responses cached in {cache.path} ttl_hours={ttl}")
+    return cache
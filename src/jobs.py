@@ -0,0 +1,153 @@
+from __future__ import annotations
+
+import os
+import socket
+from datetime import datetime, timedelta, timezone
+from typing import Iterable, List, Optional
+
+from pymongo import ASCENDING, ReturnDocument, UpdateOne
+from pymongo.collection import Collection
+from pymongo.errors import BulkWriteError
+
+from .logging_utils import log
+
+# job states
+PENDING = "pending"
+LEASED = "leased"
+DONE = "done"
+FAILED = "failed"  # gave up after max attempts
+
+
+def get_jobs_collection(col: Collection) -> Collection:
+    """
+    Fetch jobs live next to the posts: <collection>_jobs, one doc per post id (_id = post id).
+    """
+    jobs = col.database[f"{col.name}_jobs"]
+    try:
+        jobs.create_index([("state", ASCENDING), ("availableAt", ASCENDING)], name="state_available")
+        jobs.create_index([("state", ASCENDING), ("leaseUntil", ASCENDING)], name="state_lease")
+    except Exception as e:
+        log(f"[jobs] create_index warning: {e}")
+    return jobs
+
+
+def worker_id() -> str:
+    return f"{socket.gethostname()}-{os.getpid()}"
+
+
+def _now() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+def enqueue_jobs(jobs: Collection, post_ids: Iterable[int]) -> int:
+    """
+    (Re)queue ids as pending. Ids currently leased by a worker are left alone.
+    Returns how many jobs were created or re-queued.
+    """
+    now = _now()
+    ops = [
+        UpdateOne(
+            {"_id": int(pid), "state": {"$ne": LEASED}},
+            {
+                "$set": {"state": PENDING, "availableAt": now, "enqueuedAt": now, "attempts": 0},
+                "$unset": {"error": "", "worker": "", "leaseUntil": ""},
+            },
+            upsert=True,
+        )
+        for pid in {int(x) for x in post_ids}
+    ]
+    if not ops:
+        return 0
+
+    try:
+        res = jobs.bulk_write(ops, ordered=False)
+        return int(res.upserted_count) + int(res.modified_count)
+    except BulkWriteError as e:
+        # duplicate _id = job is leased right now (filter didn't match, upsert collided) -> fine
+        d = e.details or {}
+        other = [we for we in d.get("writeErrors") or [] if we.get("code") != 11000]
+        if other:
+            log(f"[jobs] enqueue errors={len(other)} first={other[0].get('errmsg')}")
+        return int(d.get("nUpserted", 0)) + int(d.get("nModified", 0))
+
+
+def claim_job(jobs: Collection, worker: str, lease_sec: float) -> Optional[dict]:
+    """
+    Atomically lease one job: a pending one that is due, or one whose lease expired
+    (its worker died). Returns the job doc or None if the queue is empty.
+    """
+    now = _now()
+    return jobs.find_one_and_update(
+        {
+            "$or": [
+                {"state": PENDING, "availableAt": {"$lte": now}},
+                {"state": LEASED, "leaseUntil": {"$lt": now}},
+            ]
+        },
+        {
+            "$set": {
+                "state": LEASED,
+                "worker": worker,
+                "leasedAt": now,
+                "leaseUntil": now + timedelta(seconds=lease_sec),
+            },
+            "$inc": {"attempts": 1},
+        },
+        sort=[("availableAt", ASCENDING)],
+        return_document=ReturnDocument.AFTER,
+    )
+
+
+def ack_jobs(jobs: Collection, job_ids: List[int], worker: str) -> int:
+    """Mark leased jobs done (only while we still own the lease)."""
+    if not job_ids:
+        return 0
+    res = jobs.update_many(
+        {"_id": {"$in": [int(x) for x in job_ids]}, "state": LEASED, "worker": worker},
+        {"$set": {"state": DONE, "doneAt": _now()}, "$unset": {"leaseUntil": "", "error": ""}},
+    )
+    return int(res.modified_count)
+
+
+def fail_job(
+    jobs: Collection,
+    job_id: int,
+    worker: str,
+    error: str,
+    retry_delay_sec: float,
+    max_attempts: int,
+    attempts: int,
+) -> str:
+    """
+    Give the job back: pending again after retry_delay_sec, or FAILED once attempts are used up.
+    Returns the new state.
+    """
+    state = FAILED if attempts >= max_attempts else PENDING
+    jobs.update_one(
+        {"_id": int(job_id), "state": LEASED, "worker": worker},
+        {
+            "$set": {
+                "state": state,
+                "error": str(error)[:500],
+                "availableAt": _now() + timedelta(seconds=retry_delay_sec),
+            },
+            "$unset": {"leaseUntil": ""},
+        },
+    )
+    return state
+
+
+def reclaim_expired(jobs: Collection) -> int:
+    """Put jobs whose lease expired back to pending (claim_job also takes them directly)."""
+    res = jobs.update_many(
+        {"state": LEASED, "leaseUntil": {"$lt": _now()}},
+        {"$set": {"state": PENDING, "availableAt": _now()}, "$unset": {"leaseUntil": "", "worker": ""}},
+    )
+    return int(res.modified_count)
+
+
+def queue_counts(jobs: Collection) -> dict:
+    out = {PENDING: 0, LEASED: 0, DONE: 0, FAILED: 0}
+    for row in jobs.aggregate([{"$group": {"_id": "$state", "n": {"$sum": 1}}}]):
+        out[str(row["_id"])] = int(row["n"])
+    return out
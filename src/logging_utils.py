@@ -1,6 +1,213 @@
 from __future__ import annotations
-from datetime import datetime
 
-def log(msg: str) -> None:
-    ts = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-    print(f"[{ts}] {msg}", flush=True)
+import atexit
+import json
+import logging
+import logging.handlers
+import queue
+import re
+import sys
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, Optional
+
+# -----------------------------
+# Leveled, structured logging behind the old log(msg) call.
+# - the level comes from the message tag ("[tab] ...", "{label}[batch 3] ...") unless passed explicitly
+# - records go through a queue; a listener thread formats (JSON or text) and writes them, so log() never
+#   does I/O or timestamp formatting on the event loop
+# - per-post DEBUG chatter is dropped below LOG_LEVEL and otherwise sampled to LOG_SAMPLE_PER_SEC per tag
+# - every LOG_SUMMARY_SEC a "[summary]" line reports the crawl counters (set_summary) and what was suppressed
+# -----------------------------
+
+DEBUG = logging.DEBUG
+INFO = logging.INFO
+WARNING = logging.WARNING
+ERROR = logging.ERROR
+
+TAG_LEVELS: Dict[str, int] = {
+    # per post / per round
+    "tab": DEBUG,
+    "batch": DEBUG,
+    "scroll": DEBUG,
+    "db": DEBUG,
+    "api": DEBUG,
+    "debug": DEBUG,
+    # something is off
+    "auth": WARNING,
+    "recover": WARNING,
+    "stop": WARNING,
+    "error": ERROR,
+}
+
+_TAG_RE = re.compile(r"\[([a-z][a-z_]*)[\] ]")
+
+_logger = logging.getLogger("syarah")
+_listener: Optional[logging.handlers.QueueListener] = None
+_setup_lock = threading.Lock()
+
+
+class _Sampler:
+    """At most `per_sec` lines per tag per second; counts the rest."""
+
+    def __init__(self, per_sec: int) -> None:
+        self.per_sec = per_sec
+        self._windows: Dict[str, list] = {}
+        self.suppressed: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def allow(self, tag: str) -> bool:
+        if self.per_sec <= 0:
+            return True
+        now = int(time.monotonic())
+        with self._lock:
+            w = self._windows.get(tag)
+            if w is None or w[0] != now:
+                w = self._windows[tag] = [now, 0]
+            if w[1] < self.per_sec:
+                w[1] += 1
+                return True
+            self.suppressed[tag] = self.suppressed.get(tag, 0) + 1
+            return False
+
+    def take_suppressed(self) -> Dict[str, int]:
+        with self._lock:
+            out, self.suppressed = self.suppressed, {}
+        return out
+
+
+_sampler = _Sampler(5)
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        doc: Dict[str, Any] = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname.lower(),
+            "tag": getattr(record, "tag", ""),
+            "msg": record.getMessage(),
+        }
+        fields = getattr(record, "fields", None)
+        if fields:
+            doc.update(fields)
+        return json.dumps(doc, ensure_ascii=False, default=str)
+
+
+class TextFormatter(logging.Formatter):
+    """The old print() format: [YYYY-mm-dd HH:MM:SS] msg (+ k=v fields)."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        ts = datetime.fromtimestamp(record.created).strftime("%Y-%m-%d %H:%M:%S")
+        line = f"[{ts}] {record.getMessage()}"
+        fields = getattr(record, "fields", None)
+        if fields:
+            line += " " + " ".join(f"{k}={v}" for k, v in fields.items())
+        return line
+
+
+class _QueueHandler(logging.handlers.QueueHandler):
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # formatting happens in the listener thread, not here
+        return record
+
+
+def setup_logging(fmt: str = "json", level: str = "info", sample_per_sec: int = 5, summary_sec: float = 60.0) -> None:
+    """(Re)configure the "syarah" logger. log() calls this with the settings on first use."""
+    global _listener
+    with _setup_lock:
+        if _listener is not None:
+            _listener.stop()
+            _listener = None
+
+        out = logging.StreamHandler(sys.stdout)
+        out.setFormatter(TextFormatter() if fmt == "text" else JsonFormatter())
+        q: queue.SimpleQueue = queue.SimpleQueue()
+
+        _logger.handlers = [_QueueHandler(q)]
+        _logger.setLevel(getattr(logging, level.upper(), logging.INFO))
+        _logger.propagate = False
+        _sampler.per_sec = max(0, int(sample_per_sec))
+
+        _listener = logging.handlers.QueueListener(q, out)
+        _listener.start()
+    _start_summary(summary_sec)
+
+
+def _ensure_setup() -> None:
+    if _listener is not None:
+        return
+    try:
+        from .config import get_settings
+
+        s = get_settings()
+        setup_logging(s.log_format, s.log_level, s.log_sample_per_sec, s.log_summary_sec)
+    except Exception:
+        setup_logging()
+
+
+@atexit.register
+def _stop_listener() -> None:
+    global _listener
+    with _setup_lock:
+        if _listener is not None:
+            _listener.stop()
+            _listener = None
+
+
+def log(msg: str, level: Optional[int] = None, **fields: Any) -> None:
+    if _listener is None:
+        _ensure_setup()
+    m = _TAG_RE.search(msg[:40])
+    tag = m.group(1) if m else ""
+    lvl = level if level is not None else TAG_LEVELS.get(tag, INFO)
+    if not _logger.isEnabledFor(lvl):
+        return
+    if lvl <= DEBUG and not _sampler.allow(tag):
+        return
+    _logger.log(lvl, msg, extra={"tag": tag, "fields": fields})
+
+
+# -----------------------------
+# periodic summary
+# -----------------------------
+_summary_fn: Optional[Callable[[], Dict[str, Any]]] = None
+_summary_thread: Optional[threading.Thread] = None
+_summary_every = 60.0
+
+
+def set_summary(fn: Optional[Callable[[], Dict[str, Any]]]) -> None:
+    """fn() -> counters for the periodic "[summary]" line (None = only suppressed-line counts)."""
+    global _summary_fn
+    _summary_fn = fn
+
+
+def _summary_line() -> None:
+    fields: Dict[str, Any] = {}
+    fn = _summary_fn
+    if fn is not None:
+        try:
+            fields.update(fn())
+        except Exception as e:
+            fields["summary_error"] = str(e)
+    suppressed = _sampler.take_suppressed()
+    if suppressed:
+        fields["suppressed"] = suppressed
+    if fields:
+        log("[summary]", **fields)
+
+
+def _start_summary(every_sec: float) -> None:
+    global _summary_thread, _summary_every
+    _summary_every = every_sec
+    if every_sec <= 0 or _summary_thread is not None:
+        return
+
+    def run() -> None:
+        while True:
+            time.sleep(_summary_every)
+            if _summary_every > 0:
+                _summary_line()
+
+    _summary_thread = threading.Thread(target=run, name="log-summary", daemon=True)
+    _summary_thread.start()
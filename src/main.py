@@ -2,24 +2,57 @@ from __future__ import annotations
 
 import asyncio
 import json
+import time
+from dataclasses import asdict, dataclass, field
+from datetime import datetime, timezone
 from typing import Any, Optional
 
 import nodriver as uc
 
 from .config import get_settings
-from .logging_utils import log
-from .mongo import get_collection, already_have, upsert_post
+from .logging_utils import log, set_summary
+from .metrics import (
+    BROWSER_DOM_NODES,
+    BROWSER_HEAP,
+    EMPTY_VISIBLE_ROUNDS,
+    PAGE_REFRESHES,
+    QUEUE_DEPTH,
+    SCROLL_BATCHES,
+    SCROLL_STALLS,
+    WRITE_RATE,
+    start_metrics_server,
+)
+from .mongo import get_collection, known_ids, PostWriter
+from .sweep import MIN_COVERAGE, record_listing_run, stamp_seen, sweep_absent
 
 from .syarah import (
     unwrap_remote,
     wait_for_listing_ready,
     read_total_ads,
     read_visible_cards,
-    abs_url,
+    drain_new_cards,
+    install_card_harvester,
+    prune_harvested_cards,
+    read_page_memory,
     JS_SCROLL_STEP,
+    JS_SCROLL_TO_BOTTOM,
+    partition_urls,
     build_api_session,
-    fetch_post_payloads_requests,
 )
+from .fetcher import make_engine
+from .checkpoint import (
+    Checkpoint,
+    finish_checkpoint,
+    get_state_collection,
+    load_checkpoint,
+    new_run_id,
+    save_checkpoint,
+)
+from .jobs import PENDING, enqueue_jobs, get_jobs_collection, queue_counts
+from .pipeline import CrawlPipeline
+from .tabs import TabPool, visit_new_tab
+from .tracing import discovered, start_profile_watcher, start_tracing, stop_tracing
+from .worker import run_worker
 
 
 async def _get_current_url(page: Any, fallback: str = "") -> str:
@@ -57,23 +90,6 @@ async def _refresh_current_url(page: Any, current_url: str) -> None:
     await page.sleep(1.0)
 
 
-async def _try_open_new_tab(browser: Any, url: str) -> Optional[Any]:
-    """
-    Best-effort only. Some nodriver versions don't support new tabs consistently.
-    Scraping DOES NOT depend on tabs; API is fetched via requests session.
-    """
-    try:
-        if hasattr(browser, "new_tab"):
-            return await browser.new_tab(url)
-    except Exception:
-        pass
-
-    try:
-        return await browser.get(url, new_tab=True)  # type: ignore
-    except Exception:
-        return None
-
-
 def _scroll_info(val: Any) -> dict:
     val = unwrap_remote(val)
     if isinstance(val, dict):
@@ -83,38 +99,351 @@ def _scroll_info(val: Any) -> dict:
     return {}
 
 
-def _details_status(payload: dict) -> Optional[int]:
-    # prefer direct saved code
-    st = payload.get("details_status")
-    if isinstance(st, int):
-        return st
-    # fallback old shape
+@dataclass
+class _Partition:
+    url: str
+    label: str                                   # log prefix, "" when there is only one
+    total: Optional[int] = None
+    cp: Optional[Checkpoint] = None
+    seen: set[int] = field(default_factory=set)  # ids harvested from this partition
+    ok: bool = False
+
+
+async def scrape_once(browser: Any, settings, col: Any, delta: bool = False) -> None:
+    """
+    One crawl (full or delta) into col. The caller owns col and its client: the crawl loops share
+    one for the life of the process instead of connecting per run.
+    """
+    # frontier checkpoints, one per listing URL (saved every CHECKPOINT_EVERY_SEC)
+    # a delta crawl is short and always starts from the top: no checkpoint
+    state_col = get_state_collection(col)
+    checkpointing = settings.checkpoint_every_sec > 0 and not delta
+    run_id = new_run_id()
+    started_at = datetime.now(timezone.utc)
+
+    # ✅ One partition per filter facet (or just TARGET_URL); each gets its own tab + header total
+    # ✅ delta: TARGET_URL sorted newest first, in its own tab (a full crawl may be using the main one)
+    if delta:
+        urls = partition_urls(settings.target_url, [settings.delta_sort] if settings.delta_sort else [])
+        parts = [_Partition(url=urls[0], label="(delta) ")]
+    else:
+        urls = partition_urls(settings.target_url, settings.partitions)
+        parts = [
+            _Partition(url=u, label=(f"[p{i + 1}/{len(urls)}] " if len(urls) > 1 else ""))
+            for i, u in enumerate(urls)
+        ]
+
+    # ✅ Build ONE requests session for the whole run (uses headers/cookies from .env)
+    api_sess = build_api_session(settings)
+    engine = make_engine(api_sess, settings)
+
+    # ✅ Buffered bulk writer; close() in finally does the final flush even on error
+    writer = PostWriter(
+        col, settings.write_batch_size, settings.write_flush_sec, price_history_max=settings.price_history_max
+    )
+    writer.start()
+
+    # ✅ Optional realism tabs: off | pool (reused tabs) | per_post (open + close per post)
+    tab_pool: Optional[TabPool] = None
+    visit = None
+    visit_workers = 1
+    if settings.tab_mode == "pool":
+        tab_pool = TabPool(browser, settings.tab_pool_size)
+        visit = tab_pool.visit
+        visit_workers = tab_pool.size
+    elif settings.tab_mode == "per_post":
+        async def visit(pid: int, url: str) -> None:
+            await visit_new_tab(browser, pid, url)
+
+    # ✅ discovery (one loop per partition) -> dedupe -> fetch workers -> writer, all running at once
+    # ✅ JOB_QUEUE=enqueue: ids go to <collection>_jobs and `python -m src.worker` processes fetch them
+    jobs_col = get_jobs_collection(col) if settings.job_queue == "enqueue" else None
+    if jobs_col is not None:
+        visit = None
+
+    pipe = CrawlPipeline(
+        settings, col, engine, writer, visit=visit, visit_workers=visit_workers, jobs_col=jobs_col
+    )
+    writer.on_written = pipe.mark_written
+
+    # ids handed to the pipeline by any partition (partitions may overlap; each id is fetched once)
+    submitted: set[int] = set()
+
+    pipe.start()
+    if not delta:
+        # process-wide gauges/summary follow the full crawl (a delta run may overlap it)
+        QUEUE_DEPTH.set_function(lambda: {(k,): v for k, v in pipe.depths().items()})
+        set_summary(lambda: _run_summary(pipe, writer, engine, submitted))
+
+    sem = asyncio.Semaphore(settings.partition_concurrency)
+
+    async def run_partition(i: int, part: _Partition) -> None:
+        async with sem:
+            await _crawl_partition(
+                browser, part, i == 0 and not delta, settings, pipe, state_col, checkpointing, run_id, submitted,
+                restore_counters=(len(parts) == 1),
+                stop_after_known=(settings.delta_stop_after_known if delta else 0),
+            )
+
+    ok = False
+    failure: Optional[BaseException] = None
     try:
-        return ((((payload.get("api") or {}).get("details") or {}).get("res") or {}).get("status"))
-    except Exception:
-        return None
+        results = await asyncio.gather(
+            *(run_partition(i, part) for i, part in enumerate(parts)), return_exceptions=True
+        )
+        for part, r in zip(parts, results):
+            if isinstance(r, BaseException):
+                log(f"[syarah] {part.label}partition failed: {r}")
+                failure = failure or r
+
+        log(f"[syarah] discovery done; draining pipeline {pipe.depths()}")
+        await pipe.finish()
+        ok = True
+    finally:
+        if not ok:
+            await pipe.abort()
+        await writer.close()
+        if not delta:
+            QUEUE_DEPTH.set_function(None)
+            set_summary(None)
+        engine.close()
+        api_sess.close()
+        if tab_pool is not None:
+            await tab_pool.close()
+
+        # ✅ ids that kept failing (0/429/5xx after the inline retries) are not lost: retry queue
+        if pipe.retry_ids:
+            await _queue_retries(col, pipe.retry_ids)
+
+        # after writer.close(), so everything flushed counts as done
+        if checkpointing:
+            for part in parts:
+                if part.cp is None:
+                    continue
+                if ok and part.ok:
+                    await asyncio.to_thread(finish_checkpoint, state_col, part.cp.key, part.cp.run_id)
+                else:
+                    _update_checkpoint(part.cp, pipe, writer, part.seen)
+                    await asyncio.to_thread(save_checkpoint, state_col, part.cp)
+                    log(
+                        f"[checkpoint] {part.label}saved for resume run={part.cp.run_id} "
+                        f"done_ids={len(part.cp.done_ids)} scroll_y={part.cp.scroll_y}"
+                    )
+
+        st = pipe.stats
+        w = writer.totals
+        totals = [p.total for p in parts]
+        log(
+            f"[syarah] scrape_once done | mode={'delta' if delta else 'full'} run={run_id} "
+            f"partitions={len(parts)} total_header={totals} "
+            f"processed_unique={len(submitted)} processed={st.processed} fetched={st.fetched} "
+            f"inserted={w['inserted']} updated={w['updated']} unchanged={w['unchanged']} "
+            f"skipped={st.skipped} failed={st.failed} 401s={st.unauthorized} enqueued={st.enqueued} "
+            f"retry_queued={st.retry_queued} http_retries={engine.retries} details_only={engine.details_only} "
+            f"write_errors={w['errors']} "
+            f"rate_limits={engine.rate.limits()}"
+        )
 
+    if failure is not None:
+        raise failure
 
-async def scrape_once(browser: Any, settings) -> None:
-    log(f"[syarah] Opening: {settings.target_url}")
-    page = await browser.get(settings.target_url)
+    # ✅ Listing absence: a complete full crawl counts as a run; then verify posts missing from the last N runs
+    if not delta and settings.absent_after_runs > 0:
+        if _covered(parts):
+            await asyncio.to_thread(
+                record_listing_run, state_col, _run_key(parts, run_id), _run_start(parts, started_at)
+            )
+        else:
+            log(f"[sweep] run {run_id} did not cover the whole listing; not counted for absence")
+        await sweep_absent(col, state_col, settings)
 
-    await wait_for_listing_ready(page)
+    # ✅ No remote workers: work through due retry jobs here (a fresh engine, so the limits start over)
+    if settings.retry_pass and jobs_col is None and not delta:
+        pending = (await asyncio.to_thread(queue_counts, get_jobs_collection(col))).get(PENDING, 0)
+        if pending:
+            log(f"[syarah] retry pass over the retry queue (pending={pending})")
+            await run_worker(settings, once=True, col=col)
 
-    total = await read_total_ads(page)
-    log(f"[syarah] Total ads (from header): {total}")
 
-    col = get_collection(settings.mongo_url, settings.mongo_db, settings.mongo_collection)
+def _covered(parts: list) -> bool:
+    return all(p.ok and (not p.total or len(p.seen) >= MIN_COVERAGE * int(p.total)) for p in parts)
 
-    # ✅ Build ONE requests session for the whole run (uses headers/cookies from .env)
-    api_sess = build_api_session(settings)
 
-    processed_ids: set[int] = set()
-    inserted = 0
-    updated = 0
-    skipped = 0
-    processed = 0
-    unauthorized_hits = 0
+def _run_key(parts: list, run_id: str) -> str:
+    # a resumed run keeps the run id of its checkpoint
+    cp = parts[0].cp if parts else None
+    return cp.run_id if cp is not None else run_id
+
+
+def _run_start(parts: list, started_at: datetime) -> str:
+    """When the run's first lastSeenInListing stamps were written (a resumed run started before this process)."""
+    starts = [started_at]
+    for p in parts:
+        t = p.cp.started_at if p.cp is not None else None
+        if isinstance(t, datetime):
+            starts.append(t if t.tzinfo else t.replace(tzinfo=timezone.utc))
+    return min(starts).isoformat()
+
+
+def _run_summary(pipe: CrawlPipeline, writer: PostWriter, engine: Any, submitted: set[int]) -> dict:
+    """Counters for the periodic [summary] log line (read from the summary thread)."""
+    st, w = pipe.stats, writer.totals
+    return {
+        "processed_unique": len(submitted), "fetched": st.fetched, "inserted": w["inserted"],
+        "updated": w["updated"], "unchanged": w["unchanged"], "skipped": st.skipped, "failed": st.failed,
+        "unauthorized": st.unauthorized, "enqueued": st.enqueued, "http_retries": engine.retries,
+        "posts_per_sec": round(WRITE_RATE.rate(), 2), "queues": pipe.depths(),
+    }
+
+
+async def _queue_retries(col: Any, ids: set[int]) -> None:
+    try:
+        n = await asyncio.to_thread(enqueue_jobs, get_jobs_collection(col), ids)
+        log(f"[jobs] {len(ids)} failed ids queued for retry (new/requeued={n})")
+    except Exception as e:
+        log(f"[jobs] could not queue {len(ids)} failed ids for retry: {e}")
+
+
+async def _crawl_partition(
+    browser: Any,
+    part: _Partition,
+    main_tab: bool,
+    settings,
+    pipe: CrawlPipeline,
+    state_col: Any,
+    checkpointing: bool,
+    run_id: str,
+    submitted: set[int],
+    restore_counters: bool = False,
+    stop_after_known: int = 0,
+) -> None:
+    """
+    Open one listing (main tab for the first partition, a new tab for the others),
+    resume its checkpoint if any, then run discovery on it.
+    """
+    log(f"[syarah] {part.label}Opening: {part.url}")
+    page = await browser.get(part.url) if main_tab else await browser.get(part.url, new_tab=True)
+
+    try:
+        await wait_for_listing_ready(page)
+
+        total = await read_total_ads(page)
+        log(f"[syarah] {part.label}Total ads (from header): {total}")
+
+        # ✅ Resume an unfinished run of this listing
+        cp = None
+        if checkpointing:
+            cp = await asyncio.to_thread(load_checkpoint, state_col, part.url, settings.checkpoint_max_age_hours)
+        if cp is not None:
+            log(
+                f"[checkpoint] {part.label}resuming run={cp.run_id} done_ids={len(cp.done_ids)} "
+                f"scroll_y={cp.scroll_y} total={cp.total}"
+            )
+            if total is None:
+                total = cp.total
+            if restore_counters:
+                _restore_counters(cp, pipe, pipe.writer)
+        else:
+            cp = Checkpoint(key=part.url, run_id=run_id, started_at=datetime.now(timezone.utc))
+        cp.total = total
+        part.cp = cp
+        part.total = total
+
+        # ids already done in the resumed run are never handed out again
+        pipe.done_ids.update(cp.done_ids)
+        part.seen.update(cp.done_ids)
+        submitted.update(cp.done_ids)
+
+        if cp.scroll_y > 0:
+            await _fast_forward(page, cp.scroll_y, track_nodes=settings.prune_dom in ("images", "hollow"))
+
+        await _discover(
+            page, settings, pipe, part.seen, total,
+            cp if checkpointing else None, state_col, submitted=submitted, label=part.label, url=part.url,
+            stop_after_known=stop_after_known,
+        )
+        part.ok = True
+    finally:
+        if not main_tab:
+            try:
+                await page.close()
+            except Exception:
+                pass
+
+
+def _update_checkpoint(cp: Checkpoint, pipe: CrawlPipeline, writer: PostWriter, seen: set[int]) -> None:
+    # only this partition's ids; pipe.done_ids is shared by all partitions
+    cp.done_ids = pipe.done_ids & seen
+    cp.counters = {**asdict(pipe.stats), **{f"w_{k}": v for k, v in writer.totals.items()}}
+
+
+def _restore_counters(cp: Checkpoint, pipe: CrawlPipeline, writer: PostWriter) -> None:
+    # run counters are global, so they are only restored when there is a single partition
+    for k, v in cp.counters.items():
+        if k.startswith("w_"):
+            writer.totals[k[2:]] = v
+        elif hasattr(pipe.stats, k):
+            setattr(pipe.stats, k, v)
+    # ids that were still in flight get handed out (and counted) again
+    pipe.stats.processed = len(cp.done_ids)
+
+
+async def _fast_forward(page: Any, target_y: int, track_nodes: bool = False, max_rounds: int = 2000) -> None:
+    """
+    Resume: jump to the bottom repeatedly (no per-card work) until the infinite scroll
+    has loaded past the checkpointed position. Cards loaded on the way are still picked up
+    by the harvester; ids already done are filtered by discovery.
+    """
+    await install_card_harvester(page, track_nodes)  # observer must be in place before we scroll
+    log(f"[checkpoint] fast-forwarding to y={target_y}")
+
+    last_h = None
+    stalled = 0
+    for _ in range(max_rounds):
+        info = _scroll_info(await page.evaluate(JS_SCROLL_TO_BOTTOM))
+        after_y = info.get("afterY") or 0
+        if after_y >= target_y:
+            break
+
+        h = info.get("h")
+        stalled = stalled + 1 if h == last_h else 0
+        last_h = h
+        if stalled >= 20:
+            log(f"[checkpoint] fast-forward stalled at y={after_y}; continuing from here")
+            break
+        await page.sleep(0.4)
+
+    log("[checkpoint] fast-forward done")
+
+
+async def _discover(
+    page: Any,
+    settings,
+    pipe: CrawlPipeline,
+    processed_ids: set[int],
+    total: Optional[int],
+    cp: Optional[Checkpoint] = None,
+    state_col: Any = None,
+    submitted: Optional[set[int]] = None,
+    label: str = "",
+    url: str = "",
+    stop_after_known: int = 0,
+) -> None:
+    """
+    Discovery stage: scroll + harvest card ids and hand them to the pipeline.
+    Scrolling keeps going while earlier ids are fetched/stored; it only pauses
+    when the pipeline queues are full (backpressure).
+
+    processed_ids = ids seen on this listing (drives the header-total stop);
+    submitted     = ids handed to the pipeline by any partition (each id is submitted once).
+    stop_after_known > 0 (delta crawl, newest first): only ids not in Mongo yet are submitted, and
+    discovery stops once that many ids in a row were already stored.
+    """
+    if submitted is None:
+        submitted = processed_ids
+    url = url or settings.target_url
+    st = pipe.stats
+    w = pipe.writer.totals  # inserted/updated counts are filled in by the writer on each flush
     batch_no = 0
 
     empty_visible_rounds = 0
@@ -122,22 +451,42 @@ async def scrape_once(browser: Any, settings) -> None:
     last_seen_unique = 0
     last_scroll_after = None
 
+    last_checkpoint = time.monotonic()
+
+    # opt-in: hollow out cards we already harvested so the renderer doesn't keep every card forever
+    pruning = settings.prune_dom in ("images", "hollow")
+
+    # metrics label for this listing ("p2/3", "delta", or "main" without partitions)
+    part_label = label.strip(" []()") or "main"
+
+    # delta: consecutive harvested ids that were already stored
+    known_streak = 0
+
     while True:
         batch_no += 1
-        visible_cards = await read_visible_cards(page)
+        SCROLL_BATCHES.inc()
+
+        # ✅ Only the delta since the last read (page-side MutationObserver)
+        drained = await drain_new_cards(page, track_nodes=pruning)
+        if drained is None:
+            fallback = await read_visible_cards(page)
+            drained = (len(fallback), fallback)
+        seen_on_page, new_cards = drained
 
         if batch_no == 1:
-            log(f"[debug] first batch sample: {json.dumps(visible_cards[:3], ensure_ascii=False)}")
+            log(f"[debug] {label}first batch sample: {json.dumps(new_cards[:3], ensure_ascii=False)}")
 
         # -------------------------
         # If nothing visible, wait a bit; if still not done and repeated, refresh current URL
         # -------------------------
-        if not visible_cards:
+        if seen_on_page == 0:
             empty_visible_rounds += 1
-            log(f"[batch {batch_no}] visible=0 (round={empty_visible_rounds}) -> waiting")
+            EMPTY_VISIBLE_ROUNDS.set(empty_visible_rounds, partition=part_label)
+            log(f"{label}[batch {batch_no}] visible=0 (round={empty_visible_rounds}) -> waiting")
 
             if total and len(processed_ids) < int(total) and empty_visible_rounds >= 8:
-                cur_url = await _get_current_url(page, fallback=settings.target_url)
+                cur_url = await _get_current_url(page, fallback=url)
+                PAGE_REFRESHES.inc(reason="empty")
                 await _refresh_current_url(page, cur_url)
                 empty_visible_rounds = 0
                 continue
@@ -145,157 +494,166 @@ async def scrape_once(browser: Any, settings) -> None:
             await page.sleep(1.2)
 
             if empty_visible_rounds >= 20:
-                log("[stop] no cards detected after many retries; exiting this run")
+                log(f"[stop] {label}no cards detected after many retries; exiting this run")
                 break
             continue
 
         empty_visible_rounds = 0
-
-        # compute unprocessed AFTER we have visible cards
-        unprocessed = [c for c in visible_cards if int(c["id"]) not in processed_ids]
+        EMPTY_VISIBLE_ROUNDS.set(0, partition=part_label)
+
+        # ✅ Listing absence: everything harvested this round was seen in the listing (one update_many)
+        if new_cards:
+            try:
+                await asyncio.to_thread(stamp_seen, pipe.col, [int(c["id"]) for c in new_cards])
+            except Exception as e:
+                log(f"[sweep] {label}lastSeenInListing stamp failed: {e}")
+
+        # ✅ delta: which of this batch we already hold (one $in per round)
+        known: set[int] = set()
+        if stop_after_known:
+            batch_ids = [int(c["id"]) for c in new_cards if int(c["id"]) not in processed_ids]
+            known = await asyncio.to_thread(known_ids, pipe.col, batch_ids)
+
+        # ✅ Hand new ids to the pipeline (blocks only if the queues are full)
+        fresh = 0
+        for c in new_cards:
+            pid = int(c["id"])
+            if pid in processed_ids:
+                continue
+            processed_ids.add(pid)
+            fresh += 1
+            if stop_after_known:
+                if pid in known:
+                    known_streak += 1
+                    continue  # refreshing known posts is the full crawl's job
+                known_streak = 0
+            if pid in submitted:
+                continue  # already taken by another partition
+            submitted.add(pid)
+            discovered(pid)
+            await pipe.submit(c)
 
         log(
-            f"[batch {batch_no}] visible={len(visible_cards)} new_unprocessed={len(unprocessed)} "
-            f"processed={processed} inserted={inserted} updated={updated} skipped={skipped}"
+            f"{label}[batch {batch_no}] seen_on_page={seen_on_page} new={fresh} "
+            f"processed={st.processed} inserted={w['inserted']} updated={w['updated']} skipped={st.skipped} "
+            f"queues={pipe.depths()}"
         )
 
-        # -------------------------
-        # If no new cards in view, try scrolling.
-        # If scrolling stalls AND we're not done, refresh current URL.
-        # -------------------------
-        if not unprocessed:
-            info = _scroll_info(await page.evaluate(JS_SCROLL_STEP))
-            after_y = info.get("afterY")
-
-            log(f"[scroll] (no new) y:{info.get('beforeY')}->{after_y} h={info.get('h')}")
-            await page.sleep(settings.scroll_pause_sec)
-
-            # ✅ stop only when all ads scraped
-            if total and len(processed_ids) >= int(total):
-                break
-
-            # "stuck" = afterY not changing AND processed_unique not increasing
-            progressed_scroll = (after_y is not None and after_y != last_scroll_after)
-            progressed_ids = (len(processed_ids) != last_seen_unique)
-
-            if progressed_scroll or progressed_ids:
-                stuck_rounds = 0
-            else:
-                stuck_rounds += 1
-
-            last_scroll_after = after_y
-            last_seen_unique = len(processed_ids)
-
-            # refresh threshold
-            if total and len(processed_ids) < int(total) and stuck_rounds >= 8:
-                cur_url = await _get_current_url(page, fallback=settings.target_url)
-                await _refresh_current_url(page, cur_url)
-                stuck_rounds = 0
-
-            continue
-
-        # ✅ we have new cards to process; reset stall counter
-        stuck_rounds = 0
-
-        # ✅ Process max 16 per view
-        chunk = unprocessed[:16]
-
-        for c in chunk:
-            pid = int(c["id"])
-            href = str(c.get("href") or "")
-            url = abs_url(href)
-
-            processed_ids.add(pid)
-            processed += 1
+        if stop_after_known and known_streak >= stop_after_known:
+            log(
+                f"[syarah] {label}{known_streak} known ids in a row -> caught up "
+                f"(new={len(submitted)} seen={len(processed_ids)})"
+            )
+            break
 
-            # already_have() now returns True only if doc is "good"
-            if already_have(col, pid):
+        # ✅ Keep scrolling while the pipeline works
+        info = _scroll_info(await page.evaluate(JS_SCROLL_STEP))
+        after_y = info.get("afterY")
+        log(f"{label}[scroll] (new={fresh}) y:{info.get('beforeY')}->{after_y} h={info.get('h')}")
+        await page.sleep(settings.scroll_pause_sec)
+
+        if batch_no % 10 == 0:
+            mem = await read_page_memory(page)
+            if mem:
+                BROWSER_HEAP.set(mem["heap"], partition=part_label)
+                BROWSER_DOM_NODES.set(mem["domNodes"], partition=part_label)
+
+        if pruning and batch_no % 10 == 0:
+            pr = await prune_harvested_cards(page, settings.prune_dom, settings.prune_keep_screens)
+            if pr:
                 log(
-                    f"[db] skip good existing id={pid} | "
-                    f"processed={processed} inserted={inserted} updated={updated}"
+                    f"[prune] {label}mode={settings.prune_dom} pruned={pr['pruned']} tracked={pr['tracked']} "
+                    f"dom_nodes={pr['domNodes']} heap={pr['heapBefore'] // 1048576}MB->{pr['heapAfter'] // 1048576}MB"
                 )
-                skipped += 1
-                continue
-
-            # Optional: open tab for realism (not required for API)
-            tab = None
-            if url:
-                tab = await _try_open_new_tab(browser, url)
-                if tab:
-                    log(f"[tab] opened id={pid}")
-                else:
-                    log(f"[tab] open failed (continuing) id={pid}")
-
-            # ✅ Fetch via requests (DevTools headers)
-            payload = fetch_post_payloads_requests(api_sess, settings.api_lang, pid)
-
-            if tab:
-                try:
-                    await tab.close()
-                    log(f"[tab] closed id={pid}")
-                except Exception as e:
-                    log(f"[tab] close error id={pid}: {e}")
-
-            st = _details_status(payload)
-            if st == 401:
-                unauthorized_hits += 1
-                log(f"[auth] 401 for id={pid} (count={unauthorized_hits}). Check Bearer/token/cookie in .env")
-
-            # ✅ Avoid polluting DB with empty results if unauthorized/failed
-            if st in (None, 0, 401):
-                log(f"[api] skip store id={pid} status={st}")
-                continue
 
-            result = upsert_post(col, payload)  # returns inserted/updated/skipped
-            if result == "inserted":
-                inserted += 1
-                log(f"[db] inserted id={pid} | inserted={inserted} updated={updated} processed={processed}")
-            elif result == "updated":
-                updated += 1
-                log(f"[db] updated id={pid} | inserted={inserted} updated={updated} processed={processed}")
-            else:
-                skipped += 1
-                log(f"[db] skipped id={pid} | inserted={inserted} updated={updated} processed={processed}")
-
-        # ✅ Scroll only after processing this chunk
-        if len(chunk) >= 16 or (len(chunk) == len(unprocessed)):
-            info = _scroll_info(await page.evaluate(JS_SCROLL_STEP))
-            log(
-                f"[scroll] (after processing {len(chunk)}) "
-                f"y:{info.get('beforeY')}->{info.get('afterY')} h={info.get('h')}"
-            )
-            await page.sleep(settings.scroll_pause_sec)
-        else:
-            log(f"[hold] still have unprocessed visible cards ({len(unprocessed) - len(chunk)}) -> not scrolling yet")
-            await page.sleep(0.4)
+        # ✅ Persist the frontier now and then (off the event loop)
+        if cp is not None and isinstance(after_y, (int, float)):
+            cp.scroll_y = int(after_y)
+        if cp is not None and time.monotonic() - last_checkpoint >= settings.checkpoint_every_sec:
+            last_checkpoint = time.monotonic()
+            _update_checkpoint(cp, pipe, pipe.writer, processed_ids)
+            await asyncio.to_thread(save_checkpoint, state_col, cp)
+            log(f"[checkpoint] {label}saved run={cp.run_id} done_ids={len(cp.done_ids)} scroll_y={cp.scroll_y}")
 
+        # ✅ stop only when all ads scraped
         if total and len(processed_ids) >= int(total):
-            log(f"[syarah] reached header total (processed_unique={len(processed_ids)} >= {total})")
+            log(f"[syarah] {label}reached header total (processed_unique={len(processed_ids)} >= {total})")
             break
 
-    log(
-        f"[syarah] scrape_once done | total_header={total} "
-        f"processed_unique={len(processed_ids)} processed={processed} "
-        f"inserted={inserted} updated={updated} skipped={skipped} 401s={unauthorized_hits}"
-    )
+        # -------------------------
+        # If scrolling stalls AND we're not done, refresh current URL.
+        # "stuck" = afterY not changing AND processed_unique not increasing
+        # -------------------------
+        progressed_scroll = (after_y is not None and after_y != last_scroll_after)
+        progressed_ids = (len(processed_ids) != last_seen_unique)
+
+        if progressed_scroll or progressed_ids:
+            stuck_rounds = 0
+        else:
+            stuck_rounds += 1
+            SCROLL_STALLS.inc()
+
+        last_scroll_after = after_y
+        last_seen_unique = len(processed_ids)
+
+        # refresh threshold
+        if total and len(processed_ids) < int(total) and stuck_rounds >= 8:
+            cur_url = await _get_current_url(page, fallback=url)
+            PAGE_REFRESHES.inc(reason="stuck")
+            await _refresh_current_url(page, cur_url)
+            stuck_rounds = 0
 
 
 async def main() -> None:
     settings = get_settings()
+    start_metrics_server(settings.metrics_port, settings.metrics_host)
+    start_tracing(settings.trace_file, settings.trace_sample)
+    start_profile_watcher(
+        settings.profile_trigger_file, settings.profile_dir, settings.profile_minutes, settings.profile_interval_ms
+    )
 
     log(f"[boot] Starting browser | headless={settings.headless}")
     browser = await uc.start(headless=settings.headless)
     log("[boot] Browser started")
 
+    # ✅ One Mongo client for the process (every full/delta run, sweep and retry pass reuses it)
+    col = get_collection(settings.mongo_url, settings.mongo_db, settings.mongo_collection)
+
+    try:
+        if settings.delta_interval_min > 0:
+            # full crawl = slow reconciliation; delta runs pick up new listings in between
+            await asyncio.gather(_full_loop(browser, settings, col), _delta_loop(browser, settings, col))
+        else:
+            await _full_loop(browser, settings, col)
+    finally:
+        col.database.client.close()
+        stop_tracing()
+
+
+async def _full_loop(browser: Any, settings, col: Any) -> None:
     while True:
         try:
-            await scrape_once(browser, settings)
+            await scrape_once(browser, settings, col)
         except Exception as e:
             log(f"[error] scrape_once failed: {e}")
+            # the checkpoint was saved; retry soon instead of waiting a full cycle
+            log(f"[sleep] Retrying in {settings.retry_after_error_min} minutes (resumes from checkpoint)...")
+            await asyncio.sleep(settings.retry_after_error_min * 60)
+            continue
 
         log(f"[sleep] Waiting {settings.check_interval_hours} hours before checking again...")
         await asyncio.sleep(settings.check_interval_hours * 3600)
 
 
+async def _delta_loop(browser: Any, settings, col: Any) -> None:
+    while True:
+        try:
+            await scrape_once(browser, settings, col, delta=True)
+        except Exception as e:
+            log(f"[error] delta scrape_once failed: {e}")
+        log(f"[sleep] Next delta crawl in {settings.delta_interval_min:g} minutes")
+        await asyncio.sleep(settings.delta_interval_min * 60)
+
+
 if __name__ == "__main__":
     asyncio.run(main())
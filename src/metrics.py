@@ -0,0 +1,311 @@
+from __future__ import annotations
+
+import bisect
+import os
+import threading
+import time
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Deque, Dict, List, Optional, Sequence, Tuple
+
+from .logging_utils import log
+
+# -----------------------------
+# Minimal in-process metrics registry (Prometheus text exposition format 0.0.4).
+# Counters/gauges/histograms with labels; everything is cheap enough to update on every event.
+# start_metrics_server() serves GET /metrics on METRICS_PORT.
+# -----------------------------
+
+LabelKey = Tuple[str, ...]
+
+# seconds; covers fast local answers up to the slow-API / backoff range
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+def _escape(v: str) -> str:
+    return str(v).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    parts = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _num(v: float) -> str:
+    if v == float("inf"):
+        return "+Inf"
+    return repr(float(v)) if isinstance(v, float) and not v.is_integer() else str(int(v))
+
+
+class _Metric:
+    kind = "untyped"
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = ()) -> None:
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, str]) -> LabelKey:
+        return tuple(str(labels.get(n, "")) for n in self.labelnames)
+
+    def header(self) -> List[str]:
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+
+    def render(self) -> List[str]:
+        # a metric with no samples yet is still listed (HELP/TYPE only); subclasses append theirs
+        return self.header()
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = ()) -> None:
+        super().__init__(name, help, labelnames)
+        self._values: Dict[LabelKey, float] = {}
+
+    def inc(self, value: float = 1.0, **labels: str) -> None:
+        k = self._key(labels)
+        with self._lock:
+            self._values[k] = self._values.get(k, 0.0) + value
+
+    def value(self, **labels: str) -> float:
+        return self._values.get(self._key(labels), 0.0)
+
+    def render(self) -> List[str]:
+        with self._lock:
+            items = sorted(self._values.items())
+        return self.header() + [f"{self.name}{_labels(self.labelnames, k)} {_num(v)}" for k, v in items]
+
+
+class Gauge(_Metric):
+    """set()/inc() values, or a callback evaluated at scrape time (set_function)."""
+
+    kind = "gauge"
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = ()) -> None:
+        super().__init__(name, help, labelnames)
+        self._values: Dict[LabelKey, float] = {}
+        self._fn: Optional[Callable[[], Dict[LabelKey, float]]] = None
+
+    def set(self, value: float, **labels: str) -> None:
+        with self._lock:
+            self._values[self._key(labels)] = float(value)
+
+    def inc(self, value: float = 1.0, **labels: str) -> None:
+        k = self._key(labels)
+        with self._lock:
+            self._values[k] = self._values.get(k, 0.0) + value
+
+    def set_function(self, fn: Optional[Callable[[], Dict[LabelKey, float]]]) -> None:
+        """fn() -> {label values tuple: value}; None removes it (the set() values show again)."""
+        self._fn = fn
+
+    def render(self) -> List[str]:
+        items: Dict[LabelKey, float]
+        if self._fn is not None:
+            try:
+                items = dict(self._fn())
+            except Exception:
+                items = {}
+        else:
+            with self._lock:
+                items = dict(self._values)
+        return self.header() + [f"{self.name}{_labels(self.labelnames, k)} {_num(v)}" for k, v in sorted(items.items())]
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(
+        self, name: str, help: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = LATENCY_BUCKETS
+    ) -> None:
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # label values -> [per-bucket counts..., +Inf count], sum
+        self._counts: Dict[LabelKey, List[int]] = {}
+        self._sums: Dict[LabelKey, float] = {}
+
+    def observe(self, value: float, **labels: str) -> None:
+        k = self._key(labels)
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            counts = self._counts.get(k)
+            if counts is None:
+                counts = self._counts[k] = [0] * (len(self.buckets) + 1)
+            counts[i] += 1
+            self._sums[k] = self._sums.get(k, 0.0) + value
+
+    def render(self) -> List[str]:
+        with self._lock:
+            items = sorted((k, list(c), self._sums[k]) for k, c in self._counts.items())
+        out = self.header()
+        for k, counts, total in items:
+            acc = 0
+            for bound, c in zip((*self.buckets, float("inf")), counts):
+                acc += c
+                le = 'le="' + _num(bound) + '"'
+                out.append(f"{self.name}_bucket{_labels(self.labelnames, k, le)} {acc}")
+            out.append(f"{self.name}_sum{_labels(self.labelnames, k)} {_num(total)}")
+            out.append(f"{self.name}_count{_labels(self.labelnames, k)} {acc}")
+        return out
+
+
+class RateWindow:
+    """Events per second over the last `window_sec` (posts/sec gauges)."""
+
+    def __init__(self, window_sec: float = 60.0) -> None:
+        self.window_sec = window_sec
+        self._events: Deque[Tuple[float, int]] = deque()
+        self._lock = threading.Lock()
+
+    def mark(self, n: int = 1) -> None:
+        now = time.monotonic()
+        with self._lock:
+            self._events.append((now, n))
+            self._trim(now)
+
+    def _trim(self, now: float) -> None:
+        while self._events and now - self._events[0][0] > self.window_sec:
+            self._events.popleft()
+
+    def rate(self) -> float:
+        now = time.monotonic()
+        with self._lock:
+            self._trim(now)
+            return sum(n for _, n in self._events) / self.window_sec
+
+
+class Registry:
+    def __init__(self) -> None:
+        self._metrics: Dict[str, _Metric] = {}
+
+    def _add(self, m: _Metric) -> _Metric:
+        if m.name in self._metrics:
+            raise ValueError(f"metric {m.name} already registered")
+        self._metrics[m.name] = m
+        return m
+
+    def counter(self, name: str, help: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self._add(Counter(name, help, labelnames))  # type: ignore[return-value]
+
+    def gauge(self, name: str, help: str, labelnames: Sequence[str] = ()) -> Gauge:
+        return self._add(Gauge(name, help, labelnames))  # type: ignore[return-value]
+
+    def histogram(
+        self, name: str, help: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = LATENCY_BUCKETS
+    ) -> Histogram:
+        return self._add(Histogram(name, help, labelnames, buckets))  # type: ignore[return-value]
+
+    def render(self) -> str:
+        lines: List[str] = []
+        for m in self._metrics.values():
+            lines += m.render()
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+# -----------------------------
+# The crawler's metrics
+# -----------------------------
+POSTS = REGISTRY.counter(
+    "syarah_posts_total",
+    "Posts by pipeline outcome (processed, skipped, fetched, failed, unauthorized, enqueued).",
+    ("result",),
+)
+DOCS_WRITTEN = REGISTRY.counter(
+    "syarah_docs_written_total", "Docs by bulk write result (inserted, updated, unchanged, errors).", ("result",)
+)
+POSTS_PER_SEC = REGISTRY.gauge("syarah_posts_per_second", "Docs written per second over the last minute.")
+WRITE_RATE = RateWindow(60.0)
+POSTS_PER_SEC.set_function(lambda: {(): WRITE_RATE.rate()})
+
+HTTP_SECONDS = REGISTRY.histogram(
+    "syarah_http_request_seconds", "API GET latency per attempt.", ("endpoint", "status")
+)
+HTTP_RETRIES = REGISTRY.counter("syarah_http_retries_total", "API GETs retried after 0/429/5xx.", ("endpoint",))
+HTTP_LIMIT = REGISTRY.gauge("syarah_http_concurrency_limit", "Adaptive (AIMD) in-flight limit per host.", ("host",))
+
+MONGO_WRITE_SECONDS = REGISTRY.histogram("syarah_mongo_write_seconds", "Duration of one bulk_write batch.")
+MONGO_BATCH_DOCS = REGISTRY.histogram(
+    "syarah_mongo_batch_docs", "Docs per bulk_write batch.", buckets=(1, 10, 25, 50, 100, 250, 500, 1000)
+)
+
+QUEUE_DEPTH = REGISTRY.gauge("syarah_queue_depth", "Items waiting per pipeline queue.", ("queue",))
+
+SCROLL_BATCHES = REGISTRY.counter("syarah_scroll_batches_total", "Discovery rounds (read cards + scroll).")
+SCROLL_STALLS = REGISTRY.counter("syarah_scroll_stalls_total", "Discovery rounds with no scroll and no new ids.")
+LISTING_REMOVED = REGISTRY.counter(
+    "syarah_listing_removed_total", "Posts marked removed by the listing-absence sweep.", ("reason",)
+)
+PAGE_REFRESHES = REGISTRY.counter("syarah_page_refreshes_total", "Listing reloads.", ("reason",))
+EMPTY_VISIBLE_ROUNDS = REGISTRY.gauge(
+    "syarah_empty_visible_rounds", "Consecutive discovery rounds that saw no cards (per partition).", ("partition",)
+)
+BROWSER_HEAP = REGISTRY.gauge("syarah_browser_js_heap_bytes", "Listing tab JS heap in use (CDP JSHeapUsedSize; not images/GPU memory).", ("partition",))
+BROWSER_DOM_NODES = REGISTRY.gauge("syarah_browser_dom_nodes", "DOM nodes in the listing tab (CDP Nodes).", ("partition",))
+
+
+def _rss_bytes() -> Dict[LabelKey, float]:
+    try:
+        with open("/proc/self/statm") as fh:
+            return {(): float(int(fh.read().split()[1]) * os.sysconf("SC_PAGE_SIZE"))}
+    except Exception:
+        return {}
+
+
+PROCESS_RSS = REGISTRY.gauge("syarah_process_resident_bytes", "Crawler process resident memory (Linux).")
+PROCESS_RSS.set_function(_rss_bytes)
+
+
+def record_written(counts: Dict[str, int]) -> None:
+    """PostWriter flush counts -> written counters + posts/sec window."""
+    for k, v in counts.items():
+        if v:
+            DOCS_WRITTEN.inc(v, result=k)
+    WRITE_RATE.mark(counts.get("inserted", 0) + counts.get("updated", 0) + counts.get("unchanged", 0))
+
+
+# -----------------------------
+# HTTP endpoint
+# -----------------------------
+def _handler(registry: Registry):
+    class Handler(BaseHTTPRequestHandler):
+        def log_message(self, *args) -> None:
+            pass
+
+        def do_GET(self) -> None:
+            if self.path.split("?")[0] not in ("/metrics", "/"):
+                self.send_response(404)
+                self.end_headers()
+                return
+            body = registry.render().encode()
+            self.send_response(200)
+            self.send_header("content-type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("content-length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+    return Handler
+
+
+_server: Optional[ThreadingHTTPServer] = None
+
+
+def start_metrics_server(port: int, host: str = "127.0.0.1", registry: Registry = REGISTRY) -> Optional[ThreadingHTTPServer]:
+    """Serve /metrics from a daemon thread (once per process). port <= 0 = off."""
+    global _server
+    if port <= 0 or _server is not None:
+        return _server
+    try:
+        _server = ThreadingHTTPServer((host, port), _handler(registry))
+    except Exception as e:
+        log(f"[metrics] could not listen on {host}:{port}: {e}")
+        return None
+    _server.daemon_threads = True
+    threading.Thread(target=_server.serve_forever, name="metrics", daemon=True).start()
+    log(f"[metrics] serving http://{host}:{port}/metrics")
+    return _server
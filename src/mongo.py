@@ -1,9 +1,18 @@
 from __future__ import annotations
 
-from pymongo import MongoClient, ASCENDING
+import asyncio
+import time
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, Iterable, List, Optional, Set, Tuple
+
+from pymongo import MongoClient, ASCENDING, UpdateOne
 from pymongo.collection import Collection
+from pymongo.errors import BulkWriteError
 
-from .logging_utils import log
+from .extract import ALWAYS_ON
+from .logging_utils import ERROR, WARNING, log
+from .metrics import MONGO_BATCH_DOCS, MONGO_WRITE_SECONDS, record_written
+from .tracing import finished, now_us, record, tracing
 
 
 def get_collection(mongo_url: str, db_name: str, col_name: str) -> Collection:
@@ -20,75 +29,413 @@ def get_collection(mongo_url: str, db_name: str, col_name: str) -> Collection:
     return col
 
 
-def _is_bad_doc(doc: dict | None) -> bool:
+# -----------------------------
+# Freshness policy
+# -----------------------------
+# flat fields that must be present for a doc to count as complete (always on in the extraction spec)
+REQUIRED_FIELDS = ALWAYS_ON
+
+# details call must have succeeded
+GOOD_DETAILS_STATUSES = frozenset({200})
+
+# inspection: some posts simply have no report (404) - that's a real answer, not a failure
+GOOD_INSPECTION_STATUSES = frozenset({200, 404})
+
+# fields needed to judge a stored doc (keep this small; it's read for every batch)
+STATE_PROJECTION = {
+    "_id": 0,
+    "id": 1,
+    "fetchedAt": 1,
+    "details_status": 1,
+    "inspection_status": 1,
+    "inspectionFetchedAt": 1,
+    **{f: 1 for f in REQUIRED_FIELDS},
+    # write-on-change: fingerprints + the prices the next payload is compared with
+    "contentHash": 1,
+    "detailsHash": 1,
+    "price_cash": 1,
+    "price_monthly": 1,
+}
+
+# flat fields tracked in priceHistory
+PRICE_FIELDS = ("price_cash", "price_monthly")
+
+# sentinel: "caller did not look the doc up"
+_UNKNOWN: Any = object()
+
+
+def _parse_ts(v: Any) -> Optional[datetime]:
+    if isinstance(v, datetime):
+        return v if v.tzinfo else v.replace(tzinfo=timezone.utc)
+    if isinstance(v, str) and v.strip():
+        try:
+            dt = datetime.fromisoformat(v.strip().replace("Z", "+00:00"))
+        except ValueError:
+            return None
+        return dt if dt.tzinfo else dt.replace(tzinfo=timezone.utc)
+    return None
+
+
+def refresh_reason(
+    doc: dict | None,
+    max_age_hours: Optional[float] = None,
+    now: Optional[datetime] = None,
+) -> Optional[str]:
     """
-    A doc is 'bad' if we don't have a real API status/body yet.
-    We treat these as repairable and allow updates.
+    Why a stored doc needs a refetch, or None if it's good and fresh.
+
+    "missing"    - no doc
+    "status"     - details/inspection call failed (or legacy `api` shape without statuses)
+    "incomplete" - a REQUIRED_FIELDS value is empty
+    "stale"      - fetchedAt older than max_age_hours (0/None disables the age check)
     """
     if not doc:
-        return True
+        return "missing"
 
-    # Most important signal: details status
-    details = (((doc.get("api") or {}).get("details") or {}).get("res") or {})
-    insp = (((doc.get("api") or {}).get("inspection") or {}).get("res") or {})
+    if doc.get("details_status") not in GOOD_DETAILS_STATUSES:
+        return "status"
+    if doc.get("inspection_status") not in GOOD_INSPECTION_STATUSES:
+        return "status"
 
-    d_status = details.get("status")
-    i_status = insp.get("status")
+    for f in REQUIRED_FIELDS:
+        v = doc.get(f)
+        if v is None or (isinstance(v, str) and not v.strip()):
+            return "incomplete"
 
-    # status missing/null => bad
-    if d_status in (None, 0) and i_status in (None, 0):
-        return True
+    if max_age_hours:
+        fetched = _parse_ts(doc.get("fetchedAt"))
+        if fetched is None:
+            return "stale"
+        now = now or datetime.now(timezone.utc)
+        if (now - fetched).total_seconds() > float(max_age_hours) * 3600:
+            return "stale"
 
-    # if we have neither json nor text, it's bad
-    d_has_payload = bool(details.get("json") is not None or (details.get("text") or "").strip())
-    i_has_payload = bool(insp.get("json") is not None or (insp.get("text") or "").strip())
+    return None
 
-    if not d_has_payload and not i_has_payload:
+
+def needs_inspection(
+    doc: dict | None,
+    refresh_hours: Optional[float] = None,
+    now: Optional[datetime] = None,
+) -> bool:
+    """
+    Lazy inspection: reports practically never change, so a refetch only asks for the inspection
+    when the post is new, its inspection call failed/never happened, or the report is older than
+    refresh_hours (0/None = always fetch it). Docs from before inspectionFetchedAt use fetchedAt.
+    """
+    if not refresh_hours or not doc:
+        return True
+    if doc.get("inspection_status") not in GOOD_INSPECTION_STATUSES:
+        return True
+    fetched = _parse_ts(doc.get("inspectionFetchedAt") or doc.get("fetchedAt"))
+    if fetched is None:
         return True
+    now = now or datetime.now(timezone.utc)
+    return (now - fetched).total_seconds() > float(refresh_hours) * 3600
+
+
+def _is_bad_doc(doc: dict | None, max_age_hours: Optional[float] = None, now: Optional[datetime] = None) -> bool:
+    """
+    A doc is 'bad' if it's missing, failed, incomplete or stale (see refresh_reason).
+    We treat these as repairable and allow updates.
+    """
+    return refresh_reason(doc, max_age_hours, now) is not None
+
+
+def _update_doc(post: dict) -> dict:
+    # drop the legacy raw `api` blob when a doc is rewritten in the flat shape
+    return {"$set": post, "$unset": {"api": ""}}
+
+
+def _price_entry(doc: dict, fields: List[str], at: Any) -> dict:
+    return {"at": at, **{f: doc.get(f) for f in fields}}
+
+
+def _write_op(post: dict, stored: Optional[dict], price_history_max: int = 50) -> Tuple[UpdateOne, bool]:
+    """
+    The write for one payload, given the stored doc (load_existing() projection, None = new).
+    Returns (op, touch_only).
+
+    - fingerprint matches the stored one: only lastSeenAt/fetchedAt move - no $set of the whole doc,
+      a tiny oplog entry
+    - otherwise the payload is $set, and a changed price is appended to priceHistory
+      (capped to the last price_history_max entries; new posts start it with their first price)
+    Either way the stamps are written with $max, so a replay of older records never moves them back
+    (which would make a doc refetched since look stale again).
+    Details-only payloads compare detailsHash and drop the stored contentHash when they change
+    something (it no longer describes the doc).
+    """
+    pid = int(post["id"])
+    seen = post.get("fetchedAt")
+    key = "contentHash" if "contentHash" in post else "detailsHash"
+    fingerprint = post.get(key)
+
+    stamps = {"lastSeenAt": seen, "fetchedAt": seen}
+    if "inspectionFetchedAt" in post:
+        stamps["inspectionFetchedAt"] = post["inspectionFetchedAt"]
+
+    if stored is not None and fingerprint and stored.get(key) == fingerprint:
+        return UpdateOne({"id": pid, key: fingerprint}, {"$max": stamps}), True
+
+    update = _update_doc({k: v for k, v in post.items() if k not in stamps})
+    update["$max"] = stamps
+    if key == "detailsHash":
+        update["$unset"]["contentHash"] = ""
+
+    fields = [f for f in PRICE_FIELDS if f in post]
+    if price_history_max > 0 and fields:
+        entries: List[dict] = []
+        if stored is None:
+            entries.append(_price_entry(post, fields, seen))
+        else:
+            legacy = not stored.get("contentHash") and not stored.get("detailsHash")
+            if legacy and any(stored.get(f) is not None for f in fields):
+                # doc from before fingerprints: it has no history yet, start it with the price it had
+                # (this is its only rewrite without a fingerprint, changed price or not)
+                entries.append(_price_entry(stored, fields, stored.get("fetchedAt")))
+            if any(stored.get(f) != post.get(f) for f in fields):
+                entries.append(_price_entry(post, fields, seen))
+        if entries:
+            update["$push"] = {"priceHistory": {"$each": entries, "$slice": -price_history_max}}
+
+    return UpdateOne({"id": pid}, update, upsert=True), False
 
-    return False
+
+def load_existing(col: Collection, post_ids: Iterable[int]) -> Dict[int, dict]:
+    """
+    One $in round-trip for a whole batch of ids (uses the uniq_id index).
+    Returns {id: projected doc} for the ids we already hold.
+    """
+    ids = sorted({int(x) for x in post_ids})
+    if not ids:
+        return {}
+
+    out: Dict[int, dict] = {}
+    for doc in col.find({"id": {"$in": ids}}, STATE_PROJECTION):
+        try:
+            out[int(doc["id"])] = doc
+        except Exception:
+            continue
+    return out
 
 
-def already_have(col: Collection, post_id: int) -> bool:
+def known_ids(col: Collection, post_ids: Iterable[int]) -> Set[int]:
+    """Ids of the batch we already have a doc for (one $in, id only)."""
+    ids = sorted({int(x) for x in post_ids})
+    if not ids:
+        return set()
+    return {int(d["id"]) for d in col.find({"id": {"$in": ids}}, {"_id": 0, "id": 1})}
+
+
+def good_ids(existing: Dict[int, dict], max_age_hours: Optional[float] = None) -> Set[int]:
+    """Ids from load_existing() whose doc is good and fresh (no refetch needed)."""
+    now = datetime.now(timezone.utc)
+    return {pid for pid, doc in existing.items() if not _is_bad_doc(doc, max_age_hours, now)}
+
+
+def already_have(col: Collection, post_id: int, max_age_hours: Optional[float] = None) -> bool:
     """
     Return True only if we already have a 'good' doc.
     If doc exists but is bad/incomplete, return False so we refetch + repair.
+
+    Single-id version; for batches use load_existing() + good_ids().
     """
-    doc = col.find_one({"id": int(post_id)}, {"_id": 1, "api": 1})
-    return (doc is not None) and (not _is_bad_doc(doc))
+    doc = col.find_one({"id": int(post_id)}, STATE_PROJECTION)
+    return (doc is not None) and (not _is_bad_doc(doc, max_age_hours))
 
 
-def upsert_post(col: Collection, post: dict) -> str:
+def upsert_post(
+    col: Collection,
+    post: dict,
+    existing: Any = _UNKNOWN,
+    max_age_hours: Optional[float] = None,
+    price_history_max: int = 50,
+) -> str:
     """
     Insert or repair.
     Returns one of: "inserted" | "updated" | "skipped"
+    ("skipped" also when the refetched content is unchanged: only lastSeenAt/fetchedAt are touched)
+
+    Pass `existing` (doc from load_existing() or None) to skip the lookup round-trip.
     """
     post_id = int(post.get("id"))
 
-    existing = col.find_one({"id": post_id}, {"_id": 1, "api": 1})
-    if existing is None:
-        # Insert new
-        try:
-            col.insert_one(post)
-            return "inserted"
-        except Exception as e:
-            # In case of race condition, fall through to update logic
-            log(f"[mongo] insert_one warning id={post_id}: {e}")
+    if existing is _UNKNOWN:
+        existing = col.find_one({"id": post_id}, STATE_PROJECTION)
 
     # If existing is good, skip to avoid rewriting
-    if existing is not None and not _is_bad_doc(existing):
+    if existing is not None and not _is_bad_doc(existing, max_age_hours):
         return "skipped"
 
-    # Otherwise, repair/update the doc
-    # We replace key fields but keep Mongo _id.
-    # You can add "$set": post to fully replace, but safer to set known top-level fields.
-    res = col.update_one(
-        {"id": post_id},
-        {"$set": post},
-        upsert=True,
-    )
-
-    # If it upserted due to race: inserted, else updated
-    if res.upserted_id:
+    # Otherwise insert / repair the doc (upsert also covers an insert race)
+    op, touch_only = _write_op(post, existing, price_history_max)
+    res = col.bulk_write([op])
+    if touch_only:
+        return "skipped"
+    if res.upserted_count:
         return "inserted"
     return "updated"
+
+
+class PostWriter:
+    """
+    Buffered writer stage for post payloads.
+
+    put() only buffers; batches are written as unordered bulk_write of
+    UpdateOne(..., upsert=True) when `batch_size` is reached or every `flush_sec`.
+    Docs whose fingerprint matches the stored one are only touched (see _write_op); the
+    stored fingerprints/prices come from one load_existing() per batch.
+    The bulk write runs in a thread so Mongo latency never blocks the crawl loop.
+    Always `await close()` (in a finally) so the last partial batch is written.
+    """
+
+    def __init__(
+        self,
+        col: Collection,
+        batch_size: int = 100,
+        flush_sec: float = 5.0,
+        on_flush: Optional[Callable[[Dict[str, int]], None]] = None,
+        on_written: Optional[Callable[[List[int]], None]] = None,
+        price_history_max: int = 50,
+    ) -> None:
+        self.col = col
+        self.price_history_max = max(0, int(price_history_max))
+        self.batch_size = max(1, int(batch_size))
+        self.flush_sec = max(0.1, float(flush_sec))
+        self.on_flush = on_flush
+        self.on_written = on_written  # ids that made it into Mongo (e.g. for the crawl checkpoint)
+
+        self.totals: Dict[str, int] = {"inserted": 0, "updated": 0, "unchanged": 0, "errors": 0}
+
+        self._buf: Dict[int, dict] = {}  # id -> latest payload (dupes in one batch collapse)
+        self._last_flush = time.monotonic()
+        self._lock = asyncio.Lock()
+        self._bg: Optional[asyncio.Task] = None
+        self._timer: Optional[asyncio.Task] = None
+
+    def __len__(self) -> int:
+        return len(self._buf)
+
+    def start(self) -> None:
+        if self._timer is None:
+            self._timer = asyncio.ensure_future(self._timer_loop())
+
+    async def put(self, post: dict) -> None:
+        self._buf[int(post["id"])] = post
+        if len(self._buf) >= self.batch_size * 4:
+            # Mongo is falling behind: wait for a flush (backpressure to the fetch stage)
+            await self.flush()
+        elif len(self._buf) >= self.batch_size:
+            self._kick()
+
+    def _kick(self) -> None:
+        if self._bg is None or self._bg.done():
+            self._bg = asyncio.ensure_future(self.flush())
+
+    async def _timer_loop(self) -> None:
+        while True:
+            await asyncio.sleep(min(1.0, self.flush_sec))
+            if self._buf and (time.monotonic() - self._last_flush) >= self.flush_sec:
+                self._kick()
+
+    async def flush(self) -> Optional[Dict[str, int]]:
+        async with self._lock:
+            self._last_flush = time.monotonic()
+            if not self._buf:
+                return None
+
+            batch = list(self._buf.values())
+            self._buf = {}
+
+            try:
+                t0 = now_us()
+                counts, failed_ids = await asyncio.to_thread(self.write_batch, batch)
+            except Exception as e:
+                # keep the docs for the next flush (newer payloads for the same id win)
+                log(f"[mongo] bulk_write failed n={len(batch)}: {e} (will retry)", WARNING)
+                for post in batch:
+                    self._buf.setdefault(int(post["id"]), post)
+                return None
+
+            for k, v in counts.items():
+                self.totals[k] = self.totals.get(k, 0) + v
+
+            if tracing():
+                dur = now_us() - t0
+                for p in batch:
+                    pid = int(p["id"])
+                    record(pid, "Mongo write", t0, dur, batch=len(batch), failed=pid in failed_ids)
+                    finished(pid, "write error" if pid in failed_ids else "written")
+
+            log(
+                f"[db] flush n={len(batch)} inserted={counts['inserted']} updated={counts['updated']} "
+                f"unchanged={counts['unchanged']} errors={counts['errors']}"
+            )
+            if self.on_flush:
+                self.on_flush(counts)
+            if self.on_written:
+                self.on_written([int(p["id"]) for p in batch if int(p["id"]) not in failed_ids])
+            return counts
+
+    def write_batch(self, batch: List[dict]) -> Tuple[Dict[str, int], Set[int]]:
+        """
+        Blocking bulk write of one batch.
+        Returns ({inserted, updated, unchanged, errors}, ids that failed to write).
+        """
+        stored = load_existing(self.col, (p["id"] for p in batch))
+        # touches ($max of the stamps) go in their own bulk_write: one modifies nothing when the stored
+        # stamps are already newer (replays), so their modified count can't be told apart from real updates
+        writes: List[Tuple[UpdateOne, dict]] = []
+        touches: List[Tuple[UpdateOne, dict]] = []
+        for p in batch:
+            op, touch_only = _write_op(p, stored.get(int(p["id"])), self.price_history_max)
+            (touches if touch_only else writes).append((op, p))
+
+        t0 = time.monotonic()
+        upserted, matched, modified, failed_ids = self._bulk(writes)
+        _, touched, _, touch_failed = self._bulk(touches)
+        failed_ids |= touch_failed
+
+        MONGO_WRITE_SECONDS.observe(time.monotonic() - t0)
+        MONGO_BATCH_DOCS.observe(len(batch))
+
+        counts = {
+            "inserted": upserted,
+            "updated": modified,
+            "unchanged": (matched - modified) + touched,
+            "errors": len(failed_ids),
+        }
+        record_written(counts)
+        return counts, failed_ids
+
+    def _bulk(self, ops: List[Tuple[UpdateOne, dict]]) -> Tuple[int, int, int, Set[int]]:
+        """Unordered bulk_write of (op, payload) pairs -> (upserted, matched, modified, ids that failed)."""
+        if not ops:
+            return 0, 0, 0, set()
+        try:
+            res = self.col.bulk_write([op for op, _ in ops], ordered=False)
+            return int(res.upserted_count), int(res.matched_count), int(res.modified_count), set()
+        except BulkWriteError as e:
+            d = e.details or {}
+            failed_ids: Set[int] = set()
+            for we in d.get("writeErrors") or []:
+                idx = we.get("index")
+                if isinstance(idx, int) and 0 <= idx < len(ops):
+                    failed_ids.add(int(ops[idx][1]["id"]))
+            log(f"[mongo] bulk_write partial errors={len(failed_ids)}", WARNING)
+            return int(d.get("nUpserted", 0)), int(d.get("nMatched", 0)), int(d.get("nModified", 0)), failed_ids
+
+    async def close(self) -> None:
+        """Stop the timer and write whatever is still buffered."""
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        if self._bg is not None:
+            try:
+                await self._bg
+            except Exception:
+                pass
+        await self.flush()
+        if self._buf:
+            log(f"[mongo] final flush failed; dropped {len(self._buf)} buffered docs", ERROR)
+            self._buf = {}
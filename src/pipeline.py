@@ -0,0 +1,273 @@
+from __future__ import annotations
+
+import asyncio
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Set
+
+from pymongo.collection import Collection
+
+from .fetcher import FetchEngine
+from .jobs import enqueue_jobs
+from .logging_utils import WARNING, log
+from .metrics import POSTS
+from .tracing import finished, now_us, record, span, tracing
+from .mongo import PostWriter, good_ids, load_existing, needs_inspection
+from .ratelimit import is_retryable_status
+from .syarah import abs_url
+
+# how many harvested cards are checked against Mongo in one $in
+DEDUPE_BATCH = 64
+
+_STOP: Any = object()
+
+
+@dataclass
+class CrawlStats:
+    processed: int = 0      # ids handed to the pipeline by discovery
+    skipped: int = 0        # good + fresh docs, no fetch
+    fetched: int = 0        # API fetches completed
+    failed: int = 0         # status 0/None/429/5xx after retries -> not stored
+    unauthorized: int = 0   # 401 -> not stored
+    enqueued: int = 0       # handed to remote workers via the jobs collection
+    retry_queued: int = 0   # still failing after the engine's retries -> retry queue
+
+
+@dataclass
+class PostJob:
+    id: int
+    url: str
+    existing: Optional[dict] = None  # state projection from load_existing (None = new post)
+
+
+def details_status(payload: dict) -> Optional[int]:
+    # prefer direct saved code
+    st = payload.get("details_status")
+    if isinstance(st, int):
+        return st
+    # fallback old shape
+    try:
+        return ((((payload.get("api") or {}).get("details") or {}).get("res") or {}).get("status"))
+    except Exception:
+        return None
+
+
+class CrawlPipeline:
+    """
+    discovery --cards_q--> dedupe --fetch_q--> N fetch workers --> PostWriter
+                                  \--> <collection>_jobs (JOB_QUEUE=enqueue; src.worker fetches)
+
+    Discovery (the scroll loop in main.py) only calls submit(); both queues are bounded,
+    so if fetching/writing falls behind, submit() blocks and scrolling pauses (backpressure).
+    finish() drains everything in order; abort() cancels on error.
+    The writer is owned by the caller (its close() does the final flush).
+    """
+
+    def __init__(
+        self,
+        settings: Any,
+        col: Collection,
+        engine: FetchEngine,
+        writer: PostWriter,
+        visit: Optional[Callable[[int, str], Awaitable[None]]] = None,
+        visit_workers: int = 1,
+        jobs_col: Optional[Collection] = None,
+    ) -> None:
+        self.settings = settings
+        self.col = col
+        self.engine = engine
+        self.writer = writer
+        self.visit = visit  # optional "realism" tab visit, never blocks fetching
+        self.n_visitors = max(1, int(visit_workers))
+
+        # job-queue mode: ids that need a fetch go to <collection>_jobs for src.worker instead
+        self.jobs_col = jobs_col
+
+        qsize = max(1, int(getattr(settings, "pipeline_queue_size", 256)))
+        self.cards_q: asyncio.Queue = asyncio.Queue(maxsize=qsize)
+        self.fetch_q: asyncio.Queue = asyncio.Queue(maxsize=qsize)
+        self.visit_q: asyncio.Queue = asyncio.Queue(maxsize=max(4, visit_workers * 2))
+
+        self.n_workers = engine.concurrency if jobs_col is None else 0
+        self.stats = CrawlStats()
+
+        # ids fully handled (skipped as good, or written by the writer) - what a checkpoint may persist
+        self.done_ids: Set[int] = set()
+        # ids whose fetch kept failing (0/429/5xx) - the caller puts them in the jobs collection
+        self.retry_ids: Set[int] = set()
+        self._tasks: List[asyncio.Task] = []
+        self._dedupe_task: Optional[asyncio.Task] = None
+
+    # -------------------------
+    # lifecycle
+    # -------------------------
+    def start(self) -> None:
+        self._dedupe_task = asyncio.ensure_future(self._dedupe_stage())
+        self._tasks = [self._dedupe_task]
+        self._tasks += [asyncio.ensure_future(self._fetch_worker(i)) for i in range(self.n_workers)]
+        if self.visit is not None:
+            self._tasks += [asyncio.ensure_future(self._visit_worker()) for _ in range(self.n_visitors)]
+
+    async def submit(self, card: Dict[str, Any]) -> None:
+        """Hand one harvested card to the pipeline (blocks while the queues are full)."""
+        if self._dedupe_task is not None and self._dedupe_task.done():
+            raise RuntimeError("crawl pipeline is not running")
+        self.stats.processed += 1
+        POSTS.inc(result="processed")
+        await self.cards_q.put(card)
+
+    async def finish(self) -> None:
+        """No more cards: let every stage drain, then stop."""
+        await self.cards_q.put(_STOP)
+        await asyncio.gather(*self._tasks)
+        self._tasks = []
+
+    async def abort(self) -> None:
+        for t in self._tasks:
+            t.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def mark_written(self, ids: List[int]) -> None:
+        """PostWriter.on_written hook."""
+        self.done_ids.update(ids)
+
+    def depths(self) -> Dict[str, int]:
+        return {"cards": self.cards_q.qsize(), "fetch": self.fetch_q.qsize(), "write": len(self.writer)}
+
+    # -------------------------
+    # stages
+    # -------------------------
+    async def _dedupe_stage(self) -> None:
+        done = False
+        while not done:
+            batch = [await self.cards_q.get()]
+            while len(batch) < DEDUPE_BATCH and not self.cards_q.empty():
+                batch.append(self.cards_q.get_nowait())
+
+            if batch[-1] is _STOP:
+                done = True
+                batch.pop()
+            if not batch:
+                continue
+
+            ids = [int(c["id"]) for c in batch]
+            try:
+                # ✅ One $in lookup per batch (in a thread, so discovery keeps scrolling)
+                t0 = now_us()
+                existing = await asyncio.to_thread(load_existing, self.col, ids)
+                if tracing():
+                    dur = now_us() - t0
+                    for pid in ids:
+                        record(pid, "dedupe check", t0, dur, batch=len(ids), known=pid in existing)
+            except Exception as e:
+                log(f"[dedupe] load_existing failed ({e}); treating {len(ids)} ids as new", WARNING)
+                existing = {}
+            good = good_ids(existing, self.settings.fresh_max_age_hours)
+
+            if self.jobs_col is not None:
+                await self._enqueue(batch, good)
+                continue
+
+            for c in batch:
+                pid = int(c["id"])
+                # only good + fresh docs are skipped; failed/incomplete/stale ones are refetched
+                if pid in good:
+                    self.stats.skipped += 1
+                    POSTS.inc(result="skipped")
+                    self.done_ids.add(pid)
+                    finished(pid, "skipped")
+                    continue
+                await self.fetch_q.put(PostJob(pid, abs_url(str(c.get("href") or "")), existing.get(pid)))
+
+        for _ in range(self.n_workers):
+            await self.fetch_q.put(_STOP)
+        if self.visit is not None:
+            for _ in range(self.n_visitors):
+                await self.visit_q.put(_STOP)
+
+    async def _enqueue(self, batch: List[Dict[str, Any]], good: Set[int]) -> None:
+        todo = [int(c["id"]) for c in batch if int(c["id"]) not in good]
+        skipped = [int(c["id"]) for c in batch if int(c["id"]) in good]
+        self.stats.skipped += len(skipped)
+        POSTS.inc(len(skipped), result="skipped")
+        self.done_ids.update(skipped)
+        for pid in skipped:
+            finished(pid, "skipped")
+        if not todo:
+            return
+        try:
+            await asyncio.to_thread(enqueue_jobs, self.jobs_col, todo)
+        except Exception as e:
+            log(f"[jobs] enqueue failed for {len(todo)} ids: {e}", WARNING)
+            for pid in todo:
+                finished(pid, "enqueue failed")
+            return
+        # durably handed off -> done from discovery's point of view
+        self.stats.enqueued += len(todo)
+        POSTS.inc(len(todo), result="enqueued")
+        self.done_ids.update(todo)
+        for pid in todo:
+            finished(pid, "enqueued")  # the worker process traces the fetch on its own
+
+    async def _fetch_worker(self, n: int) -> None:
+        while True:
+            job = await self.fetch_q.get()
+            if job is _STOP:
+                return
+
+            if self.visit is not None and job.url:
+                try:
+                    self.visit_q.put_nowait((job.id, job.url))
+                except asyncio.QueueFull:
+                    pass  # best effort; never hold up the fetch for a tab
+
+            try:
+                # ✅ lazy inspection: known posts with a good, recent report refresh via the details call only
+                with_inspection = needs_inspection(job.existing, self.settings.inspection_refresh_hours)
+                payload = await self.engine.fetch(job.id, with_inspection)
+                await self._store(job, payload)
+            except Exception as e:
+                self.stats.failed += 1
+                self.stats.retry_queued += 1
+                self.retry_ids.add(job.id)
+                POSTS.inc(result="failed")
+                finished(job.id, "error")
+                log(f"[fetch] worker={n} id={job.id} error: {e}", WARNING)
+
+    async def _store(self, job: PostJob, payload: dict) -> None:
+        self.stats.fetched += 1
+        POSTS.inc(result="fetched")
+        pid = job.id
+
+        st = details_status(payload)
+        if st == 401:
+            self.stats.unauthorized += 1
+            POSTS.inc(result="unauthorized")
+            log(f"[auth] 401 for id={pid} (count={self.stats.unauthorized}). Check Bearer/token/cookie in .env")
+
+        # ✅ Avoid polluting DB with empty results if unauthorized/failed
+        if st == 401 or is_retryable_status(st):
+            if st != 401:
+                self.stats.failed += 1
+                self.stats.retry_queued += 1
+                self.retry_ids.add(pid)
+                POSTS.inc(result="failed")
+            finished(pid, f"not stored ({st})")
+            log(f"[api] skip store id={pid} status={st}")
+            return
+
+        # ✅ Buffered; written by the writer as a bulk batch (size/time triggered)
+        await self.writer.put(payload)
+
+    async def _visit_worker(self) -> None:
+        assert self.visit is not None
+        while True:
+            item = await self.visit_q.get()
+            if item is _STOP:
+                return
+            pid, url = item
+            try:
+                with span(pid, "tab open"):
+                    await self.visit(pid, url)
+            except Exception as e:
+                log(f"[tab] visit error id={pid}: {e}")
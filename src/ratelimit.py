@@ -0,0 +1,142 @@
+from __future__ import annotations
+
+import asyncio
+import random
+import time
+from contextlib import asynccontextmanager
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from typing import AsyncIterator, Dict, Optional
+from urllib.parse import urlsplit
+
+from .logging_utils import log
+
+
+def is_retryable_status(status: Optional[int]) -> bool:
+    """Network error (0), throttled (429) or server error (5xx)."""
+    return status in (None, 0, 429) or (isinstance(status, int) and status >= 500)
+
+
+def parse_retry_after(v: Optional[str]) -> Optional[float]:
+    """Retry-After as seconds (delta-seconds or HTTP date), None if missing/garbage."""
+    if not v:
+        return None
+    v = str(v).strip()
+    try:
+        return max(0.0, float(v))
+    except ValueError:
+        pass
+    try:
+        dt = parsedate_to_datetime(v)
+    except (TypeError, ValueError):
+        return None
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)
+    return max(0.0, (dt - datetime.now(timezone.utc)).total_seconds())
+
+
+def backoff_delay(attempt: int, base: float, cap: float) -> float:
+    """Full-jitter exponential backoff: uniform(0, min(cap, base * 2^attempt))."""
+    return random.uniform(0, min(cap, base * (2 ** attempt)))
+
+
+class HostLimiter:
+    """
+    AIMD concurrency limit for one host.
+
+    success           -> limit += 1/limit (about +1 per round trip of `limit` requests)
+    slow (> slow_sec) -> limit *= 0.9
+    429 / 5xx / error -> limit *= 0.5, and the host is paused for Retry-After if given
+    Decreases happen at most once per `cooldown_sec`, so one burst of parallel failures
+    counts as one congestion signal.
+    """
+
+    def __init__(
+        self,
+        host: str,
+        max_limit: int,
+        min_limit: int = 1,
+        slow_sec: float = 8.0,
+        cooldown_sec: float = 2.0,
+    ) -> None:
+        self.host = host
+        self.max_limit = max(1, int(max_limit))
+        self.min_limit = max(1, min(int(min_limit), self.max_limit))
+        self.limit = float(max(self.min_limit, self.max_limit // 2))
+        self.slow_sec = slow_sec
+        self.cooldown_sec = cooldown_sec
+
+        self.in_flight = 0
+        self._cond = asyncio.Condition()
+        self._last_decrease = 0.0
+        self._pause_until = 0.0
+
+    @asynccontextmanager
+    async def slot(self) -> AsyncIterator[None]:
+        async with self._cond:
+            while True:
+                pause = self._pause_until - time.monotonic()
+                if pause > 0:
+                    self._cond.release()
+                    try:
+                        await asyncio.sleep(pause)
+                    finally:
+                        await self._cond.acquire()
+                    continue
+                if self.in_flight < int(self.limit):
+                    break
+                await self._cond.wait()
+            self.in_flight += 1
+        try:
+            yield
+        finally:
+            async with self._cond:
+                self.in_flight -= 1
+                self._cond.notify_all()
+
+    def record(self, status: Optional[int], latency: float, retry_after: Optional[float] = None) -> None:
+        now = time.monotonic()
+        old = int(self.limit)
+
+        if is_retryable_status(status):
+            if retry_after:
+                self._pause_until = max(self._pause_until, now + retry_after)
+            if now - self._last_decrease >= self.cooldown_sec:
+                self.limit = max(float(self.min_limit), self.limit * 0.5)
+                self._last_decrease = now
+        elif latency > self.slow_sec:
+            if now - self._last_decrease >= self.cooldown_sec:
+                self.limit = max(float(self.min_limit), self.limit * 0.9)
+                self._last_decrease = now
+        else:
+            self.limit = min(float(self.max_limit), self.limit + 1.0 / max(1.0, self.limit))
+
+        if int(self.limit) != old:
+            why = f"status={status}" if is_retryable_status(status) else f"latency={latency:.1f}s"
+            if int(self.limit) < old:
+                log(f"[rate] {self.host} limit {old}->{int(self.limit)} ({why})")
+            # wake waiters when the limit grows
+            asyncio.ensure_future(self._notify())
+
+    async def _notify(self) -> None:
+        async with self._cond:
+            self._cond.notify_all()
+
+
+class RateController:
+    """One HostLimiter per host, created on first use."""
+
+    def __init__(self, max_limit: int, slow_sec: float = 8.0) -> None:
+        self.max_limit = max_limit
+        self.slow_sec = slow_sec
+        self.hosts: Dict[str, HostLimiter] = {}
+
+    def for_url(self, url: str) -> HostLimiter:
+        host = urlsplit(url).netloc or "default"
+        lim = self.hosts.get(host)
+        if lim is None:
+            lim = self.hosts[host] = HostLimiter(host, self.max_limit, slow_sec=self.slow_sec)
+        return lim
+
+    def limits(self) -> Dict[str, int]:
+        return {h: int(lim.limit) for h, lim in self.hosts.items()}
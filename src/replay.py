@@ -0,0 +1,128 @@
+from __future__ import annotations
+
+import argparse
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import Any, Dict, List, Optional, Tuple
+
+from .archive import list_segments, open_index, read_record, read_records
+from .config import get_settings
+from .logging_utils import log
+from .mongo import PostWriter, get_collection
+from .syarah import build_post_payload
+
+# records per process-pool task
+CHUNK = 500
+
+
+# (offset, length, inspection record location when it's in an older record: (path, offset, length))
+Entry = Tuple[int, int, Optional[Tuple[str, int, int]]]
+
+
+def _inspection(rec: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    inspection = rec.get("inspection")
+    if inspection and inspection.get("merged"):
+        return {**(rec.get("details") or {}), "status": inspection.get("status")}
+    return inspection
+
+
+def _replay_chunk(path: str, entries: List[Entry]) -> List[Dict[str, Any]]:
+    """Runs in a pool process: decompress + flatten one chunk of a segment."""
+    out = []
+    locs = {(off, length): insp for off, length, insp in entries}
+    for (off, length), rec in zip(sorted(locs), read_records(path, sorted(locs))):
+        inspection = _inspection(rec)
+        insp_fetched = rec.get("fetchedAt")
+        insp_at = locs[(off, length)]
+        if inspection is None and insp_at is not None:
+            # details-only refresh: the inspection comes from the id's last record that had one
+            irec = read_record(*insp_at)
+            inspection, insp_fetched = _inspection(irec), irec.get("fetchedAt")
+
+        payload = build_post_payload(int(rec["id"]), inspection, rec.get("details") or {})
+        # the data is as old as the fetch, not the replay
+        payload["fetchedAt"] = rec.get("fetchedAt") or payload["fetchedAt"]
+        if "inspectionFetchedAt" in payload:
+            payload["inspectionFetchedAt"] = insp_fetched or payload["fetchedAt"]
+        out.append(payload)
+    return out
+
+
+def _plan(archive_dir: str) -> List[Tuple[str, List[Entry]]]:
+    """(segment path, entries) chunks for the latest record of every id."""
+    paths = dict(list_segments(archive_dir))
+    idx = open_index(archive_dir)
+    try:
+        rows = idx.execute(
+            "SELECT i.segment, i.offset, i.length, j.segment, j.offset, j.length"
+            " FROM idx i LEFT JOIN idx_inspection j ON j.post_id = i.post_id"
+            " ORDER BY i.segment, i.offset"
+        ).fetchall()
+    finally:
+        idx.close()
+
+    by_seg: Dict[int, List[Entry]] = {}
+    for seg, offset, length, iseg, ioffset, ilength in rows:
+        if seg not in paths:
+            continue
+        insp = None
+        if iseg is not None and (iseg, ioffset) != (seg, offset) and iseg in paths:
+            insp = (paths[iseg], int(ioffset), int(ilength))
+        by_seg.setdefault(seg, []).append((int(offset), int(length), insp))
+
+    chunks = []
+    for seg, entries in sorted(by_seg.items()):
+        for i in range(0, len(entries), CHUNK):
+            chunks.append((paths[seg], entries[i:i + CHUNK]))
+    return chunks
+
+
+def replay(archive_dir: str, workers: int, dry_run: bool = False) -> Dict[str, int]:
+    """
+    Rebuild the flat docs from the raw archive with the current flatten_post and upsert them.
+    No network; flattening runs in a process pool, the main process does the bulk writes.
+    """
+    settings = get_settings()
+    chunks = _plan(archive_dir)
+    n_records = sum(len(e) for _, e in chunks)
+    log(f"[replay] {archive_dir}: {n_records} posts in {len(chunks)} chunks, workers={workers} dry_run={dry_run}")
+
+    writer = None
+    if not dry_run:
+        col = get_collection(settings.mongo_url, settings.mongo_db, settings.mongo_collection)
+        writer = PostWriter(col, settings.write_batch_size, price_history_max=settings.price_history_max)
+
+    totals = {"replayed": 0, "inserted": 0, "updated": 0, "unchanged": 0, "errors": 0}
+    t0 = time.time()
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futs = [pool.submit(_replay_chunk, path, entries) for path, entries in chunks]
+        for fut in as_completed(futs):
+            docs = fut.result()
+            totals["replayed"] += len(docs)
+            if writer is not None:
+                for i in range(0, len(docs), writer.batch_size):
+                    counts, _ = writer.write_batch(docs[i:i + writer.batch_size])
+                    for k, v in counts.items():
+                        totals[k] += v
+            log(f"[replay] {totals['replayed']}/{n_records} ({totals['replayed'] / max(0.001, time.time() - t0):.0f}/s)")
+
+    log(f"[replay] done in {time.time() - t0:.1f}s | {totals}")
+    return totals
+
+
+def main() -> None:
+    settings = get_settings()
+    ap = argparse.ArgumentParser(description="Re-flatten archived raw responses into Mongo (no network)")
+    ap.add_argument("--archive", default=settings.archive_dir, help="archive dir (default: ARCHIVE_DIR)")
+    ap.add_argument("--workers", type=int, default=os.cpu_count() or 2, help="flatten processes")
+    ap.add_argument("--dry-run", action="store_true", help="flatten only, don't write")
+    args = ap.parse_args()
+
+    if not args.archive:
+        ap.error("no archive dir (set ARCHIVE_DIR or pass --archive)")
+    replay(args.archive, max(1, args.workers), dry_run=args.dry_run)
+
+
+if __name__ == "__main__":
+    main()
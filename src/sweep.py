@@ -0,0 +1,169 @@
+from __future__ import annotations
+
+import asyncio
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterable, List, Optional
+
+from pymongo import ASCENDING
+from pymongo.collection import Collection
+
+from .fetcher import make_engine
+from .logging_utils import WARNING, log
+from .metrics import LISTING_REMOVED
+from .syarah import build_api_session
+
+# -----------------------------
+# Listing absence
+# - every crawl stamps lastSeenInListing on the ids it harvested (one update_many per discovery round)
+# - each complete full crawl is recorded in <collection>_crawl_state
+# - after a full crawl, ids not seen in the last ABSENT_AFTER_RUNS complete runs are checked against the
+#   details endpoint (details.is_sold / is_deleted, 404/410) and marked `removed` in bulk
+# Active inventory = {"removed": {"$exists": false}}.
+# -----------------------------
+
+# state doc holding the recent complete full runs
+LISTING_RUNS_KEY = "listing_runs"
+
+# a run only counts if every listing was harvested at least this far (vs. its header total)
+MIN_COVERAGE = 0.95
+
+# statuses that mean the post page is gone
+GONE_STATUSES = frozenset({404, 410})
+
+
+def _now_iso() -> str:
+    return datetime.now(timezone.utc).isoformat()
+
+
+def stamp_seen(col: Collection, post_ids: Iterable[int], at: Optional[str] = None) -> int:
+    """
+    One bulk update for a round of harvested ids: lastSeenInListing = at, and a post that shows up
+    again is live again. Ids not stored yet are skipped (their fetchedAt stands in until the next run).
+    """
+    ids = sorted({int(x) for x in post_ids})
+    if not ids:
+        return 0
+    res = col.update_many(
+        {"id": {"$in": ids}},
+        {"$set": {"lastSeenInListing": at or _now_iso()}, "$unset": {"removed": "", "removedAt": ""}},
+    )
+    return int(res.modified_count)
+
+
+def record_listing_run(state_col: Collection, run_id: str, started_at: str, keep: int = 50) -> None:
+    try:
+        state_col.update_one(
+            {"_id": LISTING_RUNS_KEY},
+            {"$push": {"runs": {"$each": [{"runId": run_id, "startedAt": started_at}], "$slice": -keep}}},
+            upsert=True,
+        )
+    except Exception as e:
+        log(f"[sweep] could not record run {run_id}: {e}", WARNING)
+
+
+def absence_cutoff(state_col: Collection, runs: int) -> Optional[str]:
+    """Start of the runs-th most recent complete run (None until that many were recorded)."""
+    doc = state_col.find_one({"_id": LISTING_RUNS_KEY}) or {}
+    recorded = doc.get("runs") or []
+    if runs <= 0 or len(recorded) < runs:
+        return None
+    return str(recorded[-runs]["startedAt"])
+
+
+def absent_ids(col: Collection, cutoff: str, limit: int) -> List[int]:
+    """Live docs last seen in the listing before cutoff (and not already checked since then); limit 0 = all."""
+    query = {
+        "removed": {"$exists": False},
+        "$and": [
+            {"$or": [
+                {"lastSeenInListing": {"$lt": cutoff}},
+                # written before lastSeenInListing existed / never harvested since
+                {"lastSeenInListing": {"$exists": False}, "fetchedAt": {"$lt": cutoff}},
+            ]},
+            {"$or": [{"absenceCheckedAt": {"$exists": False}}, {"absenceCheckedAt": {"$lt": cutoff}}]},
+        ],
+    }
+    return [int(d["id"]) for d in col.find(query, {"_id": 0, "id": 1}, limit=max(0, int(limit)))]
+
+
+def _truthy(v: Any) -> bool:
+    return v not in (None, False, 0, "0", "", "false", "False")
+
+
+def classify(res: Dict[str, Any]) -> Optional[str]:
+    """details response -> "sold" | "deleted" | "listed" (still up) | None (no answer, try next sweep)."""
+    st = res.get("status")
+    if st in GONE_STATUSES:
+        return "deleted"
+    if st != 200:
+        return None
+    data = (res.get("json") or {}).get("data") if isinstance(res.get("json"), dict) else None
+    details = (data or {}).get("details") if isinstance(data, dict) else None
+    details = details if isinstance(details, dict) else {}
+    if _truthy(details.get("is_deleted")):
+        return "deleted"
+    if _truthy(details.get("is_sold")):
+        return "sold"
+    return "listed"
+
+
+def mark_results(col: Collection, results: Dict[int, Optional[str]], at: Optional[str] = None) -> Dict[str, int]:
+    """One update_many per outcome."""
+    at = at or _now_iso()
+    groups: Dict[str, List[int]] = {}
+    for pid, outcome in results.items():
+        if outcome is not None:
+            groups.setdefault(outcome, []).append(pid)
+
+    counts: Dict[str, int] = {}
+    for outcome, ids in groups.items():
+        update: Dict[str, Any] = {"absenceCheckedAt": at}
+        if outcome != "listed":
+            update.update({"removed": outcome, "removedAt": at})
+            LISTING_REMOVED.inc(len(ids), reason=outcome)
+        col.update_many({"id": {"$in": ids}}, {"$set": update})
+        counts[outcome] = len(ids)
+    return counts
+
+
+async def sweep_absent(col: Collection, state_col: Collection, settings) -> Dict[str, int]:
+    """
+    Post-run sweep: verify ids missing from the last ABSENT_AFTER_RUNS complete runs via the details
+    endpoint (FETCH_CONCURRENCY at once, adaptive per-host limit + backoff of the fetch engine).
+    """
+    cutoff = await asyncio.to_thread(absence_cutoff, state_col, settings.absent_after_runs)
+    if cutoff is None:
+        log(f"[sweep] fewer than {settings.absent_after_runs} complete runs recorded; nothing to check yet")
+        return {}
+
+    try:
+        await asyncio.to_thread(col.create_index, [("lastSeenInListing", ASCENDING)], name="last_seen_listing")
+    except Exception as e:
+        log(f"[sweep] create_index warning: {e}")
+
+    ids = await asyncio.to_thread(absent_ids, col, cutoff, settings.absence_sweep_max)
+    if not ids:
+        log(f"[sweep] no posts missing from the listing since {cutoff}")
+        return {}
+    log(f"[sweep] checking {len(ids)} posts not in the listing since {cutoff}")
+
+    sess = build_api_session(settings)
+    engine = make_engine(sess, settings)
+    results: Dict[int, Optional[str]] = {}
+    try:
+        async def check(pid: int) -> None:
+            try:
+                results[pid] = classify(await engine.fetch_details_status(pid))
+            except Exception as e:
+                log(f"[sweep] check failed id={pid}: {e}", WARNING)
+                results[pid] = None
+
+        await asyncio.gather(*(check(pid) for pid in ids))
+    finally:
+        engine.close()
+        sess.close()
+
+    counts = await asyncio.to_thread(mark_results, col, results)
+    counts["unknown"] = sum(1 for v in results.values() if v is None)
+    log(f"[sweep] done checked={len(ids)} {counts} http_retries={engine.retries}")
+    return counts
@@ -2,14 +2,18 @@ from __future__ import annotations
 
 import asyncio
 import json
+import time
+from datetime import datetime, timezone
 from typing import Any, Dict, List, Optional, Tuple
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
 
 import requests
+from nodriver import cdp
+from requests.adapters import HTTPAdapter
 
+from .extract import active_details_fields, active_fields, content_hash, details_hash_names, flatten_post
 from .logging_utils import log
 
-BASE = "https://syarah.com"
-
 SEL_TITLE_AREA = "div.UnbxdTitleArea-module__h1Area"
 SEL_CARDS_CONTAINER = "div.UnbxdCards-module__allCarsResult"
 CARD_ID_PREFIX = "modern-card_post-"
@@ -25,6 +29,17 @@ JS_SCROLL_STEP = """
 """.strip()
 
 
+# jump straight to the bottom (used to fast-forward the infinite scroll when resuming)
+JS_SCROLL_TO_BOTTOM = """
+(() => {
+  const beforeY = window.scrollY;
+  window.scrollTo(0, document.body.scrollHeight);
+  const afterY = window.scrollY;
+  return { beforeY, afterY, h: document.body.scrollHeight };
+})()
+""".strip()
+
+
 def _js_str(s: str) -> str:
     return json.dumps(s)
 
@@ -107,6 +122,141 @@ def js_get_visible_cards() -> str:
 """.strip()
 
 
+# Page-side harvester: a MutationObserver records only newly inserted cards into a buffer,
+# so each read is O(new cards) instead of rescanning the whole (ever growing) list.
+HARVEST_KEY = "__syarahHarvest"
+
+
+def js_install_card_harvester(track_nodes: bool = False) -> str:
+    """
+    track_nodes=True keeps a reference to each harvested card so prune_harvested_cards()
+    can hollow it out later (only enable with DOM pruning; otherwise it pins detached nodes).
+    """
+    return f"""
+(() => {{
+  if (window[{_js_str(HARVEST_KEY)}]) return true;
+
+  const prefix = {json.dumps(CARD_ID_PREFIX)};
+  const re = /^modern-card_post-(\\d+)$/;
+  const st = {{ buf: [], seen: new Set(), pending: new Set(), obs: null, harvested: {"[]" if track_nodes else "null"} }};
+
+  // card div -> [id, href]; cards whose link isn't rendered yet wait in `pending`
+  const take = (el) => {{
+    const m = (el.getAttribute('id') || '').trim().match(re);
+    if (!m) return;
+    const idNum = parseInt(m[1], 10);
+    if (!Number.isFinite(idNum) || st.seen.has(idNum)) return;
+
+    const a = el.querySelector('a[href^="/cardetail/"]');
+    const href = a ? (a.getAttribute('href') || '').trim() : '';
+    if (!href) {{ st.pending.add(el); return; }}
+
+    st.pending.delete(el);
+    st.seen.add(idNum);
+    st.buf.push([idNum, href]);
+    if (st.harvested) st.harvested.push(el);
+  }};
+
+  const scan = (node) => {{
+    if (!node || node.nodeType !== 1) return;
+    if ((node.id || '').startsWith(prefix)) take(node);
+    node.querySelectorAll(`div[id^="${{prefix}}"]`).forEach(take);
+  }};
+
+  scan(document.body);  // cards already on the page
+
+  st.obs = new MutationObserver((muts) => {{
+    for (const m of muts) {{
+      for (const n of m.addedNodes) scan(n);
+    }}
+  }});
+  st.obs.observe(document.body, {{ childList: true, subtree: true }});
+
+  window[{_js_str(HARVEST_KEY)}] = st;
+  return true;
+}})()
+""".strip()
+
+
+def js_drain_cards() -> str:
+    """
+    Returns [seenCount, [[id, href], ...new since last drain]] or null if not installed
+    (fresh page after reload/navigation).
+    """
+    return f"""
+(() => {{
+  const st = window[{_js_str(HARVEST_KEY)}];
+  if (!st) return null;
+
+  for (const el of Array.from(st.pending)) {{
+    if (!el.isConnected) {{ st.pending.delete(el); continue; }}
+    const m = (el.getAttribute('id') || '').trim().match(/^modern-card_post-(\\d+)$/);
+    const a = el.querySelector('a[href^="/cardetail/"]');
+    const href = a ? (a.getAttribute('href') || '').trim() : '';
+    if (!m || !href) continue;
+    st.pending.delete(el);
+    const idNum = parseInt(m[1], 10);
+    if (st.seen.has(idNum)) continue;
+    st.seen.add(idNum);
+    st.buf.push([idNum, href]);
+    if (st.harvested) st.harvested.push(el);
+  }}
+
+  const out = st.buf;
+  st.buf = [];
+  return [st.seen.size, out];
+}})()
+""".strip()
+
+
+PRUNE_MODES = ("off", "images", "hollow")
+
+
+def js_prune_harvested_cards(mode: str, keep_screens: float) -> str:
+    """
+    Free memory held by cards we already harvested and that are far above the viewport.
+
+    images - drop <img> sources (decoded bitmaps are most of the renderer memory)
+    hollow - also remove the card's children
+
+    Each pruned card keeps its measured box size, so document height and the
+    site's lazy-loader offsets don't move.
+    Returns [pruned, stillTracked].
+    """
+    return f"""
+(() => {{
+  const st = window[{_js_str(HARVEST_KEY)}];
+  if (!st || !st.harvested) return null;
+
+  const hollow = {json.dumps(mode == "hollow")};
+  const limit = -window.innerHeight * {float(keep_screens)};
+
+  let pruned = 0;
+  const keep = [];
+  for (const el of st.harvested) {{
+    if (!el.isConnected) continue;
+    const r = el.getBoundingClientRect();
+    if (r.bottom > limit) {{ keep.push(el); continue; }}
+
+    el.style.height = r.height + 'px';
+    el.style.minHeight = r.height + 'px';
+    el.style.overflow = 'hidden';
+    el.style.contain = 'strict';
+
+    for (const img of el.querySelectorAll('img, source')) {{
+      img.removeAttribute('srcset');
+      img.removeAttribute('src');
+    }}
+    if (hollow) el.replaceChildren();
+    pruned++;
+  }}
+  st.harvested = keep;
+
+  return [pruned, keep.length];
+}})()
+""".strip()
+
+
 async def wait_for_listing_ready(page: Any, timeout: float = 60.0) -> None:
     end = asyncio.get_event_loop().time() + timeout
     while True:
@@ -131,52 +281,201 @@ async def read_total_ads(page: Any) -> Optional[int]:
         return None
 
 
+def _parse_card_pairs(raw: Any) -> List[Dict[str, Any]]:
+    """[[id, href], ...] from the page -> [{"id": int, "href": str}, ...]"""
+    if not isinstance(raw, list):
+        return []
+
+    out: List[Dict[str, Any]] = []
+    for item in raw:
+        if isinstance(item, (list, tuple)) and len(item) >= 2:
+            pid, href = item[0], item[1]
+            if isinstance(pid, (int, float)) and str(href or "").strip():
+                out.append({"id": int(pid), "href": str(href)})
+    return out
+
+
 async def read_visible_cards(page: Any) -> List[Dict[str, Any]]:
+    """
+    Full rescan of every card in the page (O(total cards)).
+    The crawl uses drain_new_cards(); this is the fallback.
+    """
     try:
-        raw = unwrap_remote(await page.evaluate(js_get_visible_cards()))
-        if not isinstance(raw, list):
-            return []
-
-        out: List[Dict[str, Any]] = []
-        for item in raw:
-            if isinstance(item, (list, tuple)) and len(item) >= 2:
-                pid, href = item[0], item[1]
-                if isinstance(pid, (int, float)) and str(href or "").strip():
-                    out.append({"id": int(pid), "href": str(href)})
-        return out
+        return _parse_card_pairs(unwrap_remote(await page.evaluate(js_get_visible_cards())))
     except Exception as e:
         log(f"[cards] evaluate error: {e}")
         return []
 
 
+async def drain_new_cards(page: Any, track_nodes: bool = False) -> Optional[Tuple[int, List[Dict[str, Any]]]]:
+    """
+    Cards inserted since the last drain, as (seen_on_page, new_cards).
+    Installs the page-side observer on first use / after a reload.
+    Returns None if the observer can't be installed (caller falls back to read_visible_cards).
+    """
+    for _ in range(2):
+        try:
+            raw = unwrap_remote(await page.evaluate(js_drain_cards()))
+        except Exception as e:
+            log(f"[cards] drain error: {e}")
+            return None
+
+        if isinstance(raw, list) and len(raw) >= 2:
+            seen = raw[0] if isinstance(raw[0], (int, float)) else 0
+            return int(seen), _parse_card_pairs(raw[1])
+
+        # not installed yet (first call or page reloaded)
+        if not await install_card_harvester(page, track_nodes):
+            return None
+
+    return None
+
+
+async def install_card_harvester(page: Any, track_nodes: bool = False) -> bool:
+    """Install the page-side observer (no-op if already there). Nothing is drained."""
+    try:
+        await page.evaluate(js_install_card_harvester(track_nodes))
+        return True
+    except Exception as e:
+        log(f"[cards] observer install error: {e}")
+        return False
+
+
+async def prune_harvested_cards(page: Any, mode: str, keep_screens: float = 3.0) -> Optional[Dict[str, int]]:
+    """
+    Hollow out harvested cards (see js_prune_harvested_cards).
+    Returns {pruned, tracked, heapBefore, heapAfter, domNodes} or None (off / not installed);
+    heap/domNodes from read_page_memory (-1 if unavailable).
+    heapAfter is measured before GC runs, so the drop usually shows up on the next call.
+    """
+    if mode not in PRUNE_MODES or mode == "off":
+        return None
+    before = await read_page_memory(page) or {}
+    try:
+        raw = unwrap_remote(await page.evaluate(js_prune_harvested_cards(mode, keep_screens)))
+    except Exception as e:
+        log(f"[prune] evaluate error: {e}")
+        return None
+
+    if not isinstance(raw, list) or len(raw) < 2:
+        return None
+    after = await read_page_memory(page) or {}
+
+    out = {k: int(v) if isinstance(v, (int, float)) else -1 for k, v in zip(("pruned", "tracked"), raw)}
+    out.update(
+        heapBefore=before.get("heap", -1), heapAfter=after.get("heap", -1), domNodes=after.get("domNodes", -1)
+    )
+    return out
+
+
+async def read_page_memory(page: Any) -> Optional[Dict[str, int]]:
+    """
+    {heap, domNodes} of the page from CDP Performance.getMetrics (JSHeapUsedSize, Nodes), or None.
+    Only the JS heap and the DOM node count: decoded images, GPU and other renderer memory are not
+    in these numbers (image pruning mostly frees the latter).
+    """
+    try:
+        await page.send(cdp.performance.enable())
+        metrics = await page.send(cdp.performance.get_metrics())
+    except Exception as e:
+        log(f"[metrics] page memory error: {e}")
+        return None
+    m = {x.name: x.value for x in metrics or []}
+    if "JSHeapUsedSize" not in m:
+        return None
+    return {"heap": int(m["JSHeapUsedSize"]), "domNodes": int(m.get("Nodes", 0))}
+
+
 def abs_url(href: str) -> str:
+    """Card hrefs are site-relative: resolve them against the same origin as the API (SYARAH_API_BASE)."""
     if not href:
         return ""
     if href.startswith("http"):
         return href
-    return BASE + href
+    return api_origin() + href
+
+
+def partition_urls(target_url: str, partitions: List[str]) -> List[str]:
+    """
+    One listing URL per filter partition: each partition's query params
+    (e.g. "year_from=2020&year_to=2024") override/extend the target URL's.
+    No partitions -> just the target URL.
+    """
+    if not partitions:
+        return [target_url]
+
+    parts = urlsplit(target_url)
+    base_q = parse_qsl(parts.query, keep_blank_values=True)
+
+    out: List[str] = []
+    for p in partitions:
+        pq = parse_qsl(p.strip().lstrip("?&"), keep_blank_values=True)
+        keys = {k for k, _ in pq}
+        q = [kv for kv in base_q if kv[0] not in keys] + pq
+        u = urlunsplit(parts._replace(query=urlencode(q)))
+        if u not in out:
+            out.append(u)
+    return out
 
 
 # -----------------------------
 # API URLs + requests session
 # -----------------------------
-def build_api_urls(lang: str, post_id: int) -> Tuple[str, str]:
-    base = f"https://syarah.com/api/syarah_v1/{lang}/post/view-online"
+# everything the web app asks for on a product page (the old fixed include list)
+API_INCLUDES_FULL = (
+    "details", "price", "story", "quality", "meta", "analytics", "campaign", "g4Data", "options",
+    "featuredImage", "gallery_section", "gallery", "fuel", "faqs", "footerdetails", "footer",
+)
+
+
+# site origin for API calls + referers (SYARAH_API_BASE, read once)
+_api_origin: Optional[str] = None
+
+
+def api_origin() -> str:
+    global _api_origin
+    if _api_origin is None:
+        from .config import get_settings
+
+        _api_origin = get_settings().api_base
+    return _api_origin
+
+
+def _api_base(lang: str) -> str:
+    return f"{api_origin()}/api/syarah_v1/{lang}/post/view-online"
+
+
+def build_api_urls(lang: str, post_id: int, includes: Optional[List[str]] = None) -> Tuple[str, str]:
+    """(inspection URL, details URL); includes = details include list (default: the full one)."""
+    base = _api_base(lang)
     u1 = f"{base}?id={post_id}&thumb_size=300&device_type=web&include=inspection"
     u2 = (
         f"{base}?id={post_id}&thumb_size=300&device_type=web&should_redirect=1&include="
-        "details,price,story,quality,meta,analytics,campaign,g4Data,options,featuredImage,"
-        "gallery_section,gallery,fuel,faqs,footerdetails,footer"
+        + ",".join(includes or API_INCLUDES_FULL)
     )
     return u1, u2
 
 
+def build_merged_api_url(lang: str, post_id: int, includes: List[str]) -> str:
+    """One call for both: inspection merged into the details include list."""
+    return (
+        f"{_api_base(lang)}?id={post_id}&thumb_size=300&device_type=web&should_redirect=1&include="
+        + ",".join(["inspection", *[x for x in includes if x != "inspection"]])
+    )
+
+
 def build_api_session(settings) -> requests.Session:
     """
     Build a requests session that matches DevTools as closely as we can.
     """
     s = requests.Session()
 
+    # connection pool big enough for the concurrent fetch engine (2 GETs per post)
+    pool_size = max(10, int(getattr(settings, "fetch_concurrency", 8) or 8) * 2)
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    s.mount("https://", adapter)
+    s.mount("http://", adapter)
+
     headers = {
         "accept": "application/json",
         "device": settings.device or "web",
@@ -202,332 +501,52 @@ def build_api_session(settings) -> requests.Session:
     return s
 
 
-def _req_get_json_or_text(sess: requests.Session, url: str, referer: str) -> Dict[str, Any]:
-    try:
-        r = sess.get(url, headers={"referer": referer}, timeout=30)
-        ct = r.headers.get("content-type", "")
-        text = r.text or ""
-
-        parsed = None
-        if "application/json" in ct.lower():
-            try:
-                parsed = r.json()
-            except Exception:
-                parsed = None
-
-        return {
-            "ok": bool(r.ok),
-            "status": int(r.status_code),
-            "url": url,
-            "contentType": ct,
-            "json": parsed,
-            "text": None if parsed is not None else text,
-            "textLen": len(text),
-        }
-    except Exception as e:
-        return {
-            "ok": False,
-            "status": 0,
-            "url": url,
-            "contentType": "",
-            "json": None,
-            "text": None,
-            "textLen": 0,
-            "error": str(e),
-        }
-
-
-# -----------------------------
-# Helpers for flattening
-# -----------------------------
-def _dig(obj: Any, path: str) -> Any:
-    """Navigate nested dict/list by dot-separated path."""
-    if obj is None:
-        return None
-    keys = path.split(".")
-    for key in keys:
-        if isinstance(obj, dict):
-            obj = obj.get(key)
-        elif isinstance(obj, list) and key.isdigit():
-            idx = int(key)
-            obj = obj[idx] if 0 <= idx < len(obj) else None
-        else:
-            return None
-        if obj is None:
-            return None
-    return obj
-
-
-def _first_str(*vals: Any) -> Optional[str]:
-    for v in vals:
-        if isinstance(v, str) and v.strip():
-            return v.strip()
-    return None
-
-
-def _first_num(*vals: Any) -> Optional[float]:
-    for v in vals:
-        if isinstance(v, (int, float)):
-            return v
-        if isinstance(v, str):
-            vv = "".join(ch for ch in v if ch.isdigit() or ch == ".")
-            if vv:
-                try:
-                    return float(vv) if "." in vv else int(vv)
-                except Exception:
-                    pass
-    return None
-
-
-def _slug_en(s: Optional[str]) -> str:
-    s = (s or "").strip().lower()
-    out = []
-    prev_us = False
-    for ch in s:
-        if ch.isalnum():
-            out.append(ch)
-            prev_us = False
-        else:
-            if not prev_us:
-                out.append("_")
-                prev_us = True
-    key = "".join(out).strip("_")
-    return key or "unknown"
-
-
-def flatten_inspection_kv(categories: Any) -> Dict[str, Dict[str, Any]]:
-    """
-    Input: car_report list (categories)
-    Output:
-      { "engine": { "الصوفة الامامية": "جيد", ... }, ... }
-    """
-    if not isinstance(categories, list):
-        return {}
-
-    out: Dict[str, Dict[str, Any]] = {}
-    used = set()
-
-    for cat in categories:
-        if not isinstance(cat, dict):
-            continue
-
-        key = _slug_en(cat.get("category_name_en"))
-        base = key
-        i = 2
-        while key in used:
-            key = f"{base}_{i}"
-            i += 1
-        used.add(key)
-
-        subs = cat.get("sub") or []
-        if not isinstance(subs, list):
-            subs = []
-
-        kv: Dict[str, Any] = {}
-        for s in subs:
-            if not isinstance(s, dict):
-                continue
-            name = (s.get("name") or "").strip()
-            if not name:
-                continue
-            kv[name] = s.get("rate")  # store rate text only
-        out[key] = kv
-
-    return out
+def _response_dict(r: requests.Response, url: str) -> Dict[str, Any]:
+    """Our small response shape (JSON parsed when the content-type says so)."""
+    ct = r.headers.get("content-type", "")
+    text = r.text or ""
 
+    parsed = None
+    t0 = time.perf_counter()
+    if "application/json" in ct.lower():
+        try:
+            parsed = r.json()
+        except Exception:
+            parsed = None
+    parse_sec = time.perf_counter() - t0
 
-def flatten_post(inspection_json: dict, details_json: dict) -> dict:
-    """
-    Flatten the Syarah API responses into a searchable structure.
-    """
-    ins_data = _dig(inspection_json, "data.inspection") or {}
-    det_data = _dig(details_json, "data") or {}
+    return {
+        "ok": bool(r.ok),
+        "status": int(r.status_code),
+        "url": url,
+        "contentType": ct,
+        "json": parsed,
+        "text": None if parsed is not None else text,
+        "textLen": len(text),
+        "retryAfter": r.headers.get("retry-after"),
+        "parseSec": parse_sec,
+    }
 
-    flat: Dict[str, Any] = {}
 
-    # ========== BASIC IDENTITY ==========
-    flat["post_id"] = _first_num(
-        _dig(det_data, "details.id"),
-        # _dig(details_json, "id"),
-        # _dig(inspection_json, "id"),
-    )
+def _error_dict(url: str, e: Exception) -> Dict[str, Any]:
+    return {
+        "ok": False,
+        "status": 0,
+        "url": url,
+        "contentType": "",
+        "json": None,
+        "text": None,
+        "textLen": 0,
+        "error": str(e),
+    }
 
-    flat["title"] = _first_str(
-        _dig(det_data, "details.title"),
-        _dig(det_data, "meta.title"),
-    )
 
-    # ========== VEHICLE SPECS ==========
-    details_card = _dig(det_data, "details.details_card") or {}
-
-    flat["brand"] = _first_str(_dig(details_card, "make.name"), _dig(details_card, "make.altName"))
-    flat["model"] = _first_str(_dig(details_card, "model.name"), _dig(details_card, "model.altName"))
-    flat["trim"] = _first_str(_dig(details_card, "extension.name"), _dig(details_card, "extension.altName"))
-
-    flat["year"] = _first_num(_dig(details_card, "years.id"), _dig(details_card, "years.name"))
-    flat["mileage_km"] = _first_num(_dig(details_card, "milage.id"), _dig(details_card, "milage.name"))
-
-    # ========== LOCATION & ORIGIN ==========
-    flat["city"] = _first_str(_dig(det_data, "g4Data.post_city"))
-    flat["origin"] = _first_str(_dig(details_card, "car_origin.name"))
-
-    # ========== MECHANICAL ==========
-    flat["fuel_type"] = _first_str(_dig(details_card, "fuel_types.name"), _dig(det_data, "fuel.fuel_type"))
-    flat["transmission"] = _first_str(_dig(details_card, "transmission_type.name"))
-    flat["engine_size"] = _first_str(_dig(details_card, "engine_size.name"))
-
-    flat["cylinders"] = _first_num(_dig(details_card, "cylinders.id"), _dig(details_card, "cylinders.name"))
-    flat["horse_power"] = _first_num(_dig(details_card, "horse_power.id"), _dig(details_card, "horse_power.name"))
-    flat["drivetrain"] = _first_str(_dig(details_card, "drivetrain_type.name"))
-    flat["engine_type"] = _first_str(_dig(details_card, "engine_type.name"))
-
-    flat["fuel_tank_liters"] = _first_num(_dig(details_card, "fuel_tank.id"), _dig(details_card, "fuel_tank.name"))
-    flat["fuel_economy_kml"] = _first_num(_dig(det_data, "fuel.fuel_economy"))
-
-    # ========== PHYSICAL ==========
-    # flat["exterior_color"] = _first_str(_dig(details_card, "exterior_color.name"))
-    # flat["exterior_color_code"] = _first_str(_dig(details_card, "exterior_color.code"))
-    # flat["interior_color"] = _first_str(_dig(details_card, "interior_color.name"))
-    # flat["interior_color_code"] = _first_str(_dig(details_card, "interior_color.code"))
-
-    # flat["doors"] = _first_num(_dig(details_card, "doors.id"), _dig(details_card, "doors.name"))
-    flat["seats"] = _first_num(_dig(details_card, "seats.id"), _dig(details_card, "seats.name"))
-    # flat["number_of_keys"] = _first_num(_dig(details_card, "number_of_keys.id"), _dig(details_card, "number_of_keys.name"))
-
-    # ========== CONDITION ==========
-    # flat["condition"] = _first_str(_dig(details_card, "is_new.name"), _dig(details_card, "is_new.altName"))
-    # flat["is_preowned"] = _dig(det_data, "details.is_preowned")
-    # flat["is_test"] = _dig(det_data, "details.is_test")
-
-    # ========== PRICING ==========
-    price_data = _dig(det_data, "price") or {}
-    flat["price_cash"] = _first_num(_dig(price_data, "vat_price.text"), _dig(det_data, "analytics.price"))
-    flat["price_monthly"] = _first_num(_dig(price_data, "finance_price.text"))
-    # flat["currency"] = _first_str(_dig(price_data, "currency"))
-
-    # flat["first_payment"] = _first_num(_dig(price_data, "finance_price.first_payment"))
-    # flat["last_payment"] = _first_num(_dig(price_data, "finance_price.last_payment"))
-    # flat["installment_period"] = _first_num(_dig(price_data, "finance_price.installment_period"))
-
-    # ========== INSPECTION (FLAT + KV) ==========
-    # flat["inspection_date"] = _first_str(_dig(ins_data, "report_date"))
-    flat["chassis_number"] = _first_str(_dig(ins_data, "chassis_number"))
-    flat["plate_number"] = _first_str(_dig(ins_data, "plate_number"))
-
-    car_report = _dig(ins_data, "car_report") or []
-    # flat["inspection_categories_count"] = len(car_report) if isinstance(car_report, list) else 0
-
-    total_points = 0
-    if isinstance(car_report, list):
-        for category in car_report:
-            if isinstance(category, dict):
-                sub = category.get("sub", [])
-                total_points += len(sub) if isinstance(sub, list) else 0
-    # flat["inspection_points_total"] = total_points
-
-    # ✅ the format you asked for
-    # flat["inspection_kv"] = flatten_inspection_kv(car_report)
-
-    # ========== BODY DAMAGE ==========
-    external_body = _dig(ins_data, "external_body") or {}
-    body_sub = _dig(external_body, "sub") or []
-    # flat["body_issues_count"] = _first_num(_dig(external_body, "category_countertext")) or 0
-
-    flat["body_is_clear"] = False
-    if isinstance(body_sub, list) and body_sub:
-        first_item = body_sub[0]
-        if isinstance(first_item, dict):
-            flat["body_is_clear"] = first_item.get("body_is_clear") == 1
-
-    body_report = _dig(ins_data, "body_report") or []
-    body_damages: List[str] = []
-    if isinstance(body_report, list):
-        for item in body_report:
-            if isinstance(item, dict) and item.get("image_info"):
-                img_info = item["image_info"]
-                if isinstance(img_info, dict):
-                    note = img_info.get("note", "")
-                    if isinstance(note, str) and note.strip():
-                        body_damages.append(note.strip())
-    # flat["body_damage_notes"] = body_damages
-
-    # ========== IMAGES ==========
-    gallery = _dig(det_data, "gallery.images") or []
-    images: List[Dict[str, Any]] = []
-    featured_url: Optional[str] = None
-    if isinstance(gallery, list):
-        for img in gallery:
-            if not isinstance(img, dict):
-                continue
-            url = img.get("img_url")
-            if isinstance(url, str) and url:
-                images.append(url)
-                if img.get("is_featured") == 1 and not featured_url:
-                    featured_url = url
-
-    seen = set()
-    uniq_urls: List[str] = []
-    for u in images:
-        if u in seen:
-            continue
-        seen.add(u)
-        uniq_urls.append(u)
-    flat["images"] = uniq_urls[:30]     # list[str]
-    # flat["images_count"] = len(uniq_urls)
-
-    flat["featured_image"] = featured_url or (uniq_urls[0] if uniq_urls else None)
-
-    # flat["has_360_spin"] = bool(_dig(det_data, "gallery.has_spin") or False)
-    # flat["has_video"] = bool(_dig(det_data, "gallery.has_video") or False)
-
-    # ========== FEATURES ==========
-    options = _dig(det_data, "options.options") or []
-    all_features: List[str] = []
-    features_by_category: Dict[str, List[str]] = {}
-
-    if isinstance(options, list):
-        for category in options:
-            if isinstance(category, dict):
-                cat_name = category.get("category")
-                cat_data = category.get("data", [])
-                if isinstance(cat_data, list):
-                    feature_names = [f.get("name") for f in cat_data if isinstance(f, dict) and f.get("name")]
-                else:
-                    feature_names = []
-                all_features.extend(feature_names)
-                if cat_name:
-                    features_by_category[str(cat_name)] = feature_names
-
-    # flat["features"] = all_features
-    # flat["features_count"] = len(all_features)
-    # flat["features_by_category"] = features_by_category
-
-    # ========== LISTING INFO ==========
-    flat["share_link"] = _first_str(_dig(det_data, "details.share_link"))
-    # flat["product_url"] = _first_str(_dig(det_data, "details.product_url"))
-
-    # flat["is_sold"] = _dig(det_data, "details.is_sold")
-    # flat["is_deleted"] = _dig(det_data, "details.is_deleted")
-    # flat["owned_by_us"] = _dig(det_data, "details.owned_by_us")
-
-    # flat["list_date"] = _first_str(_dig(det_data, "g4Data.list_date"))
-    # flat["lot_age_days"] = _first_num(_dig(det_data, "g4Data.lot_age"))
-
-    # ========== CAMPAIGN/OFFERS ==========
-    campaigns = _dig(det_data, "details.campaigns") or {}
-    # flat["has_cash_campaign"] = bool(_dig(campaigns, "cash"))
-    # flat["has_finance_campaign"] = bool(_dig(campaigns, "finance"))
-    cash_campaign = _dig(campaigns, "cash") or {}
-    # flat["campaign_text"] = _first_str(_dig(cash_campaign, "text"))
-
-    # ========== TAGS ==========
-    tags = _dig(det_data, "details.tags") or []
-    if isinstance(tags, list):
-        flat["tags"] = [t.get("tag_name") for t in tags if isinstance(t, dict) and t.get("tag_name")]
-    else:
-        flat["tags"] = []
-
-    return flat
+def _req_get_json_or_text(sess: requests.Session, url: str, referer: str) -> Dict[str, Any]:
+    try:
+        r = sess.get(url, headers={"referer": referer}, timeout=30)
+        return _response_dict(r, url)
+    except Exception as e:
+        return _error_dict(url, e)
 
 
 # -----------------------------
@@ -568,23 +587,39 @@ def flatten_post(inspection_json: dict, details_json: dict) -> dict:
 #     }
 
 
-def fetch_post_payloads_requests(sess: requests.Session, lang: str, post_id: int) -> Dict[str, Any]:
-    u1, u2 = build_api_urls(lang, post_id)
-    referer = f"https://syarah.com/{lang}/cardetail/used-{post_id}"
+def api_referer(lang: str, post_id: int) -> str:
+    # best effort referer (slug doesn't matter usually)
+    return f"{api_origin()}/{lang}/cardetail/used-{post_id}"
 
-    r1 = _req_get_json_or_text(sess, u1, referer=referer)
-    r2 = _req_get_json_or_text(sess, u2, referer=referer)
 
-    inspection_json = (r1.get("json") if isinstance(r1, dict) else None) or {}
+def build_post_payload(post_id: int, r1: Optional[Dict[str, Any]], r2: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Turn the two raw responses (inspection, details) into the doc we store.
+    r1=None (lazy inspection, details-only refresh): inspection fields and inspection_status are left
+    out, so the stored ones are kept by the $set.
+    """
     details_json = (r2.get("json") if isinstance(r2, dict) else None) or {}
+    fetched_at = datetime.now(timezone.utc).isoformat()
+
+    if r1 is None:
+        payload = {
+            "id": int(post_id),
+            "fetchedAt": fetched_at,
+            "details_status": int(r2.get("status") or 0),
+            **flatten_post({}, details_json, active_details_fields()),
+        }
+        # ✅ fingerprint of what this refresh can see (the writer skips the $set when it matches)
+        payload["detailsHash"] = content_hash(payload)
+        return payload
 
-    flat = flatten_post(inspection_json, details_json)
+    inspection_json = (r1.get("json") if isinstance(r1, dict) else None) or {}
 
-    from datetime import datetime, timezone
+    flat = flatten_post(inspection_json, details_json)
 
-    return {
+    payload = {
         "id": int(post_id),
-        "fetchedAt": datetime.now(timezone.utc).isoformat(),
+        "fetchedAt": fetched_at,
+        "inspectionFetchedAt": fetched_at,
 
         # ✅ tiny debug/status fields (VERY small)
         "inspection_status": int(r1.get("status") or 0),
@@ -596,3 +631,22 @@ def fetch_post_payloads_requests(sess: requests.Session, lang: str, post_id: int
         # ❌ NO api stored
         # "api": ...
     }
+
+    # ✅ fingerprints: whole doc + the part a details-only refresh would see
+    payload["contentHash"] = content_hash(payload)
+    payload["detailsHash"] = content_hash(payload, details_hash_names(active_fields()))
+    return payload
+
+
+def fetch_post_payloads_requests(sess: requests.Session, lang: str, post_id: int) -> Dict[str, Any]:
+    """
+    Blocking version: both GETs one after the other.
+    Inside the async crawl use fetcher.FetchEngine instead.
+    """
+    u1, u2 = build_api_urls(lang, post_id)
+    referer = api_referer(lang, post_id)
+
+    r1 = _req_get_json_or_text(sess, u1, referer=referer)
+    r2 = _req_get_json_or_text(sess, u2, referer=referer)
+
+    return build_post_payload(post_id, r1, r2)
@@ -0,0 +1,113 @@
+from __future__ import annotations
+
+import asyncio
+from typing import Any, List, Optional
+
+from .logging_utils import log
+
+TAB_MODES = ("off", "pool", "per_post")
+
+
+async def _try_open_new_tab(browser: Any, url: str) -> Optional[Any]:
+    """
+    Best-effort only. Some nodriver versions don't support new tabs consistently.
+    Scraping DOES NOT depend on tabs; API is fetched via requests session.
+    """
+    try:
+        if hasattr(browser, "new_tab"):
+            return await browser.new_tab(url)
+    except Exception:
+        pass
+
+    try:
+        return await browser.get(url, new_tab=True)  # type: ignore
+    except Exception:
+        return None
+
+
+async def visit_new_tab(browser: Any, pid: int, url: str) -> None:
+    """
+    Legacy per-post realism: open the product page in a fresh tab, then close it.
+    """
+    tab = await _try_open_new_tab(browser, url)
+    if not tab:
+        log(f"[tab] open failed (continuing) id={pid}")
+        return
+    log(f"[tab] opened id={pid}")
+    try:
+        await tab.close()
+        log(f"[tab] closed id={pid}")
+    except Exception as e:
+        log(f"[tab] close error id={pid}: {e}")
+
+
+class TabPool:
+    """
+    A few long-lived tabs that are re-navigated to product pages (for realism),
+    instead of opening + closing a tab per post.
+    """
+
+    def __init__(self, browser: Any, size: int = 2) -> None:
+        self.browser = browser
+        self.size = max(1, int(size))
+        self._idle: asyncio.Queue = asyncio.Queue()
+        self._all: List[Any] = []
+        self._slots = 0  # tabs opened or being opened
+
+    async def _acquire(self, url: str) -> tuple[Optional[Any], bool]:
+        """(tab, already_on_url). Opens a new tab while under `size`, else waits for an idle one."""
+        while True:
+            if self._idle.empty() and self._slots < self.size:
+                self._slots += 1
+                tab = await _try_open_new_tab(self.browser, url)
+                if tab is None:
+                    self._slots -= 1
+                else:
+                    self._all.append(tab)
+                    log(f"[tab] pool opened tab {len(self._all)}/{self.size}")
+                return tab, True
+            try:
+                # re-check now and then: a dropped tab frees a slot without filling _idle
+                return await asyncio.wait_for(self._idle.get(), timeout=1.0), False
+            except asyncio.TimeoutError:
+                continue
+
+    async def visit(self, pid: int, url: str) -> None:
+        tab, loaded = await self._acquire(url)
+        if tab is None:
+            log(f"[tab] open failed (continuing) id={pid}")
+            return
+
+        try:
+            if not loaded:
+                await tab.get(url)
+        except Exception as e:
+            # broken tab: drop it, the next visit opens a fresh one
+            log(f"[tab] navigate error id={pid}: {e}; dropping tab")
+            self._drop(tab)
+            return
+
+        self._idle.put_nowait(tab)
+
+    def _drop(self, tab: Any) -> None:
+        try:
+            self._all.remove(tab)
+            self._slots -= 1
+        except ValueError:
+            pass
+        asyncio.ensure_future(self._close_tab(tab))
+
+    @staticmethod
+    async def _close_tab(tab: Any) -> None:
+        try:
+            await tab.close()
+        except Exception:
+            pass
+
+    async def close(self) -> None:
+        tabs, self._all = self._all, []
+        self._slots = 0
+        while not self._idle.empty():
+            self._idle.get_nowait()
+        for tab in tabs:
+            await self._close_tab(tab)
@@ -0,0 +1,280 @@
+from __future__ import annotations
+
+import json
+import os
+import signal
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Any, Dict, Iterator, List, Optional
+
+from .logging_utils import log
+
+# -----------------------------
+# Per-post trace spans -> Chrome trace file (Trace Event Format; open in ui.perfetto.dev or chrome://tracing).
+# One track per post id: card discovered, dedupe check, tab open, inspection/details GETs, JSON parse,
+# flatten_post, Mongo write, and the whole life of the post. Off unless TRACE_FILE is set.
+# -----------------------------
+
+# events buffered before a write
+_FLUSH_EVERY = 2000
+
+
+class Tracer:
+    def __init__(self, path: str, sample: float = 1.0) -> None:
+        self.path = path
+        # sampled by id, so every span of a traced post is in the file
+        self.sample_per_mille = max(0, min(1000, int(round(sample * 1000))))
+        self.pid = os.getpid()
+        self._t0 = time.perf_counter()
+        self._buf: List[str] = []
+        self._lock = threading.Lock()
+        self._born: Dict[int, float] = {}  # post id -> discovered (µs)
+        self._named: set = set()
+        self.events = 0
+
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._fh = open(path, "w", encoding="utf-8")
+        # a file cut off by a crash (no closing bracket) still loads in the viewers
+        self._fh.write("[\n")
+        self._first = True
+        self._emit({"name": "process_name", "ph": "M", "pid": self.pid, "args": {"name": "syarah crawler"}})
+
+    def wants(self, post_id: int) -> bool:
+        return (int(post_id) * 2654435761) % 1000 < self.sample_per_mille
+
+    def now_us(self) -> float:
+        return (time.perf_counter() - self._t0) * 1e6
+
+    def _emit(self, ev: Dict[str, Any]) -> None:
+        line = json.dumps(ev, separators=(",", ":"))
+        with self._lock:
+            self._buf.append(line)
+            self.events += 1
+            if len(self._buf) >= _FLUSH_EVERY:
+                self._flush_locked()
+
+    def _flush_locked(self) -> None:
+        if not self._buf:
+            return
+        sep = ",\n"
+        head = "" if self._first else sep
+        self._fh.write(head + sep.join(self._buf))
+        self._fh.flush()
+        self._first = False
+        self._buf = []
+
+    def _track(self, post_id: int) -> None:
+        if post_id not in self._named:
+            self._named.add(post_id)
+            self._emit({"name": "thread_name", "ph": "M", "pid": self.pid, "tid": post_id,
+                        "args": {"name": f"post {post_id}"}})
+
+    def complete(self, post_id: int, name: str, start_us: float, dur_us: float, **args: Any) -> None:
+        self._track(post_id)
+        ev: Dict[str, Any] = {"name": name, "cat": "post", "ph": "X", "pid": self.pid, "tid": post_id,
+                              "ts": round(start_us, 1), "dur": round(max(0.0, dur_us), 1)}
+        if args:
+            ev["args"] = args
+        self._emit(ev)
+
+    def instant(self, post_id: int, name: str, **args: Any) -> None:
+        self._track(post_id)
+        ev: Dict[str, Any] = {"name": name, "cat": "post", "ph": "i", "s": "t", "pid": self.pid,
+                              "tid": post_id, "ts": round(self.now_us(), 1)}
+        if args:
+            ev["args"] = args
+        self._emit(ev)
+
+    def born(self, post_id: int) -> None:
+        self._born.setdefault(post_id, self.now_us())
+
+    def done(self, post_id: int, outcome: str) -> None:
+        t0 = self._born.pop(post_id, None)
+        if t0 is not None:
+            self.complete(post_id, "post", t0, self.now_us() - t0, outcome=outcome)
+
+    def close(self) -> None:
+        with self._lock:
+            self._flush_locked()
+            self._fh.write("\n]\n")
+            self._fh.close()
+
+
+_tracer: Optional[Tracer] = None
+
+
+def start_tracing(path: str, sample: float = 1.0) -> Optional[Tracer]:
+    """Open the trace file (once per process). Empty path = off."""
+    global _tracer
+    if not path or _tracer is not None:
+        return _tracer
+    if "{pid}" in path or "{ts}" in path:
+        path = path.format(pid=os.getpid(), ts=datetime.now().strftime("%Y%m%d-%H%M%S"))
+    try:
+        _tracer = Tracer(path, sample)
+    except Exception as e:
+        log(f"[trace] could not open {path}: {e}")
+        return None
+    log(f"[trace] writing spans to {path} (sample={sample:g})")
+    return _tracer
+
+
+def stop_tracing() -> None:
+    global _tracer
+    if _tracer is not None:
+        t, _tracer = _tracer, None
+        t.close()
+        log(f"[trace] closed {t.path} events={t.events}")
+
+
+def tracing() -> bool:
+    return _tracer is not None
+
+
+@contextmanager
+def span(post_id: Optional[int], name: str, **args: Any) -> Iterator[None]:
+    """Time a block as one span on the post's track (no-op when off / not sampled)."""
+    t = _tracer
+    if t is None or post_id is None or not t.wants(post_id):
+        yield
+        return
+    t0 = t.now_us()
+    try:
+        yield
+    finally:
+        t.complete(post_id, name, t0, t.now_us() - t0, **args)
+
+
+def record(post_id: int, name: str, start_us: float, dur_us: float, **args: Any) -> None:
+    """A span measured elsewhere (batch stages: one dedupe lookup / bulk write for many posts)."""
+    t = _tracer
+    if t is not None and t.wants(post_id):
+        t.complete(post_id, name, start_us, dur_us, **args)
+
+
+def now_us() -> float:
+    return _tracer.now_us() if _tracer is not None else 0.0
+
+
+def discovered(post_id: int) -> None:
+    t = _tracer
+    if t is not None and t.wants(post_id):
+        t.born(post_id)
+        t.instant(post_id, "card discovered")
+
+
+def finished(post_id: int, outcome: str) -> None:
+    """End of the post's life in this process (written / skipped / failed)."""
+    t = _tracer
+    if t is not None and t.wants(post_id):
+        t.done(post_id, outcome)
+
+
+# -----------------------------
+# On-demand sampling profiler
+# Touch PROFILE_TRIGGER_FILE (its content = minutes, optional) or send SIGUSR1 to profile the running process
+# for PROFILE_MINUTES without a restart. Stacks of every thread are sampled every PROFILE_INTERVAL_MS and written
+# as folded stacks (flamegraph.pl / speedscope) to PROFILE_DIR.
+# -----------------------------
+class SamplingProfiler:
+    def __init__(self, out_dir: str, interval_ms: float = 10.0) -> None:
+        self.out_dir = out_dir
+        self.interval = max(0.001, interval_ms / 1000.0)
+        self._lock = threading.Lock()
+        self._until = 0.0
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self, minutes: float) -> bool:
+        with self._lock:
+            if self.running:
+                log("[profile] already running")
+                return False
+            self._until = time.monotonic() + minutes * 60
+            self._thread = threading.Thread(target=self._run, args=(minutes,), name="profiler", daemon=True)
+            self._thread.start()
+        log(f"[profile] sampling every {self.interval * 1000:g}ms for {minutes:g} min")
+        return True
+
+    def _run(self, minutes: float) -> None:
+        me = threading.get_ident()
+        stacks: Counter = Counter()
+        samples = 0
+        while time.monotonic() < self._until:
+            names = {t.ident: t.name for t in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident == me:
+                    continue
+                parts = []
+                f: Any = frame
+                while f is not None:
+                    code = f.f_code
+                    parts.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                    f = f.f_back
+                thread = names.get(ident, str(ident))
+                # pool threads of one kind share a root frame
+                thread = thread.rsplit("_", 1)[0] if thread.rsplit("_", 1)[-1].isdigit() else thread
+                stacks[";".join([thread, *reversed(parts)])] += 1
+            samples += 1
+            time.sleep(self.interval)
+        self._write(stacks, samples, minutes)
+
+    def _write(self, stacks: Counter, samples: int, minutes: float) -> None:
+        os.makedirs(self.out_dir, exist_ok=True)
+        path = os.path.join(self.out_dir, f"profile-{datetime.now().strftime('%Y%m%d-%H%M%S')}-{os.getpid()}.folded")
+        try:
+            with open(path, "w", encoding="utf-8") as fh:
+                for stack, n in stacks.most_common():
+                    fh.write(f"{stack} {n}\n")
+        except Exception as e:
+            log(f"[profile] could not write {path}: {e}")
+            return
+        log(f"[profile] done: {samples} samples over {minutes:g} min -> {path}")
+
+
+_profiler: Optional[SamplingProfiler] = None
+
+
+def start_profile_watcher(trigger_file: str, out_dir: str, minutes: float, interval_ms: float = 10.0) -> None:
+    """Watch for the trigger file / SIGUSR1 (once per process). Empty trigger_file = signal only."""
+    global _profiler
+    if _profiler is not None:
+        return
+    prof = _profiler = SamplingProfiler(out_dir, interval_ms)
+
+    if hasattr(signal, "SIGUSR1") and threading.current_thread() is threading.main_thread():
+        try:
+            # start from a thread: the handler runs on the main thread between bytecodes
+            signal.signal(signal.SIGUSR1, lambda *_: threading.Thread(target=prof.start, args=(minutes,)).start())
+        except Exception as e:
+            log(f"[profile] SIGUSR1 handler not installed: {e}")
+
+    if not trigger_file:
+        return
+
+    def watch() -> None:
+        while True:
+            time.sleep(2.0)
+            if not os.path.exists(trigger_file):
+                continue
+            n = minutes
+            try:
+                with open(trigger_file, encoding="utf-8") as fh:
+                    raw = fh.read().strip()
+                n = float(raw) if raw else minutes
+            except Exception:
+                pass
+            try:
+                os.remove(trigger_file)
+            except Exception:
+                pass
+            prof.start(n)
+
+    threading.Thread(target=watch, name="profile-trigger", daemon=True).start()
@@ -0,0 +1,154 @@
+from __future__ import annotations
+
+import argparse
+import asyncio
+import signal
+from typing import List, Optional, Set
+
+from pymongo.collection import Collection
+
+from .config import get_settings
+from .fetcher import make_engine
+from .jobs import ack_jobs, claim_job, fail_job, get_jobs_collection, queue_counts, reclaim_expired, worker_id
+from .logging_utils import DEBUG, log, set_summary
+from .metrics import start_metrics_server
+from .mongo import PostWriter, get_collection, load_existing, needs_inspection
+from .pipeline import details_status
+from .ratelimit import is_retryable_status
+from .syarah import build_api_session
+from .tracing import start_profile_watcher, start_tracing, stop_tracing
+
+
+def _retry_delay(attempts: int) -> float:
+    # 30s, 60s, 120s ... capped at 1h
+    return float(min(3600, 30 * (2 ** max(0, attempts - 1))))
+
+
+async def run_worker(
+    settings, once: bool = False, stop: Optional[asyncio.Event] = None, col: Optional[Collection] = None
+) -> None:
+    """
+    Fetch worker: claim jobs from <collection>_jobs (lease + expiry), fetch + flatten the post,
+    write it through the buffered writer and ack the job once it's in Mongo.
+    Any number of these can run on any number of machines against the same collection.
+
+    once=True exits when the queue is empty (batch jobs / local testing, the crawler's retry pass).
+    col reuses an existing posts collection (and its client) instead of connecting again; a client
+    opened here is closed on exit.
+    """
+    stop = stop or asyncio.Event()
+    own_client = col is None
+    if col is None:
+        col = get_collection(settings.mongo_url, settings.mongo_db, settings.mongo_collection)
+    jobs = get_jobs_collection(col)
+    wid = worker_id()
+
+    sess = build_api_session(settings)
+    engine = make_engine(sess, settings)
+
+    # ✅ ack only after the doc is really written (a crash before that -> lease expires -> retried)
+    acks: Set[asyncio.Future] = set()
+
+    def on_written(ids: List[int]) -> None:
+        fut = asyncio.ensure_future(asyncio.to_thread(ack_jobs, jobs, ids, wid))
+        acks.add(fut)
+        fut.add_done_callback(acks.discard)
+
+    writer = PostWriter(
+        col,
+        settings.write_batch_size,
+        settings.write_flush_sec,
+        on_written=on_written,
+        price_history_max=settings.price_history_max,
+    )
+    writer.start()
+
+    n = await asyncio.to_thread(reclaim_expired, jobs)
+    log(f"[worker] {wid} started | concurrency={engine.concurrency} reclaimed_expired={n}")
+
+    stats = {"claimed": 0, "stored": 0, "failed": 0}
+    set_summary(lambda: {**stats, "inserted": writer.totals["inserted"], "updated": writer.totals["updated"],
+                         "http_retries": engine.retries})
+
+    async def slot(i: int) -> None:
+        while not stop.is_set():
+            job = await asyncio.to_thread(claim_job, jobs, wid, settings.job_lease_sec)
+            if job is None:
+                if once:
+                    return
+                try:
+                    await asyncio.wait_for(stop.wait(), timeout=settings.worker_poll_sec)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            stats["claimed"] += 1
+            pid = int(job["_id"])
+            attempts = int(job.get("attempts") or 1)
+
+            try:
+                existing = (await asyncio.to_thread(load_existing, col, [pid])).get(pid)
+                payload = await engine.fetch(pid, needs_inspection(existing, settings.inspection_refresh_hours))
+                st = details_status(payload)
+                err = f"details_status={st}" if st == 401 or is_retryable_status(st) else None
+            except Exception as e:
+                payload, err = None, str(e)
+
+            if err is not None or payload is None:
+                stats["failed"] += 1
+                state = await asyncio.to_thread(
+                    fail_job, jobs, pid, wid, err or "no payload", _retry_delay(attempts),
+                    settings.job_max_attempts, attempts,
+                )
+                log(f"[worker] slot={i} id={pid} {err} -> {state} (attempt {attempts})", DEBUG)
+                continue
+
+            stats["stored"] += 1
+            await writer.put(payload)
+
+    try:
+        await asyncio.gather(*(slot(i) for i in range(engine.concurrency)))
+    finally:
+        set_summary(None)
+        await writer.close()
+        if acks:
+            await asyncio.gather(*list(acks), return_exceptions=True)
+        engine.close()
+        sess.close()
+        counts = await asyncio.to_thread(queue_counts, jobs)
+        log(
+            f"[worker] {wid} stopped | claimed={stats['claimed']} stored={stats['stored']} "
+            f"failed={stats['failed']} inserted={writer.totals['inserted']} updated={writer.totals['updated']} "
+            f"queue={counts}"
+        )
+        if own_client:
+            col.database.client.close()
+
+
+async def main() -> None:
+    ap = argparse.ArgumentParser(description="Syarah fetch worker (Mongo job queue)")
+    ap.add_argument("--once", action="store_true", help="exit when the queue is empty")
+    args = ap.parse_args()
+
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(sig, stop.set)
+        except (NotImplementedError, RuntimeError):
+            pass  # Windows
+
+    settings = get_settings()
+    start_metrics_server(settings.metrics_port, settings.metrics_host)
+    start_tracing(settings.trace_file, settings.trace_sample)
+    start_profile_watcher(
+        settings.profile_trigger_file, settings.profile_dir, settings.profile_minutes, settings.profile_interval_ms
+    )
+    try:
+        await run_worker(settings, once=args.once, stop=stop)
+    finally:
+        stop_tracing()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
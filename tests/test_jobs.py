@@ -0,0 +1,270 @@
+"""
+Fetch job queue (src.jobs) and the worker's ack/fail handling (src.worker.run_worker).
+
+Runs against a real mongod when MONGO_TEST_URL is set (e.g. mongodb://localhost:27017),
+otherwise against mongomock:
+
+    MONGO_TEST_URL=mongodb://localhost:27017 python -m pytest -q tests
+"""
+from __future__ import annotations
+
+import asyncio
+import dataclasses
+import os
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List
+
+import pytest
+
+import src.worker as worker
+from src.config import get_settings
+from src.jobs import (
+    DONE,
+    FAILED,
+    LEASED,
+    PENDING,
+    ack_jobs,
+    claim_job,
+    enqueue_jobs,
+    fail_job,
+    get_jobs_collection,
+    queue_counts,
+    reclaim_expired,
+)
+from src.mongo import get_collection
+
+
+@pytest.fixture
+def col():
+    url = os.environ.get("MONGO_TEST_URL")
+    name = f"jobs_test_{uuid.uuid4().hex[:8]}"
+    if url:
+        col = get_collection(url, "syarah_test", name)
+        client = col.database.client
+    else:
+        mongomock = pytest.importorskip("mongomock")
+        client = mongomock.MongoClient()
+        col = client["syarah_test"][name]
+        col.create_index("id", unique=True, name="uniq_id")
+    yield col
+    col.database.drop_collection(f"{name}_jobs")
+    col.database.drop_collection(name)
+    client.close()
+
+
+@pytest.fixture
+def jobs(col):
+    return get_jobs_collection(col)
+
+
+def _utc(dt: datetime) -> datetime:
+    # pymongo hands back naive UTC datetimes
+    return dt if dt.tzinfo else dt.replace(tzinfo=timezone.utc)
+
+
+def _settings(**kw: Any):
+    base = dict(
+        fetch_concurrency=4, write_batch_size=10, write_flush_sec=0.1, job_lease_sec=60.0,
+        job_max_attempts=3, worker_poll_sec=0.1, http_cache_dir="", archive_dir="",
+    )
+    base.update(kw)
+    return dataclasses.replace(get_settings(), **base)
+
+
+class _Engine:
+    """Stand-in fetch engine: answers every post with the given details status."""
+
+    def __init__(self, status: int = 200) -> None:
+        self.status = status
+        self.concurrency = 4
+        self.retries = 0
+
+    async def fetch(self, pid: int, need_inspection: bool = True) -> Dict[str, Any]:
+        return {
+            "id": pid,
+            "details_status": self.status,
+            "fetchedAt": datetime.now(timezone.utc).isoformat(),
+        }
+
+    def close(self) -> None:
+        pass
+
+
+def _run_worker(monkeypatch, col, engine: _Engine, **kw: Any) -> None:
+    monkeypatch.setattr(worker, "make_engine", lambda sess, settings: engine)
+    asyncio.run(worker.run_worker(_settings(**kw), once=True, col=col))
+
+
+# -----------------------------
+# queue
+# -----------------------------
+def test_two_claimers_never_get_the_same_job(jobs):
+    ids = list(range(1, 51))
+    enqueue_jobs(jobs, ids)
+
+    claimed: Dict[str, List[int]] = {"w1": [], "w2": []}
+    while True:
+        got = [(w, claim_job(jobs, w, 60)) for w in claimed]
+        for w, job in got:
+            if job is not None:
+                claimed[w].append(int(job["_id"]))
+        if all(job is None for _, job in got):
+            break
+
+    assert sorted(claimed["w1"] + claimed["w2"]) == ids
+    assert len(claimed["w1"]) == len(claimed["w2"]) == 25
+
+
+def test_claim_is_atomic_between_two_claimers(jobs):
+    if not os.environ.get("MONGO_TEST_URL"):
+        pytest.skip("concurrent claims need a real mongod (mongomock is not thread safe)")
+    ids = list(range(1, 201))
+    assert enqueue_jobs(jobs, ids) == len(ids)
+
+    claimed: Dict[str, List[int]] = {"w1": [], "w2": []}
+    start = threading.Barrier(2)
+
+    def claimer(wid: str) -> None:
+        start.wait()
+        while True:
+            job = claim_job(jobs, wid, 60)
+            if job is None:
+                return
+            claimed[wid].append(int(job["_id"]))
+
+    threads = [threading.Thread(target=claimer, args=(w,)) for w in claimed]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    both = claimed["w1"] + claimed["w2"]
+    assert sorted(both) == ids  # every job handed out exactly once
+    assert not set(claimed["w1"]) & set(claimed["w2"])
+    for doc in jobs.find({}):
+        assert doc["state"] == LEASED
+        assert doc["attempts"] == 1
+        assert int(doc["_id"]) in claimed[doc["worker"]]
+
+
+def test_expired_lease_is_reclaimed(jobs):
+    enqueue_jobs(jobs, [7])
+    first = claim_job(jobs, "w1", 0.05)
+    assert first is not None and first["attempts"] == 1
+    assert claim_job(jobs, "w2", 60) is None  # still leased
+
+    time.sleep(0.1)
+    second = claim_job(jobs, "w2", 60)
+    assert second is not None and int(second["_id"]) == 7
+    assert second["worker"] == "w2" and second["attempts"] == 2
+
+    # the worker that lost the lease cannot ack (or fail) the job any more
+    assert ack_jobs(jobs, [7], "w1") == 0
+    fail_job(jobs, 7, "w1", "late", 0, 3, 1)
+    assert jobs.find_one({"_id": 7})["state"] == LEASED
+    assert ack_jobs(jobs, [7], "w2") == 1
+    assert jobs.find_one({"_id": 7})["state"] == DONE
+
+
+def test_reclaim_expired_puts_jobs_back_to_pending(jobs):
+    enqueue_jobs(jobs, [1, 2])
+    claim_job(jobs, "w1", 0.05)
+    claim_job(jobs, "w1", 60)
+    time.sleep(0.1)
+
+    assert reclaim_expired(jobs) == 1
+    assert queue_counts(jobs) == {PENDING: 1, LEASED: 1, DONE: 0, FAILED: 0}
+    assert "worker" not in jobs.find_one({"state": PENDING})
+
+
+def test_fail_job_backs_off_then_gives_up(jobs):
+    enqueue_jobs(jobs, [5])
+    states = []
+    for attempt in range(1, 4):
+        job = claim_job(jobs, "w1", 60)
+        assert job is not None and job["attempts"] == attempt
+        before = datetime.now(timezone.utc)
+        states.append(fail_job(jobs, 5, "w1", "boom", 30, 3, job["attempts"]))
+        doc = jobs.find_one({"_id": 5})
+        assert doc["state"] == states[-1] and doc["error"] == "boom"
+        assert _utc(doc["availableAt"]) >= before + timedelta(seconds=29)
+        if states[-1] == PENDING:
+            assert claim_job(jobs, "w1", 60) is None  # not due yet
+            jobs.update_one({"_id": 5}, {"$set": {"availableAt": before}})
+
+    assert states == [PENDING, PENDING, FAILED]
+    assert claim_job(jobs, "w1", 60) is None
+
+
+def test_enqueue_leaves_leased_jobs_alone(jobs):
+    enqueue_jobs(jobs, [1, 2, 3])
+    leased = claim_job(jobs, "w1", 60)
+    pid = int(leased["_id"])
+
+    enqueue_jobs(jobs, [1, 2, 3, 4])
+    assert queue_counts(jobs) == {PENDING: 3, LEASED: 1, DONE: 0, FAILED: 0}
+    doc = jobs.find_one({"_id": pid})
+    assert doc["state"] == LEASED and doc["worker"] == "w1" and doc["attempts"] == 1
+    assert ack_jobs(jobs, [pid], "w1") == 1
+
+    # done jobs are queued again
+    assert enqueue_jobs(jobs, [pid]) == 1
+    assert jobs.find_one({"_id": pid})["state"] == PENDING
+
+
+# -----------------------------
+# worker
+# -----------------------------
+def test_worker_acks_only_after_the_write(monkeypatch, col, jobs):
+    ids = list(range(100, 130))
+    enqueue_jobs(jobs, ids)
+    acked_before_write: List[int] = []
+    real_ack = worker.ack_jobs
+
+    def ack(jobs_col, job_ids: List[int], wid: str) -> int:
+        stored = {d["id"] for d in col.find({"id": {"$in": job_ids}}, {"id": 1})}
+        acked_before_write.extend(x for x in job_ids if x not in stored)
+        return real_ack(jobs_col, job_ids, wid)
+
+    monkeypatch.setattr(worker, "ack_jobs", ack)
+    _run_worker(monkeypatch, col, _Engine(200))
+
+    assert acked_before_write == []
+    assert queue_counts(jobs)[DONE] == len(ids)
+    assert col.count_documents({}) == len(ids)
+
+
+def test_worker_does_not_ack_a_failed_write(monkeypatch, col, jobs):
+    enqueue_jobs(jobs, [1, 2, 3])
+    real_write = worker.PostWriter.write_batch
+
+    def write_batch(self, batch: List[dict]):
+        counts, failed = real_write(self, [p for p in batch if p["id"] != 2])
+        return counts, failed | {2}
+
+    monkeypatch.setattr(worker.PostWriter, "write_batch", write_batch)
+    _run_worker(monkeypatch, col, _Engine(200))
+
+    assert jobs.find_one({"_id": 2})["state"] == LEASED  # retried once its lease expires
+    assert {d["_id"] for d in jobs.find({"state": DONE})} == {1, 3}
+
+
+def test_worker_fails_jobs_with_backoff_until_max_attempts(monkeypatch, col, jobs):
+    enqueue_jobs(jobs, [9])
+    before = datetime.now(timezone.utc)
+    _run_worker(monkeypatch, col, _Engine(503), job_max_attempts=2)
+
+    doc = jobs.find_one({"_id": 9})
+    assert doc["state"] == PENDING and doc["attempts"] == 1
+    assert doc["error"] == "details_status=503"
+    assert _utc(doc["availableAt"]) >= before + timedelta(seconds=30)  # _retry_delay(1)
+
+    jobs.update_one({"_id": 9}, {"$set": {"availableAt": before}})
+    _run_worker(monkeypatch, col, _Engine(503), job_max_attempts=2)
+
+    doc = jobs.find_one({"_id": 9})
+    assert doc["state"] == FAILED and doc["attempts"] == 2
+    assert col.count_documents({}) == 0